@@ -0,0 +1,7 @@
+"""
+The rotation of the library activity data into the published outputs. The modules are the
+schema of the data, reading it, converting it, the writers of each output, the build state,
+the pipeline that runs them, publishing, watch mode and the command line that
+rotate_activity_data.py runs. Importing the package has no side effects, so other scripts
+can use its helpers.
+"""
@@ -0,0 +1,164 @@
+"""
+The state of the last build, used to rebuild only the outputs whose inputs have changed.
+"""
+
+import hashlib
+import json
+import os
+
+from .reading import file_hash
+from .schema import (
+    ACTIVITY_HEADERS, AUTHORITIES, AUTHORITY_SUMMARY, BUILD_STATE, COMBINED_OUTPUT_KINDS, COMPARISONS,
+    COMPARISONS_JSON, DATABASE, INPUTS, JSON_OUTPUTS, LIBRARY_DATA, LIBRARY_SERVICES, MEASURE_OUTPUTS,
+    NEIGHBOUR_INDEX_JSON, OUTPUT_KINDS, POPULATION, POPULATION_BANDS, ROLLUPS_JSON, SERVICES, SERVICES_JSON)
+
+
+def package_hash():
+    """
+    Return the SHA-256 hex digest of the source of every module of the rotation package, so
+    that changing any of them rebuilds the outputs.
+    """
+    directory = os.path.dirname(os.path.abspath(__file__))
+    digest = hashlib.sha256()
+    for name in sorted(os.listdir(directory)):
+        if name.endswith('.py'):
+            digest.update(f'{name}:{file_hash(os.path.join(directory, name))}\n'.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def input_fingerprints(json_format, year, activity_path=LIBRARY_DATA):
+    """
+    Fingerprint everything the outputs are built from: each input file, the rotation's code,
+    the financial year and the JSON format option. The activity data is fingerprinted
+    from whichever file it is read from.
+    """
+    fingerprints = {path: file_hash(activity_path if path == LIBRARY_DATA else path) for path in INPUTS}
+    fingerprints['script'] = package_hash()
+    fingerprints['year'] = year.start
+    fingerprints['json_format'] = json_format
+    return fingerprints
+
+
+def select_outputs(measures=None, kinds=OUTPUT_KINDS):
+    """
+    Return the outputs of the selected measures, which may include 'services', in the selected
+    kinds of output. The outputs combining every measure (the rollups, shards, comparisons and
+    the database) and the population bands are only selected when no measures are given, and
+    the database only when both kinds are.
+    """
+    outputs = set()
+    for measure in measures or [*MEASURE_OUTPUTS, 'services']:
+        csv_path, json_path = (SERVICES, SERVICES_JSON) if measure == 'services' else MEASURE_OUTPUTS[measure]
+        if 'csv' in kinds:
+            outputs.add(csv_path)
+        if 'json' in kinds and json_path is not None:
+            outputs.add(json_path)
+    if not measures:
+        outputs.update(path for path, kind in COMBINED_OUTPUT_KINDS.items() if kind in kinds)
+        if set(kinds) == set(OUTPUT_KINDS):
+            outputs.add(DATABASE)
+    return outputs
+
+
+def required_measures(outputs):
+    """
+    Return the measures whose columns must be rotated to build a set of outputs, or None for
+    every measure. The services and the outputs combining measures need every measure, and
+    the population bands need none.
+    """
+    if outputs is None:
+        return None
+    outputs = set(outputs) - {POPULATION_BANDS}
+    measure_paths = {measure: {path for path in paths if path is not None}
+                     for measure, paths in MEASURE_OUTPUTS.items()}
+    if not outputs <= set().union(*measure_paths.values()):
+        return None
+    return {measure for measure, paths in measure_paths.items() if paths & outputs}
+
+
+def output_dependencies():
+    """Map each output to the measure it contains and the fingerprints it depends on."""
+    # Measures only use the reference data to recognise authorities, and the headers to read
+    # the columns of the published workbook
+    measure_inputs = [LIBRARY_DATA, ACTIVITY_HEADERS, AUTHORITIES, LIBRARY_SERVICES, 'script', 'year']
+
+    dependencies = {}
+    for measure, (csv_path, json_path) in MEASURE_OUTPUTS.items():
+        dependencies[csv_path] = {'measure': measure, 'inputs': measure_inputs}
+        if json_path is not None:
+            dependencies[json_path] = {'measure': measure, 'inputs': measure_inputs + ['json_format']}
+    dependencies[ROLLUPS_JSON] = {'measure': 'rollups', 'inputs': measure_inputs}
+    dependencies[AUTHORITY_SUMMARY] = {'measure': 'shards', 'inputs': measure_inputs}
+    dependencies[DATABASE] = {'measure': 'database', 'inputs': INPUTS + ['script', 'year']}
+    dependencies[COMPARISONS] = {'measure': 'comparisons', 'inputs': INPUTS + ['script', 'year']}
+    dependencies[COMPARISONS_JSON] = {'measure': 'comparisons', 'inputs': INPUTS + ['script', 'year', 'json_format']}
+    dependencies[NEIGHBOUR_INDEX_JSON] = {'measure': 'comparisons', 'inputs': INPUTS + ['script', 'year']}
+    dependencies[POPULATION_BANDS] = {'measure': 'population', 'inputs': [POPULATION, LIBRARY_SERVICES, 'script']}
+    dependencies[SERVICES] = {'measure': 'services', 'inputs': INPUTS + ['script', 'year']}
+    dependencies[SERVICES_JSON] = {'measure': 'services', 'inputs': INPUTS + ['script', 'year', 'json_format']}
+    return dependencies
+
+
+def load_build_state():
+    """Load the state of the last build, or an empty state if there has not been one."""
+    if not os.path.exists(BUILD_STATE):
+        return {'inputs': {}, 'outputs': {}}
+    with open(BUILD_STATE, mode='r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def built_year(state, path):
+    """
+    Return the start of the financial year an output was last built for, or None if it is
+    unknown, such as when the output has been modified since.
+    """
+    built = state['outputs'].get(path)
+    if not built or built.get('sha256') is None or file_hash(path) != built['sha256']:
+        return None
+    # Older build states only recorded the year in the fingerprints
+    return built.get('year', built.get('fingerprints', state['inputs']).get('year'))
+
+
+def national_year(state):
+    """Return the start of the latest financial year the national JSON datasets were built for."""
+    return max((year for year in (built_year(state, path) for path in JSON_OUTPUTS) if year is not None),
+               default=None)
+
+
+def outdated_outputs(state, fingerprints):
+    """
+    Return the outputs that need to be built: those depending on a fingerprint that has
+    changed since they were built, and those that are missing or have been modified since.
+    """
+    outputs = set()
+    for path, dependency in output_dependencies().items():
+        built = state['outputs'].get(path, {})
+        # Older build states only recorded the fingerprints of the whole build
+        built_fingerprints = built.get('fingerprints', state['inputs'])
+        changed = any(built_fingerprints.get(key) != fingerprints.get(key) for key in dependency['inputs'])
+        if changed or built.get('sha256') is None or file_hash(path) != built['sha256']:
+            outputs.add(path)
+    return outputs
+
+
+def save_build_state(fingerprints, built_outputs=None):
+    """
+    Record the fingerprints each output was built from, the financial year of those that
+    depend on it, and the outputs' own hashes. If a set of built outputs is given, the other
+    outputs keep their recorded state.
+    """
+    previous = load_build_state()
+    outputs = {}
+    for path, dependency in output_dependencies().items():
+        if built_outputs is not None and path not in built_outputs:
+            if path in previous['outputs']:
+                outputs[path] = {'fingerprints': previous['inputs'], **previous['outputs'][path]}
+            continue
+        outputs[path] = {
+            **dependency,
+            'fingerprints': {key: fingerprints.get(key) for key in dependency['inputs']},
+            'year': fingerprints.get('year') if 'year' in dependency['inputs'] else None,
+            'sha256': file_hash(path)
+        }
+    with open(BUILD_STATE, mode='w', encoding='utf-8') as f:
+        json.dump({'inputs': fingerprints, 'outputs': outputs}, f, indent=2)
@@ -0,0 +1,192 @@
+"""
+This script reads a CSV file (or the published XLSX workbook) containing library activity data
+for a financial year (2023-2024 by default), rotates the data into multiple output files, and
+handles various aspects such as authorities, users, events, attendance, loans, visits, computer
+usage, and metadata. Several years can be rotated together in batch mode, and the rotation
+can be limited to some of the measures or kinds of output. In watch mode the outputs are
+rebuilt whenever the inputs change.
+"""
+
+import argparse
+import os
+
+from .build_state import (
+    input_fingerprints, load_build_state, national_year, outdated_outputs, save_build_state, select_outputs)
+from .conversion import require_numpy
+from .pipeline import rotate_activity_data, rotate_activity_data_streaming, rotate_activity_years
+from .publish import (
+    backfill_partitions, built_partitions, publish_datasets, publish_partitions, write_datasets_manifest)
+from .report import RunReport, write_profile, write_run_report
+from .schema import ARROW_DIRECTORY, LIBRARY_DATA, MEASURE_OUTPUTS, OUTPUT_KINDS, RUN_REPORTS, resolve_financial_year
+from .watch import ActivityWatcher
+from .writers import measure_csv_paths, require_pyarrow, write_arrow_datasets
+
+
+def parse_measures(value):
+    """Parse a comma separated list of measures, such as loans,visits"""
+    measures = [measure.strip() for measure in value.split(',') if measure.strip()]
+    unknown = [measure for measure in measures if measure not in MEASURE_OUTPUTS and measure != 'services']
+    if unknown or not measures:
+        raise argparse.ArgumentTypeError(f"unknown measures in '{value}'")
+    return measures
+
+
+def main():
+    """Run the rotation from the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.strip('"\n'))
+    parser.add_argument('--stream', action='store_true',
+                        help='write records as each authority is rotated, using bounded memory')
+    parser.add_argument('--json-format', choices=['rows', 'columnar'], default='rows',
+                        help='publish the JSON data as arrays of rows, or as dictionary encoded columns')
+    parser.add_argument('--publish', action='store_true',
+                        help='write content hashed, precompressed copies of the JSON data and a manifest, '
+                             "and add the year's partition of each dataset written to the partitions index. "
+                             'For a year earlier than the JSON data, only its partitions are published')
+    parser.add_argument('--force', action='store_true',
+                        help='rebuild every output, even if its inputs have not changed')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='build the reference lookups from the files rather than the cached snapshot')
+    parser.add_argument('--workers', type=int,
+                        help='the number of processes to rotate the authority rows (or batch years) across')
+    parser.add_argument('--engine', choices=['python', 'numpy'], default='python',
+                        help='rotate the rows one at a time in Python, or all together with NumPy')
+    parser.add_argument('--input', default=LIBRARY_DATA, metavar='FILE',
+                        help='the activity data, as a CSV file or the published XLSX workbook')
+    parser.add_argument('--year', type=int,
+                        help='the start year of the activity data, if not in its file name e.g. 2023')
+    parser.add_argument('--batch', nargs='+', metavar='FILE',
+                        help='rotate several annual activity data files (CSV or XLSX) into long format CSV files')
+    parser.add_argument('--years', type=int, nargs='+',
+                        help='the start year of each batch file, if not in the file names')
+    parser.add_argument('--output-dir', default='./data/years',
+                        help='the directory for the batch outputs')
+    parser.add_argument('--only', type=parse_measures, metavar='MEASURES',
+                        help='only rotate and write these measures, e.g. loans,visits '
+                             f"(any of {', '.join([*MEASURE_OUTPUTS, 'services'])})")
+    parser.add_argument('--kind', choices=['csv', 'json', 'both'], default='both',
+                        help='the kinds of output to write')
+    parser.add_argument('--report', default=RUN_REPORTS, metavar='FILE',
+                        help="the file to append the run's stage timings, counters and memory to")
+    parser.add_argument('--profile', metavar='DIR',
+                        help='profile the run with cProfile and tracemalloc, writing the reports to this '
+                             'directory (worker processes are not profiled)')
+    parser.add_argument('--watch', action='store_true',
+                        help='keep running, rebuilding the outputs whenever the inputs change '
+                             '(rows are rotated one at a time in this process)')
+    parser.add_argument('--arrow', action='store_true',
+                        help='also write each measure as Arrow IPC and Parquet files, to the output directory '
+                             f'in batch mode or {ARROW_DIRECTORY} otherwise (needs the pyarrow package)')
+    args = parser.parse_args()
+
+    if args.arrow:
+        try:
+            require_pyarrow()
+        except ImportError:
+            parser.error('the Arrow and Parquet exports need the pyarrow package to be installed')
+    if args.engine == 'numpy':
+        try:
+            require_numpy()
+        except ImportError:
+            parser.error('the numpy engine needs the numpy package to be installed')
+    if args.batch and args.kind == 'json':
+        parser.error('batch mode only writes CSV files')
+    if args.watch and (args.batch or args.profile):
+        parser.error('watch mode cannot be used with batch mode or profiling')
+
+    try:
+        if args.batch:
+            if args.years and len(args.years) != len(args.batch):
+                parser.error('--years must give a year for each batch file')
+            starts = args.years or [None] * len(args.batch)
+            years = [resolve_financial_year(path, start) for path, start in zip(args.batch, starts)]
+        else:
+            year = resolve_financial_year(args.input, args.year)
+    except ValueError as error:
+        parser.error(str(error))
+
+    selection = None
+    if args.only or args.kind != 'both':
+        selection = select_outputs(args.only, OUTPUT_KINDS if args.kind == 'both' else (args.kind,))
+
+    if args.watch:
+        watcher = ActivityWatcher(args.input, year, args.json_format, selection, not args.no_cache, args.publish,
+                                  args.report, args.arrow)
+        try:
+            watcher.watch()
+        except KeyboardInterrupt:
+            pass
+        return
+
+    report = RunReport()
+    report.details['options'] = {
+        'mode': 'batch' if args.batch else 'stream' if args.stream else 'rows',
+        'engine': args.engine,
+        'workers': args.workers,
+        'json_format': args.json_format,
+        'inputs': args.batch or [args.input],
+        'only': args.only,
+        'kind': args.kind
+    }
+    profile = None
+    if args.profile:
+        # The profilers are only imported when they are used, to keep the import of this module fast
+        import cProfile
+        import tracemalloc
+        tracemalloc.start()
+        profile = cProfile.Profile()
+        profile.enable()
+
+    if args.batch:
+        report.details['years'] = [year.label for year in years]
+        rotate_activity_years(args.batch, years, args.output_dir, not args.no_cache, args.workers, args.engine,
+                              report, args.only)
+        if args.arrow:
+            with report.stage('arrow'):
+                write_arrow_datasets(measure_csv_paths(args.only, args.output_dir), args.output_dir)
+    elif args.publish and (national_year(load_build_state()) or year.start) > year.start:
+        # Publishing an earlier year than the national datasets only adds its partitions
+        report.details['options']['mode'] = 'backfill'
+        report.details['years'] = [year.label]
+        print(f'Publishing the partitions of {year.label}, leaving the national datasets as they are.')
+        backfill_partitions(args.input, year, args.json_format, selection, not args.no_cache, args.workers,
+                            args.engine, report)
+    else:
+        report.details['years'] = [year.label]
+
+        # Only rebuild the selected outputs whose inputs have changed since the last build
+        fingerprints = input_fingerprints(args.json_format, year, args.input)
+        outputs = selection if args.force else outdated_outputs(load_build_state(), fingerprints)
+        if outputs is not None and selection is not None:
+            outputs &= selection
+        report.details['fingerprints'] = fingerprints
+        report.details['outputs'] = 'all' if outputs is None else sorted(outputs)
+
+        if outputs is not None and not outputs:
+            print('All outputs are up to date.')
+        else:
+            if args.stream:
+                rotate_activity_data_streaming(args.json_format, outputs, not args.no_cache, args.workers, year,
+                                               args.engine, args.input, report)
+            else:
+                rotate_activity_data(args.json_format, outputs, not args.no_cache, args.workers, year,
+                                     args.engine, args.input, report)
+            save_build_state(fingerprints, outputs)
+
+        if args.publish:
+            with report.stage('publish'):
+                publish_datasets()
+                # The datasets built for the year are its partitions, even if this run left them as they were
+                publish_partitions(year, built_partitions(year))
+        if args.publish or outputs is None or outputs:
+            write_datasets_manifest()
+
+        if args.arrow:
+            with report.stage('arrow'):
+                write_arrow_datasets([path for path in measure_csv_paths(args.only) if os.path.exists(path)])
+
+    if profile is not None:
+        profile.disable()
+        report.details['tracemalloc_peak_kb'] = tracemalloc.get_traced_memory()[1] // 1024
+        write_profile(profile, tracemalloc.take_snapshot(), args.profile)
+        tracemalloc.stop()
+    write_run_report(report, args.report)
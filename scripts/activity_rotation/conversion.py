@@ -0,0 +1,569 @@
+"""
+Rotating the rows of activity data into records of each measure, and converting their periods to
+months for publishing.
+"""
+
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from functools import lru_cache
+from itertools import islice
+
+from .report import report_stage
+from .schema import (
+    MEASURE_FIELDS, MEASURE_GROUPS, MEASURE_RECORDS, PERIOD_INDEXES, SERVICE_MEASURES, compile_header_schema)
+
+# NumPy is optional, and only imported for the numpy engine as it is slow to import
+np = None
+
+# The nearest neighbours of an authority that has none listed
+EMPTY_NEIGHBOURS = [None, None, None, None, None]
+
+# The number of authority rows sent to a worker process at a time
+WORKER_CHUNK_SIZE = 16
+
+# The number of authority rows the numpy engine rotates together, which bounds its memory
+NUMPY_CHUNK_SIZE = 1024
+
+# The most digits of a count the numpy engine parses as an array, as any more may not fit in 64 bits
+INTEGER_DIGITS = 18
+
+# An interval period starting on a date, e.g. 2023-04-01/P3M or 2023-04-01/P1Y
+INTERVAL_PATTERN = re.compile(r'^(\d{4})-(\d{2})-\d{2}/P(\d+)([MY])$')
+
+# Authorities and values known to be invalid for a measure
+EXCLUDED_AUTHORITIES = {
+    'users': ('E06000031', 'E06000036'),
+    'computer_usage': ('E08000021', 'E10000031')
+}
+EXCLUDED_VALUES = {
+    'computer_usage': ('2236995718',)
+}
+
+
+def calculate_record_frequency(records, year):
+    """
+    Calculate the frequency of records in a financial year based on their periods.
+    Returns 'Quarterly' if there are 4 unique periods AND they are June, September, December,
+    And March.
+    Returns 'Yearly' if there is 1 unique period AND it is April (or March).
+    Else returns 'Monthly'.
+    """
+    unique_periods = {record.period for record in records}
+
+    if len(unique_periods) == 4 and all(month in unique_periods for month in year.quarter_ends):
+        return 'Quarterly'
+    elif len(unique_periods) == 1 and (year.month_starts['march'] in unique_periods or
+                                       year.month_starts['april'] in unique_periods):
+        return 'Yearly'
+    else:
+        return 'Monthly'
+
+
+def convert_date_to_quarterly(date_str, year):
+    """
+        Convert a date string in YYYY-MM-DD format to a quarterly period string
+        within the financial year, such as 2023-01-01/P3M
+    """
+    date_obj = datetime.strptime(date_str, "%Y-%m-%d")
+    # Set to the first of the month
+    new_date = date_obj.replace(day=1)
+    # Subtract 2 months from the date
+    current_month = new_date.month
+    if current_month == 1 or current_month == 2:
+        new_date = new_date.replace(
+            year=new_date.year - 1, month=12 + (current_month - 2))
+    new_date = new_date.replace(month=(current_month - 2) % 12 or 12)
+
+    period = new_date.strftime("%Y-%m-%d") + '/P3M'
+
+    # Correct some invalid entries, a quarter can't start before the financial year
+    if period == f"{year.start}-03-01/P3M":
+        period = f"{year.start}-04-01/P3M"
+    return period
+
+
+@lru_cache(maxsize=None)
+def expand_period_to_months(period):
+    """
+    Expand an interval period such as 2023-04-01/P3M into the months it covers,
+    e.g. ('2023-04', '2023-05', '2023-06').
+    Returns None if the period is not an interval of whole months or years.
+    Each distinct period is only expanded once.
+    """
+    match = INTERVAL_PATTERN.match(period)
+    if match is None:
+        return None
+    year, month, length, unit = match.groups()
+    month_count = int(length) * 12 if unit == 'Y' else int(length)
+    if month_count == 0:
+        return None
+
+    start = int(year) * 12 + int(month) - 1
+    return tuple(f"{index // 12}-{index % 12 + 1:02d}" for index in range(start, start + month_count))
+
+
+def replace_period(record, period, count=None):
+    """
+    Return a copy of a record with a new period, and optionally a new count, more cheaply
+    than _replace. The count is always a record's last field.
+    """
+    index = PERIOD_INDEXES[type(record)]
+    if count is None:
+        return record._make((*record[:index], period, *record[index + 1:]))
+    return record._make((*record[:index], period, *record[index + 1:-1], count))
+
+
+def expand_record_to_monthly(record):
+    """
+    Expand a record into one record per month of its period, splitting the count evenly.
+    Monthly records keep their count as reported, and records without an interval
+    period are returned as they are.
+    """
+    months = expand_period_to_months(record.period) if record.period else None
+    if months is None:
+        return (record,)
+    if len(months) == 1:
+        return (replace_period(record, months[0]),)
+
+    count = int(record.count / len(months))
+    return tuple(replace_period(record, month, count) for month in months)
+
+
+def convert_values_to_monthly(data):
+    """
+    Convert quarterly and annual values to monthly and return as a new list of months.
+    The first month of each record takes its place, and the other months follow
+    after all of the records.
+    """
+    monthly = []
+    new_months = []
+    for record in data:
+        months = expand_record_to_monthly(record)
+        monthly.append(months[0])
+        new_months.extend(months[1:])
+    monthly.extend(new_months)
+    return monthly
+
+
+def require_numpy():
+    """Import NumPy for the numpy engine, raising ImportError if it is not installed."""
+    global np
+    if np is None:
+        import numpy
+        np = numpy
+    return np
+
+
+def convert_values_to_monthly_numpy(data):
+    """
+    Convert quarterly and annual values to monthly as convert_values_to_monthly does, with
+    the counts of the records covering several months split with NumPy.
+    """
+    require_numpy()
+    record_months = [expand_period_to_months(record.period) if record.period else None for record in data]
+    lengths = np.array([len(months) if months else 1 for months in record_months], dtype=np.int64)
+    split = lengths > 1
+    counts = np.array([record.count if is_split else 0 for record, is_split in zip(data, split.tolist())],
+                      dtype=np.int64)
+    split_counts = np.trunc(counts / lengths).astype(np.int64).tolist()
+
+    monthly = []
+    new_months = []
+    for record, months, count in zip(data, record_months, split_counts):
+        if months is None:
+            monthly.append(record)
+        elif len(months) == 1:
+            monthly.append(replace_period(record, months[0]))
+        else:
+            monthly.append(replace_period(record, months[0], count))
+            new_months.extend(replace_period(record, month, count) for month in months[1:])
+    monthly.extend(new_months)
+    return monthly
+
+
+def convert_values_to_yearly(data, year):
+    """Convert yearly periods to the financial year label and return as a new list of years."""
+    return [replace_period(record, year.label) if record.period and 'P1Y' in record.period else record
+            for record in data]
+
+
+def normalise_periods(records, group_fields, year):
+    """
+    Group the records by their dimensions and convert each group's periods to intervals,
+    depending on whether the group was reported monthly, quarterly or yearly.
+    Returns the records flattened back into a list, in group order.
+    The periods are interned, as every authority reports the same few.
+    """
+    records_dict = {}
+    for record in records:
+        key = tuple(getattr(record, field) for field in group_fields)
+        if key not in records_dict:
+            records_dict[key] = []
+        records_dict[key].append(record)
+
+    # For each grouping work out if the dates are monthly, quarterly, or yearly
+    normalised = []
+    for group_records in records_dict.values():
+        frequency = calculate_record_frequency(group_records, year)
+
+        for record in group_records:
+            period = None
+            if frequency == 'Quarterly':
+                period = sys.intern(convert_date_to_quarterly(record.period, year))
+            elif frequency == 'Yearly':
+                period = year.period
+            else:
+                period = sys.intern(record.period + '/P1M')
+            normalised.append(replace_period(record, period))
+
+    return normalised
+
+
+def extract_authority_row(row, schema, reference, year):
+    """
+    Extract a single authority's row of activity data for the financial year, with the
+    periods as reported.
+    Returns a tuple of the service summary and a dictionary of records for each measure,
+    or None if the authority is not a known library service.
+    """
+    authority = row['authority']
+    library_service = row['library_details']
+
+    # Check if the authority exists in the authorities data
+    auth_object = find_authority(reference, authority)
+    if auth_object is not None:
+        authority_code = auth_object['gss-code']
+    else:
+        # If the authority is not found, we skip this row.
+        print(
+            f"Authority '{authority}' not found in authorities data.")
+        return None
+
+    authority_records = {measure: [] for measure in MEASURE_FIELDS}
+
+    # Each column is a single reading which could be a monthly count or other data point.
+    # Counts are parsed once here, and any that are not integers are kept as reported.
+    for column in schema:
+        value = row[column.header]
+        if value is None or value == "":
+            continue
+        if column.digits_only and not value.isdigit():
+            continue
+        if authority_code in EXCLUDED_AUTHORITIES.get(column.measure, ()):
+            continue
+        if value in EXCLUDED_VALUES.get(column.measure, ()):
+            continue
+        if column.guard and any(row.get(guard_column) != "" for guard_column in column.guard):
+            continue
+
+        try:
+            count = int(value)
+        except ValueError:
+            count = value
+        authority_records[column.measure].append(MEASURE_RECORDS[column.measure](authority_code, *column.values, count))
+
+    # Sum the counts of each measure for the services list
+    totals = {measure: sum(int(record.count) for record in authority_records[measure])
+              for measure in SERVICE_MEASURES.values()}
+    service = service_summary(authority, library_service, totals, reference, year)
+
+    return service, authority_records
+
+
+def find_authority(reference, name):
+    """Look up an authority by its name, or any other spelling of it, or None if it is unknown."""
+    return reference.authorities.get(name) or reference.authorities.get(name.lower())
+
+
+def service_summary(authority, library_service, totals, reference, year):
+    """
+    Summarise a known authority's library service, with the total of each measure (None
+    if the total is not positive), its population and its nearest neighbours.
+    """
+    auth_object = find_authority(reference, authority)
+    authority_code = auth_object['gss-code']
+    auth_neighbours = reference.nearest_neighbours.get(authority_code, EMPTY_NEIGHBOURS)
+    auth_pop = reference.population.get(authority_code, {'under_12': 0, '12_17': 0, 'adult': 0})
+    return {
+        'Authority code': authority_code,
+        'Authority nice name': auth_object['nice-name'],
+        'Library service': library_service,
+        'Period': year.label,
+        **{field: totals[measure] if totals[measure] > 0 else None
+           for field, measure in SERVICE_MEASURES.items()},
+        'Population under 12': auth_pop['under_12'],
+        'Population 12-17': auth_pop['12_17'],
+        'Population adult': auth_pop['adult'],
+        'Nearest neighbour 1': auth_neighbours[0],
+        'Nearest neighbour 2': auth_neighbours[1],
+        'Nearest neighbour 3': auth_neighbours[2],
+        'Nearest neighbour 4': auth_neighbours[3],
+        'Nearest neighbour 5': auth_neighbours[4]
+    }
+
+
+def normalise_authority_records(authority_records, year, report=None):
+    """Normalise the periods of an authority's records for each measure, in place."""
+    # Users are always yearly so there are no periods to normalise
+    for measure, group_fields in MEASURE_GROUPS.items():
+        with report_stage(report, f'normalisation.{measure}'):
+            authority_records[measure] = normalise_periods(authority_records[measure], group_fields, year)
+    return authority_records
+
+
+def rotate_authority_row(row, schema, reference, year, report=None):
+    """
+    Rotate a single authority's row of activity data for the financial year.
+    Returns a tuple of the service summary and a dictionary of records for each measure,
+    or None if the authority is not a known library service.
+    """
+    extracted = extract_authority_row(row, schema, reference, year)
+    if extracted is None:
+        return None
+    service, authority_records = extracted
+    return service, normalise_authority_records(authority_records, year, report)
+
+
+# The lookups of a worker process, set once when the worker starts
+_worker_state = {}
+
+
+def _init_worker(fieldnames, schema, reference, year):
+    """Keep the read-only lookups in the worker so they are only sent once."""
+    _worker_state['fieldnames'] = fieldnames
+    _worker_state['schema'] = schema
+    _worker_state['reference'] = reference
+    _worker_state['year'] = year
+
+
+def _rotate_worker_row(values):
+    """Rotate a row in a worker. Rows are sent as values as the field names are shared."""
+    row = dict(zip(_worker_state['fieldnames'], values))
+    return rotate_authority_row(row, _worker_state['schema'], _worker_state['reference'], _worker_state['year'])
+
+
+def rotate_rows(activity_reader, reference, year, workers=1, engine='python', report=None, measures=None):
+    """
+    Yield the service summary and measure records of each known authority in the activity data
+    for the financial year.
+    With more than one worker the rows are rotated in a process pool, in batches so that
+    memory stays bounded, and the results are yielded in input order.
+    The numpy engine rotates chunks of rows together as arrays, and ignores the workers.
+    Each measure's normalisation is only timed for the report when rows are rotated one
+    at a time in this process. If a set of measures is given, only their columns are rotated.
+    """
+    if engine == 'numpy':
+        yield from rotate_rows_numpy(activity_reader, reference, year, measures)
+        return
+
+    # Classify the columns once, rather than for every authority row
+    schema = compile_header_schema(activity_reader.fieldnames, year, measures)
+
+    if not workers or workers <= 1:
+        for row in activity_reader:
+            rotated = rotate_authority_row(row, schema, reference, year, report)
+            if rotated is not None:
+                yield rotated
+        return
+
+    batch_size = workers * WORKER_CHUNK_SIZE * 4
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(activity_reader.fieldnames, schema, reference, year)) as executor:
+        rows = (list(row.values()) for row in activity_reader)
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            for rotated in executor.map(_rotate_worker_row, batch, chunksize=WORKER_CHUNK_SIZE):
+                if rotated is not None:
+                    yield rotated
+
+
+def parse_count(value):
+    """Return a count reported as text as an integer, or None if it is not one."""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def rotate_rows_numpy(activity_reader, reference, year, measures=None):
+    """
+    Rotate the activity data with NumPy, giving the same results as rotate_authority_row.
+    The rows are read in chunks, so memory stays bounded when streaming. The measure columns
+    of each chunk are loaded into one array of text, which is checked and parsed into counts
+    as a whole, with a mask of the values that are recorded, after the empty, guarded and
+    excluded values. Each row's reporting frequency of each group of columns (a measure's
+    dimension values) is found from the pattern of months recorded, for all of the rows at
+    once, and records are only created as each authority is yielded. Rows with a recorded
+    value that is not an integer are rotated by rotate_authority_row instead.
+    """
+    require_numpy()
+    fieldnames = activity_reader.fieldnames
+    schema = compile_header_schema(fieldnames, year, measures)
+    if not schema:
+        for row in activity_reader:
+            rotated = rotate_authority_row(row, schema, reference, year)
+            if rotated is not None:
+                yield rotated
+        return
+
+    # The text of the measure columns and then of their guard columns is read from each row
+    headers = [column.header for column in schema]
+    guard_headers = sorted({guard for column in schema for guard in column.guard} - set(headers))
+    header_indexes = {header: index for index, header in enumerate(headers + guard_headers)}
+    digit_columns = [index for index, column in enumerate(schema) if column.digits_only]
+    guarded_columns = [(index, [header_indexes[guard] for guard in column.guard])
+                       for index, column in enumerate(schema) if column.guard]
+    measure_columns = {measure: np.array([column.measure == measure for column in schema])
+                       for measure in MEASURE_FIELDS}
+
+    # Each column's group within its measure, and month of the financial year
+    months = list(year.month_starts.values())
+    groups = {}
+    column_groups = np.zeros(len(schema), dtype=np.int64)
+    column_months = np.zeros(len(schema), dtype=np.int64)
+    for index, column in enumerate(schema):
+        record_fields = MEASURE_RECORDS[column.measure]._fields
+        key = (column.measure,) + tuple(column.values[record_fields.index(field) - 1]
+                                        for field in MEASURE_GROUPS.get(column.measure, ()))
+        column_groups[index] = groups.setdefault(key, len(groups))
+        column_months[index] = months.index(column.period) if column.period in months else -1
+
+    # Maps the columns recorded to the months each group recorded, as a (row, group, month) array
+    incidence = np.zeros((len(schema), len(groups) * len(months)), dtype=np.int64)
+    dated = column_months >= 0
+    incidence[np.flatnonzero(dated), column_groups[dated] * len(months) + column_months[dated]] = 1
+    quarter_ends = [months.index(month) for month in year.quarter_ends]
+    march = months.index(year.month_starts['march'])
+    april = months.index(year.month_starts['april'])
+
+    # The fields of each column's records before the count, with each period it can be published
+    # with: as reported, quarterly, yearly or monthly. Columns of measures that are not grouped
+    # keep their period as reported.
+    column_measures = [column.measure for column in schema]
+    record_types = [MEASURE_RECORDS[column.measure] for column in schema]
+    record_fields = []
+    for index, column in enumerate(schema):
+        period_index = PERIOD_INDEXES[record_types[index]] - 1
+        periods = [column.period]
+        if column_months[index] >= 0:
+            periods += [sys.intern(convert_date_to_quarterly(column.period, year)), year.period,
+                        sys.intern(f'{column.period}/P1M')]
+        record_fields.append([(*column.values[:period_index], period, *column.values[period_index + 1:])
+                              for period in periods])
+    grouped = np.array([column.measure in MEASURE_GROUPS and column_months[index] >= 0
+                        for index, column in enumerate(schema)])
+
+    while True:
+        rows = list(islice(activity_reader, NUMPY_CHUNK_SIZE))
+        if not rows:
+            break
+
+        values = np.array([[row.get(header) for header in header_indexes] for row in rows], dtype=object)
+        missing = values == None  # noqa: E711
+        text = np.where(missing, '', values).astype(str)
+
+        measure_text = text[:, :len(schema)]
+        recorded = measure_text != ''
+        if digit_columns:
+            recorded[:, digit_columns] &= np.char.isdigit(measure_text[:, digit_columns])
+        for index, guards in guarded_columns:
+            recorded[:, index] &= ((text[:, guards] == '') & ~missing[:, guards]).all(axis=1)
+
+        auth_objects = [find_authority(reference, row['authority']) for row in rows]
+        codes = [auth_object['gss-code'] if auth_object is not None else None for auth_object in auth_objects]
+        for measure, excluded in EXCLUDED_AUTHORITIES.items():
+            excluded_rows = np.array([code in excluded for code in codes])
+            recorded[np.ix_(excluded_rows, measure_columns[measure])] = False
+        for measure, excluded in EXCLUDED_VALUES.items():
+            columns = measure_columns[measure]
+            recorded[:, columns] &= ~np.isin(measure_text[:, columns], excluded)
+
+        # Counts of ASCII digits with an optional sign are parsed as an array, and any other
+        # recorded values one at a time as int() would, which rarely happens
+        stripped = np.char.strip(measure_text)
+        unsigned = np.char.lstrip(stripped, '+-')
+        integer = (recorded & (np.char.str_len(unsigned) > 0) & (np.char.strip(unsigned, '0123456789') == '') &
+                   (np.char.str_len(stripped) - np.char.str_len(unsigned) <= 1) &
+                   (np.char.str_len(unsigned) <= INTEGER_DIGITS))
+        counts = np.zeros(recorded.shape, dtype=np.int64)
+        counts[integer] = stripped[integer].astype(np.int64)
+        unparsed = np.zeros(len(rows), dtype=bool)
+        for row_index, index in zip(*np.nonzero(recorded & ~integer)):
+            count = parse_count(measure_text[row_index, index])
+            if count is None or not -2 ** 63 <= count < 2 ** 63:
+                unparsed[row_index] = True
+            else:
+                counts[row_index, index] = count
+
+        recorded_months = (recorded.astype(np.int64) @ incidence).reshape(len(rows), len(groups), len(months)) > 0
+        month_count = recorded_months.sum(axis=2)
+        quarterly = (month_count == 4) & recorded_months[:, :, quarter_ends].all(axis=2)
+        yearly = (month_count == 1) & (recorded_months[:, :, march] | recorded_months[:, :, april])
+
+        # The period of each column's records in each row, as an index into its record fields
+        column_quarterly = quarterly[:, column_groups]
+        column_yearly = yearly[:, column_groups]
+        period_kinds = np.where(column_quarterly, 1, np.where(column_yearly, 2, 3)) * grouped
+
+        totals = {measure: counts[:, measure_columns[measure]].sum(axis=1).tolist()
+                  for measure in SERVICE_MEASURES.values()}
+
+        for row_index, row in enumerate(rows):
+            code = codes[row_index]
+            if code is None:
+                print(f"Authority '{row['authority']}' not found in authorities data.")
+                continue
+            if unparsed[row_index]:
+                yield rotate_authority_row(row, schema, reference, year)
+                continue
+
+            service = service_summary(row['authority'], row['library_details'],
+                                      {measure: totals[measure][row_index] for measure in totals}, reference, year)
+
+            # Order each measure's records by the group's first record, as normalise_periods does
+            indexes = np.flatnonzero(recorded[row_index])
+            _, first, inverse = np.unique(column_groups[indexes], return_index=True, return_inverse=True)
+            indexes = indexes[np.argsort(first[inverse], kind='stable')]
+
+            row_counts = counts[row_index]
+            authority_records = {measure: [] for measure in MEASURE_FIELDS}
+            for index, kind, count in zip(indexes.tolist(), period_kinds[row_index, indexes].tolist(),
+                                          row_counts[indexes].tolist()):
+                authority_records[column_measures[index]].append(
+                    tuple.__new__(record_types[index], (code, *record_fields[index][kind], count)))
+            yield service, authority_records
+
+
+def missing_services(library_services, existing_codes, year):
+    """Yield an empty service summary for each library service not in the activity data."""
+    for lib_service in library_services.values():
+        if lib_service['code'] not in existing_codes:
+            neighbours = lib_service.get('nearest_neighbours', EMPTY_NEIGHBOURS)
+            yield {
+                'Authority code': lib_service['code'],
+                'Authority nice name': lib_service['nice-name'],
+                'Library service': lib_service.get('name', 'Unknown'),
+                'Period': year.period,
+                **{field: None for field in SERVICE_MEASURES},
+                'Population under 12': lib_service['population']['under_12'],
+                'Population 12-17': lib_service['population']['12_17'],
+                'Population adult': lib_service['population']['adult'],
+                'Nearest neighbour 1': neighbours[0],
+                'Nearest neighbour 2': neighbours[1],
+                'Nearest neighbour 3': neighbours[2],
+                'Nearest neighbour 4': neighbours[3],
+                'Nearest neighbour 5': neighbours[4]
+            }
+
+
+def convert_values_for_json(measure, data, year, engine='python'):
+    """Convert a measure's records to the periods published in the JSON data."""
+    if measure == 'users':
+        return convert_values_to_yearly(data, year)
+    if engine == 'numpy':
+        return convert_values_to_monthly_numpy(data)
+    return convert_values_to_monthly(data)
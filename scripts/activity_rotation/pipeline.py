@@ -0,0 +1,390 @@
+"""
+Rotating a year of activity data into the outputs, in memory, streaming, or several years in a batch.
+"""
+
+import csv
+import json
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+
+from .build_state import required_measures
+from .conversion import _worker_state, convert_values_for_json, missing_services, rotate_rows
+from .reading import load_reference_data, open_activity_data
+from .report import CountingReader, report_stage
+from .schema import (
+    AUTHORITY_SUMMARY, COMPARISONS, COMPARISONS_JSON, DATABASE, LIBRARY_DATA, MEASURE_AGE_GROUPS, MEASURE_FIELDS,
+    MEASURE_OUTPUTS, NEIGHBOUR_INDEX_JSON, POPULATION_BANDS, ROLLUPS_JSON, SERVICES, SERVICES_JSON, SERVICE_FIELDS,
+    dataset_name, resolve_financial_year)
+from .writers import (
+    ComparisonBuilder, DatabaseUpdater, DatabaseWriter, RollupBuilder, ShardBuilder, open_json_writer, read_rollups,
+    write_authority_shards, write_comparisons, write_csv, write_json_dataset, write_population_bands, write_rollups)
+
+
+def rotate_year(path, year, reference, workers=1, engine='python', report=None, measures=None):
+    """
+    Rotate an annual activity data file, returning its services and each measure's records.
+    If a set of measures is given the other measures have no records, and the services'
+    totals of them are empty.
+    """
+    records = {measure: [] for measure in MEASURE_FIELDS}
+    services = []
+
+    with open_activity_data(path) as activity_reader:
+        if report is not None:
+            activity_reader = CountingReader(activity_reader, report)
+        rotated = rotate_rows(activity_reader, reference, year, workers, engine, report, measures)
+        if report is not None:
+            rotated = report.timed('row_rotation', rotated)
+
+        # Each row is all the authority's activity data for the year
+        for service, authority_records in rotated:
+            services.append(service)
+            for measure, measure_records in authority_records.items():
+                records[measure].extend(measure_records)
+
+    if report is not None:
+        report.count('rows', 'rotated', len(services))
+        for measure, measure_records in records.items():
+            report.count_records(measure, measure_records)
+
+    # Extend the services data to include any library service not in the data
+    existing_codes = {service['Authority code'] for service in services}
+    services.extend(missing_services(reference.library_services, existing_codes, year))
+
+    return services, records
+
+
+def rotate_activity_data(json_format='rows', outputs=None, use_cache=True, workers=1, year=None,
+                         engine='python', activity_path=LIBRARY_DATA, report=None):
+    """
+    Rotate the activity data from the input CSV file or workbook into multiple output files.
+    If a set of output paths is given only those outputs are written.
+    If a run report is given each stage of the run is timed and counted in it.
+    """
+    year = year or resolve_financial_year(activity_path)
+    with report_stage(report, 'reference_loading'):
+        reference = load_reference_data(use_cache)
+    services, records = rotate_year(activity_path, year, reference, workers, engine, report,
+                                    required_measures(outputs))
+    write_outputs(reference, services, records, year, json_format, outputs, engine, report)
+
+
+def write_outputs(reference, services, records, year, json_format='rows', outputs=None, engine='python',
+                  report=None, changes=None):
+    """
+    Write the services and each measure's records of a financial year to the output files.
+    If a set of output paths is given only those outputs are written.
+    If the changes since the outputs were last written are given, as the authorities whose
+    services or records of each measure have changed, the existing rollups, shards and
+    database are updated: the rollups of the changed measures, and the shards and database
+    rows of the changed authorities, are rewritten, and the rest are kept as they are.
+    """
+    def selected(path):
+        return path is not None and (outputs is None or path in outputs)
+
+    def updated(path):
+        return changes is not None and selected(path) and os.path.exists(path)
+
+    changed_authorities = set().union(*changes.values()) if changes is not None else None
+
+    if selected(POPULATION_BANDS):
+        with report_stage(report, 'population_bands'):
+            write_population_bands(reference)
+
+    # Write the aggregated data to the respective CSV files
+    with report_stage(report, 'csv_write'):
+        for measure, (csv_path, _) in MEASURE_OUTPUTS.items():
+            if selected(csv_path):
+                write_csv(csv_path, MEASURE_FIELDS[measure], records[measure])
+        if selected(SERVICES):
+            write_csv(SERVICES, SERVICE_FIELDS, (service.values() for service in services))
+
+    # Convert the services dictionary array to an array of array values
+    if selected(SERVICES_JSON):
+        with report_stage(report, 'json_write'):
+            service_values = [list(service.values()) for service in services]
+            write_json_dataset(SERVICES_JSON, SERVICE_FIELDS, service_values, json_format)
+
+    rollups = {}
+    for measure, (_, json_path) in MEASURE_OUTPUTS.items():
+        rollup_selected = selected(ROLLUPS_JSON) and not (updated(ROLLUPS_JSON) and measure not in changes)
+        if json_path is None or not (selected(json_path) or rollup_selected):
+            continue
+        with report_stage(report, 'monthly_expansion'):
+            converted = convert_values_for_json(measure, records[measure], year, engine)
+        if report is not None:
+            report.count('synthetic_months', measure, len(converted) - len(records[measure]))
+        if selected(json_path):
+            # Records are tuples, so are written as arrays of values
+            with report_stage(report, 'json_write'):
+                write_json_dataset(json_path, MEASURE_FIELDS[measure], converted, json_format)
+        if rollup_selected:
+            with report_stage(report, 'rollups'):
+                rollups[measure] = RollupBuilder(measure)
+                for record in converted:
+                    rollups[measure].add(record)
+
+    if selected(ROLLUPS_JSON):
+        with report_stage(report, 'rollups'):
+            write_rollups(ROLLUPS_JSON, rollups, read_rollups(ROLLUPS_JSON) if updated(ROLLUPS_JSON) else None)
+
+    if selected(AUTHORITY_SUMMARY):
+        with report_stage(report, 'shards'):
+            shard_authorities = changed_authorities if updated(AUTHORITY_SUMMARY) else None
+            shards = ShardBuilder()
+            for measure, (_, json_path) in MEASURE_OUTPUTS.items():
+                if json_path is None:
+                    continue
+                shards.add(dataset_name(json_path), (
+                    convert_values_for_json(measure, [record], year) for record in records[measure]
+                    if shard_authorities is None or record.authority in shard_authorities))
+            write_authority_shards(shards, changed=shard_authorities)
+
+    if any(selected(path) for path in (COMPARISONS, COMPARISONS_JSON, NEIGHBOUR_INDEX_JSON)):
+        with report_stage(report, 'comparisons'):
+            comparisons = ComparisonBuilder(reference.population_ages)
+            for service in services:
+                comparisons.add_service(service)
+            for measure in MEASURE_AGE_GROUPS:
+                comparisons.add_records(measure, records[measure])
+            write_comparisons(comparisons, selected, json_format)
+
+    if selected(DATABASE):
+        with report_stage(report, 'database'):
+            if updated(DATABASE):
+                # Only the changed authorities' services and records are added again
+                database = DatabaseUpdater(changes)
+                database_services = [service for service in services
+                                     if service['Authority code'] in changes.get('services', ())]
+                database_records = {
+                    measure: [record for record in records[measure] if record.authority in authorities]
+                    for measure, authorities in changes.items() if measure != 'services'}
+            else:
+                database = DatabaseWriter()
+                database_services, database_records = services, records
+            for service in database_services:
+                database.add_service(service)
+            for measure, measure_records in database_records.items():
+                for record in measure_records:
+                    database.add_records(measure, convert_values_for_json(measure, [record], year))
+            database.close()
+
+
+def rotate_activity_data_streaming(json_format='rows', outputs=None, use_cache=True, workers=1, year=None,
+                                   engine='python', activity_path=LIBRARY_DATA, report=None):
+    """
+    Rotate the activity data, writing each authority's records as they are produced.
+    Peak memory depends on a single authority's data rather than the whole dataset.
+    The monthly JSON data lists the original records before the months created from
+    quarterly and yearly values, so those are spooled to a temporary file until the end.
+    If a set of output paths is given only those outputs are written.
+    If a run report is given each stage of the run is timed and counted in it.
+    """
+    def selected(path):
+        return path is not None and (outputs is None or path in outputs)
+
+    year = year or resolve_financial_year(activity_path)
+    with report_stage(report, 'reference_loading'):
+        reference = load_reference_data(use_cache)
+    if selected(POPULATION_BANDS):
+        with report_stage(report, 'population_bands'):
+            write_population_bands(reference)
+
+    with ExitStack() as stack:
+        activity_reader = stack.enter_context(open_activity_data(activity_path))
+        if report is not None:
+            activity_reader = CountingReader(activity_reader, report)
+
+        csv_writers = {}
+        json_writers = {}
+        spools = {}
+        for measure, (csv_path, json_path) in MEASURE_OUTPUTS.items():
+            if selected(csv_path):
+                measure_out = stack.enter_context(open(csv_path, mode='w', newline='', encoding='utf-8'))
+                csv_writers[measure] = csv.writer(measure_out)
+                csv_writers[measure].writerow(MEASURE_FIELDS[measure])
+            if selected(json_path):
+                json_writers[measure] = open_json_writer(
+                    stack.enter_context(open(json_path, 'w', encoding='utf-8')),
+                    MEASURE_FIELDS[measure], json_format)
+                spools[measure] = stack.enter_context(
+                    tempfile.TemporaryFile(mode='w+', encoding='utf-8'))
+
+        service_writer = None
+        if selected(SERVICES):
+            services_out = stack.enter_context(open(SERVICES, mode='w', newline='', encoding='utf-8'))
+            service_writer = csv.DictWriter(services_out, fieldnames=SERVICE_FIELDS)
+            service_writer.writeheader()
+        services_json_writer = None
+        if selected(SERVICES_JSON):
+            services_json_writer = open_json_writer(
+                stack.enter_context(open(SERVICES_JSON, 'w', encoding='utf-8')),
+                SERVICE_FIELDS, json_format)
+
+        rollups = {}
+        if selected(ROLLUPS_JSON):
+            rollups = {measure: RollupBuilder(measure)
+                       for measure, (_, json_path) in MEASURE_OUTPUTS.items() if json_path is not None}
+
+        shards = ShardBuilder() if selected(AUTHORITY_SUMMARY) else None
+        database = DatabaseWriter() if selected(DATABASE) else None
+        comparisons = None
+        if any(selected(path) for path in (COMPARISONS, COMPARISONS_JSON, NEIGHBOUR_INDEX_JSON)):
+            comparisons = ComparisonBuilder(reference.population_ages)
+
+        existing_codes = set()
+
+        def write_service(service):
+            if service_writer is not None:
+                service_writer.writerow(service)
+            if services_json_writer is not None:
+                services_json_writer.write(list(service.values()))
+            if database is not None:
+                database.add_service(service)
+            if comparisons is not None:
+                comparisons.add_service(service)
+
+        rotated = rotate_rows(activity_reader, reference, year, workers, engine, report,
+                              required_measures(outputs))
+        if report is not None:
+            rotated = report.timed('row_rotation', rotated)
+
+        for service, authority_records in rotated:
+            existing_codes.add(service['Authority code'])
+            write_service(service)
+            if report is not None:
+                report.count('rows', 'rotated')
+
+            for measure, measure_records in authority_records.items():
+                if report is not None:
+                    report.count_records(measure, measure_records)
+                if measure in csv_writers:
+                    with report_stage(report, 'csv_write'):
+                        csv_writers[measure].writerows(measure_records)
+                if comparisons is not None:
+                    with report_stage(report, 'comparisons'):
+                        comparisons.add_records(measure, measure_records)
+                json_path = MEASURE_OUTPUTS[measure][1]
+                shard_name = dataset_name(json_path) if shards is not None and json_path is not None else None
+                json_writer = json_writers.get(measure)
+                rollup = rollups.get(measure)
+                if json_writer is None and rollup is None and shard_name is None and database is None:
+                    continue
+
+                # The conversion returns each record first, followed by any new months
+                with report_stage(report, 'monthly_expansion'):
+                    conversions = [convert_values_for_json(measure, [record], year) for record in measure_records]
+                if report is not None and json_path is not None:
+                    report.count('synthetic_months', measure, sum(len(converted) - 1 for converted in conversions))
+                if shard_name is not None:
+                    with report_stage(report, 'shards'):
+                        shards.add(shard_name, conversions)
+                if database is not None:
+                    with report_stage(report, 'database'):
+                        for converted in conversions:
+                            database.add_records(measure, converted)
+                if rollup is not None:
+                    with report_stage(report, 'rollups'):
+                        for converted in conversions:
+                            for converted_record in converted:
+                                rollup.add(converted_record)
+                if json_writer is not None:
+                    with report_stage(report, 'json_write'):
+                        for converted in conversions:
+                            json_writer.write(converted[0])
+                            for new_record in converted[1:]:
+                                spools[measure].write(json.dumps(new_record) + '\n')
+
+        for service in missing_services(reference.library_services, existing_codes, year):
+            write_service(service)
+        if services_json_writer is not None:
+            services_json_writer.close()
+
+        # Append the spooled months after the original records
+        with report_stage(report, 'json_write'):
+            for measure, json_writer in json_writers.items():
+                spool = spools[measure]
+                spool.seek(0)
+                for line in spool:
+                    json_writer.write(json.loads(line))
+                json_writer.close()
+
+    if selected(ROLLUPS_JSON):
+        with report_stage(report, 'rollups'):
+            write_rollups(ROLLUPS_JSON, rollups)
+    if shards is not None:
+        with report_stage(report, 'shards'):
+            write_authority_shards(shards)
+    if database is not None:
+        with report_stage(report, 'database'):
+            database.close()
+    if comparisons is not None:
+        with report_stage(report, 'comparisons'):
+            write_comparisons(comparisons, selected, json_format)
+
+
+def _init_year_worker(reference, engine, measures):
+    """Keep the read-only lookups in the worker so they are only sent once."""
+    _worker_state['reference'] = reference
+    _worker_state['engine'] = engine
+    _worker_state['measures'] = measures
+
+
+def _rotate_year_worker(path, year):
+    """Rotate an annual activity data file in a worker."""
+    return rotate_year(path, year, _worker_state['reference'], engine=_worker_state['engine'],
+                       measures=_worker_state['measures'])
+
+
+def rotate_activity_years(paths, years, output_dir, use_cache=True, workers=None, engine='python',
+                          report=None, measures=None):
+    """
+    Rotate several annual activity data files in one run, loading the reference data once.
+    The years are rotated concurrently, one per process, and written in year order to
+    long format CSV files in the output directory, with the financial year as the first field.
+    If a list of measures is given, which may include 'services', only their files are written.
+    When the years are rotated in worker processes, the run report only counts their records.
+    """
+    with report_stage(report, 'reference_loading'):
+        reference = load_reference_data(use_cache)
+    jobs = sorted(zip(years, paths), key=lambda job: job[0].start)
+    years = [year for year, _ in jobs]
+    paths = [path for _, path in jobs]
+    workers = workers or min(len(jobs), os.cpu_count() or 1)
+    selected = measures or [*MEASURE_OUTPUTS, 'services']
+    rotated_measures = None if 'services' in selected else set(selected)
+
+    os.makedirs(output_dir, exist_ok=True)
+    with ExitStack() as stack:
+        writers = {}
+        for measure, (csv_path, _) in list(MEASURE_OUTPUTS.items()) + [('services', (SERVICES, None))]:
+            if measure not in selected:
+                continue
+            fields = SERVICE_FIELDS if measure == 'services' else MEASURE_FIELDS[measure]
+            measure_out = stack.enter_context(open(
+                os.path.join(output_dir, os.path.basename(csv_path)), mode='w', newline='', encoding='utf-8'))
+            writers[measure] = csv.writer(measure_out)
+            writers[measure].writerow(['Financial year'] + fields)
+
+        if workers <= 1:
+            results = (rotate_year(path, year, reference, engine=engine, report=report, measures=rotated_measures)
+                       for year, path in jobs)
+        else:
+            executor = stack.enter_context(ProcessPoolExecutor(
+                max_workers=workers, initializer=_init_year_worker, initargs=(reference, engine, rotated_measures)))
+            results = executor.map(_rotate_year_worker, paths, years)
+        if report is not None:
+            results = report.timed('year_rotation', results)
+
+        for year, (services, records) in zip(years, results):
+            if report is not None and workers > 1:
+                for measure, measure_records in records.items():
+                    report.count_records(measure, measure_records)
+            with report_stage(report, 'csv_write'):
+                if 'services' in writers:
+                    writers['services'].writerows((year.label, *service.values()) for service in services)
+                for measure, measure_records in records.items():
+                    if measure in writers:
+                        writers[measure].writerows((year.label, *record) for record in measure_records)
@@ -0,0 +1,197 @@
+"""
+Publishing the JSON datasets as content hashed, precompressed copies with a manifest, and as
+immutable partitions of each financial year.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import re
+import tempfile
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from .build_state import built_year, load_build_state, required_measures
+from .conversion import convert_values_for_json
+from .pipeline import rotate_year
+from .reading import load_reference_data
+from .report import report_stage
+from .schema import (
+    DATASETS_MANIFEST, HASH_LENGTH, JSON_OUTPUTS, MANIFEST_DATASETS, MEASURE_FIELDS, MEASURE_OUTPUTS,
+    PARTITIONS_DIRECTORY, PARTITIONS_INDEX, SERVICES_JSON, SERVICE_FIELDS, dataset_name)
+from .writers import write_if_changed, write_json_dataset
+
+
+def count_dataset_rows(data):
+    """Count the rows of a JSON dataset in either the rows or columnar format, or None for rollups."""
+    if isinstance(data, list):
+        return len(data)
+    return data.get('length')
+
+
+def hashed_dataset_path(json_path, content):
+    """Return the path of the content hashed copy of a JSON dataset with the given content."""
+    digest = hashlib.sha256(content).hexdigest()[:HASH_LENGTH]
+    return os.path.join(os.path.dirname(json_path), f'{dataset_name(json_path)}.{digest}.json')
+
+
+def publish_datasets(json_paths=None):
+    """
+    Write a content hashed copy of each JSON dataset, with gzip and brotli (if installed)
+    compressed siblings. Hashed copies can be cached forever as a new file name is used
+    when the content changes. Copies from previous content are removed.
+    """
+    if brotli is None:
+        print('The brotli package is not installed, so .br files will not be written.')
+
+    for json_path in json_paths or MANIFEST_DATASETS:
+        directory = os.path.dirname(json_path)
+        name = dataset_name(json_path)
+        with open(json_path, 'rb') as f:
+            content = f.read()
+
+        hashed_path = hashed_dataset_path(json_path, content)
+        hashed_filename = os.path.basename(hashed_path)
+
+        # Remove copies of the dataset's previous content
+        stale_pattern = re.compile(rf'^{re.escape(name)}\.[0-9a-f]{{{HASH_LENGTH}}}\.json(\.gz|\.br)?$')
+        for existing in os.listdir(directory):
+            if stale_pattern.match(existing) and not existing.startswith(hashed_filename):
+                os.remove(os.path.join(directory, existing))
+
+        write_if_changed(hashed_path, content)
+        write_if_changed(hashed_path + '.gz', gzip.compress(content, compresslevel=9, mtime=0))
+        if brotli is not None:
+            write_if_changed(hashed_path + '.br', brotli.compress(content))
+
+
+def write_datasets_manifest(json_paths=None):
+    """
+    Write the manifest of the JSON datasets. Each dataset is listed with the SHA-256 hash
+    of its content, which the dashboard uses as its version, its size and row count, and
+    the file to fetch: its content hashed copy (with the sizes of the compressed copies)
+    if it has been published, or else the dataset itself. Every run writes the manifest,
+    so the dashboard always has the version of each dataset.
+    """
+    manifest = {}
+    for json_path in json_paths or MANIFEST_DATASETS:
+        if not os.path.exists(json_path):
+            continue
+        with open(json_path, 'rb') as f:
+            content = f.read()
+
+        hashed_path = hashed_dataset_path(json_path, content)
+        published = os.path.exists(hashed_path)
+        entry = manifest[dataset_name(json_path)] = {
+            'file': os.path.basename(hashed_path if published else json_path),
+            'sha256': hashlib.sha256(content).hexdigest(),
+            'bytes': len(content),
+            'rows': count_dataset_rows(json.loads(content))
+        }
+        for extension, size in (('.gz', 'gzip_bytes'), ('.br', 'brotli_bytes')):
+            if published and os.path.exists(hashed_path + extension):
+                entry[size] = os.path.getsize(hashed_path + extension)
+
+    write_if_changed(DATASETS_MANIFEST, json.dumps(manifest, indent=2).encode('utf-8'))
+
+
+def publish_partitions(year, json_paths):
+    """
+    Publish each JSON dataset as the partition of its financial year, named by the year
+    and a hash of its content, with a gzip compressed sibling. The partitions index lists
+    each dataset's partitions by year with their hashes, sizes and row counts. Other years'
+    partitions are left untouched, so they can be cached forever, and publishing a year
+    again only replaces that year's partition.
+    """
+    # An index is never replaced by one without the year's partitions
+    if not json_paths:
+        print(f'No datasets were built for {year.label}, so no partitions are published.')
+        return
+
+    index = {}
+    if os.path.exists(PARTITIONS_INDEX):
+        with open(PARTITIONS_INDEX, mode='r', encoding='utf-8') as f:
+            index = json.load(f)
+
+    os.makedirs(PARTITIONS_DIRECTORY, exist_ok=True)
+    for json_path in json_paths:
+        name = dataset_name(json_path)
+        with open(json_path, 'rb') as f:
+            content = f.read()
+
+        sha256 = hashlib.sha256(content).hexdigest()
+        filename = f'{name}.{year.start}.{sha256[:HASH_LENGTH]}.json'
+
+        # Remove the year's partition of previous content
+        stale_pattern = re.compile(rf'^{re.escape(name)}\.{year.start}\.[0-9a-f]{{{HASH_LENGTH}}}\.json(\.gz)?$')
+        for existing in os.listdir(PARTITIONS_DIRECTORY):
+            if stale_pattern.match(existing) and not existing.startswith(filename):
+                os.remove(os.path.join(PARTITIONS_DIRECTORY, existing))
+
+        partition_path = os.path.join(PARTITIONS_DIRECTORY, filename)
+        write_if_changed(partition_path, content)
+        gzipped = gzip.compress(content, compresslevel=9, mtime=0)
+        write_if_changed(partition_path + '.gz', gzipped)
+
+        partitions = index.get(name, {})
+        partitions[year.label] = {
+            'file': os.path.relpath(partition_path, os.path.dirname(PARTITIONS_INDEX)),
+            'sha256': sha256,
+            'bytes': len(content),
+            'rows': count_dataset_rows(json.loads(content)),
+            'gzip_bytes': len(gzipped)
+        }
+        index[name] = dict(sorted(partitions.items()))
+
+    write_if_changed(PARTITIONS_INDEX, json.dumps(index, indent=2).encode('utf-8'))
+
+
+def built_partitions(year):
+    """
+    Return the JSON datasets that the build state records as built for the financial year,
+    to publish as its partitions, whether or not the latest run rewrote them. Datasets built
+    for another year, or modified since, are skipped.
+    """
+    state = load_build_state()
+    json_paths = []
+    for json_path in JSON_OUTPUTS:
+        if built_year(state, json_path) != year.start:
+            print(f'{json_path} was not built for {year.label}, so is not published as its partition.')
+            continue
+        json_paths.append(json_path)
+    return json_paths
+
+
+def backfill_partitions(activity_path, year, json_format='rows', outputs=None, use_cache=True, workers=1,
+                        engine='python', report=None):
+    """
+    Publish the partitions of a financial year earlier than that of the national datasets,
+    leaving the national datasets and the build state alone. The year's JSON datasets, or
+    those among the given outputs, are written to a temporary directory and published from it.
+    """
+    json_outputs = [path for path in JSON_OUTPUTS if outputs is None or path in outputs]
+    with report_stage(report, 'reference_loading'):
+        reference = load_reference_data(use_cache)
+    services, records = rotate_year(activity_path, year, reference, workers, engine, report,
+                                    required_measures(json_outputs))
+
+    with tempfile.TemporaryDirectory() as directory:
+        json_paths = []
+        if SERVICES_JSON in json_outputs:
+            json_paths.append(os.path.join(directory, os.path.basename(SERVICES_JSON)))
+            write_json_dataset(json_paths[-1], SERVICE_FIELDS, [list(service.values()) for service in services],
+                               json_format)
+        for measure, (_, json_path) in MEASURE_OUTPUTS.items():
+            if json_path not in json_outputs:
+                continue
+            json_paths.append(os.path.join(directory, os.path.basename(json_path)))
+            with report_stage(report, 'monthly_expansion'):
+                converted = convert_values_for_json(measure, records[measure], year, engine)
+            with report_stage(report, 'json_write'):
+                write_json_dataset(json_paths[-1], MEASURE_FIELDS[measure], converted, json_format)
+        with report_stage(report, 'publish'):
+            publish_partitions(year, json_paths)
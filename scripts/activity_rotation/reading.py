@@ -0,0 +1,376 @@
+"""
+Reading the activity data from CSV files or the published XLSX workbook, the reference data lookups
+and the published JSON datasets.
+"""
+
+import csv
+import hashlib
+import json
+import os
+import pickle
+import re
+import xml.etree.ElementTree as ElementTree
+import zipfile
+from collections import namedtuple
+from contextlib import contextmanager
+from itertools import accumulate
+
+from .schema import (
+    ACTIVITY_HEADERS, AGE_BANDS, AUTHORITIES, LIBRARY_SERVICES, NEAREST_NEIGHBOURS, POPULATION, REFERENCE_CACHE,
+    REFERENCE_CACHE_VERSION, REFERENCE_INPUTS, SERVICE_POPULATION_BANDS)
+
+# The header that identifies the table of each input when it is read from a workbook
+ACTIVITY_KEY_FIELD = 'authority'
+NEIGHBOURS_KEY_FIELD = 'Upper tier local authority code'
+
+# The years in the activity workbook headers, such as Loans And Lending Adult 18 - Jan 2024,
+# which are removed to look up the header's field so the lookup holds for any year
+WORKBOOK_HEADER_YEAR_PATTERN = re.compile(r'\s+20\d\d\b')
+
+# The separators between an authority's alternative names, which may themselves contain ', '
+ALT_NAMES_SEPARATOR = re.compile(r',(?! )')
+
+# The XML namespaces of the parts of an XLSX workbook
+XLSX_MAIN = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+XLSX_RELATIONSHIPS = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+XLSX_DOCUMENT_RELATIONSHIPS = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+
+# The column letters of a cell reference such as AB12
+CELL_COLUMN_PATTERN = re.compile(r'^([A-Z]+)')
+
+# The lookups loaded from the reference data files. The population ages are each
+# authority's running totals of its population by single year of age.
+ReferenceData = namedtuple('ReferenceData', [
+    'library_services', 'population', 'nearest_neighbours', 'authorities', 'population_ages'])
+
+
+def workbook_header_key(header):
+    """Return a workbook header without its years, to look up the field it is exported as."""
+    return WORKBOOK_HEADER_YEAR_PATTERN.sub('', header).strip()
+
+
+def column_index(reference):
+    """Return the zero based column of a cell reference such as AB12."""
+    index = 0
+    for letter in CELL_COLUMN_PATTERN.match(reference).group(1):
+        index = index * 26 + ord(letter) - ord('A') + 1
+    return index - 1
+
+
+def xlsx_number_text(value):
+    """Write a numeric cell's value as a CSV export would, with whole numbers as integers."""
+    if value.lstrip('-').isdigit():
+        return value
+    number = float(value)
+    return str(int(number)) if number.is_integer() else value
+
+
+class XlsxDictReader:
+    """
+    Read a worksheet of an XLSX workbook as csv.DictReader reads a CSV file, as a dictionary
+    per row keyed by the header row. The worksheet XML is parsed incrementally from the zip
+    archive and each row is discarded once it has been read, so only the shared strings are
+    held in memory. The worksheet is the one named, or else the first with the key field
+    in a row, which is taken as the header row. Headers can be renamed with a mapping from
+    the header, with any years removed, to a field name. Empty rows are skipped.
+    """
+
+    def __init__(self, path, key_field=None, sheet=None, headers=None):
+        self.archive = zipfile.ZipFile(path)
+        self.shared_strings = self.read_shared_strings()
+        self.rows = None
+        self.fieldnames = None
+
+        sheets = self.worksheets()
+        if sheet is not None:
+            if sheet not in sheets:
+                raise ValueError(f"'{path}' has no worksheet named '{sheet}'.")
+            sheets = {sheet: sheets[sheet]}
+        for sheet_path in sheets.values():
+            rows = self.read_rows(sheet_path)
+            for values in rows:
+                if headers is not None:
+                    values = [headers.get(workbook_header_key(value), value) for value in values]
+                if key_field in values or (key_field is None and any(values)):
+                    while values and values[-1] == '':
+                        values.pop()
+                    self.rows = rows
+                    self.fieldnames = values
+                    break
+            if self.fieldnames is not None:
+                break
+            rows.close()
+        if self.fieldnames is None:
+            if key_field is None:
+                raise ValueError(f"'{path}' has no worksheet with a header row.")
+            raise ValueError(f"'{path}' has no worksheet with a '{key_field}' header.")
+
+    def worksheets(self):
+        """Return the path in the archive of each worksheet, by name in workbook order."""
+        targets = {}
+        for relationship in ElementTree.fromstring(self.archive.read('xl/_rels/workbook.xml.rels')):
+            target = relationship.get('Target')
+            targets[relationship.get('Id')] = target.lstrip('/') if target.startswith('/') else 'xl/' + target
+        workbook = ElementTree.fromstring(self.archive.read('xl/workbook.xml'))
+        return {sheet.get('name'): targets[sheet.get(f'{XLSX_DOCUMENT_RELATIONSHIPS}id')]
+                for sheet in workbook.iter(f'{XLSX_MAIN}sheet')}
+
+    def read_shared_strings(self):
+        """Return the workbook's table of shared strings, which cells refer to by index."""
+        if 'xl/sharedStrings.xml' not in self.archive.namelist():
+            return []
+        strings = []
+        with self.archive.open('xl/sharedStrings.xml') as f:
+            for _, element in ElementTree.iterparse(f):
+                if element.tag == f'{XLSX_MAIN}si':
+                    strings.append(''.join(text.text or '' for text in element.iter(f'{XLSX_MAIN}t')))
+                    element.clear()
+        return strings
+
+    def cell_text(self, cell):
+        """Return a cell's value as the text a CSV export would have."""
+        cell_type = cell.get('t')
+        if cell_type == 'inlineStr':
+            return ''.join(text.text or '' for text in cell.iter(f'{XLSX_MAIN}t'))
+        value = cell.find(f'{XLSX_MAIN}v')
+        if value is None or value.text is None:
+            return ''
+        if cell_type == 's':
+            return self.shared_strings[int(value.text)]
+        if cell_type == 'b':
+            return 'TRUE' if value.text == '1' else 'FALSE'
+        if cell_type in (None, 'n'):
+            return xlsx_number_text(value.text)
+        return value.text
+
+    def read_rows(self, sheet_path):
+        """Yield the values of each row of a worksheet as a list, with missing cells empty."""
+        with self.archive.open(sheet_path) as f:
+            sheet_data = None
+            for event, element in ElementTree.iterparse(f, events=('start', 'end')):
+                if event == 'start':
+                    if element.tag == f'{XLSX_MAIN}sheetData':
+                        sheet_data = element
+                    continue
+                if element.tag != f'{XLSX_MAIN}row':
+                    continue
+                values = []
+                for cell in element.iter(f'{XLSX_MAIN}c'):
+                    reference = cell.get('r')
+                    if reference is not None:
+                        values.extend([''] * (column_index(reference) - len(values)))
+                    values.append(self.cell_text(cell))
+                # Discard the rows read so far so the parsed tree stays small
+                sheet_data.clear()
+                yield values
+
+    def __iter__(self):
+        width = len(self.fieldnames)
+        for values in self.rows:
+            if not any(values):
+                continue
+            values.extend([''] * (width - len(values)))
+            yield dict(zip(self.fieldnames, values))
+
+    def close(self):
+        """Close the worksheet and the workbook archive."""
+        if self.rows is not None:
+            self.rows.close()
+        self.archive.close()
+
+
+def is_workbook(path):
+    """Return whether an input file is an XLSX workbook rather than a CSV file."""
+    return path.lower().endswith('.xlsx')
+
+
+@contextmanager
+def open_table(path, key_field=None, sheet=None, headers=None):
+    """
+    Open a table of an input file for reading as dictionaries, from a CSV file or from
+    an XLSX workbook, where the worksheet is found by its name or its key field header.
+    """
+    if is_workbook(path):
+        reader = XlsxDictReader(path, key_field, sheet, headers)
+        try:
+            yield reader
+        finally:
+            reader.close()
+    else:
+        with open(path, mode='r', newline='', encoding='utf-8-sig') as table_file:
+            yield csv.DictReader(table_file)
+
+
+def load_workbook_headers():
+    """Load the field that each activity workbook header, without its years, is exported as."""
+    with open(ACTIVITY_HEADERS, mode='r', newline='', encoding='utf-8') as headers_file:
+        return {row['Workbook header']: row['Field'] for row in csv.DictReader(headers_file)}
+
+
+def open_activity_data(path):
+    """
+    Open an annual activity data file, either the CSV export or the published workbook,
+    whose headers are renamed to the fields of the CSV export.
+    """
+    return open_table(path, ACTIVITY_KEY_FIELD, headers=load_workbook_headers() if is_workbook(path) else None)
+
+
+def age_column(header):
+    """Return the age of a population column such as '7' or '90+', or None if it is not an age."""
+    age = header[:-1] if header.endswith('+') else header
+    return int(age) if age.isdigit() else None
+
+
+def read_population_ages(population_file):
+    """
+    Read each authority's population by single year of age as running totals, starting at 0,
+    so that the population of any age band is the difference of two totals.
+    """
+    population_reader = csv.reader(population_file)
+    headers = next(population_reader)
+    code_column = headers.index('Code')
+    ages = sorted((age, column) for column, header in enumerate(headers)
+                  if (age := age_column(header)) is not None)
+    if [age for age, _ in ages] != list(range(len(ages))):
+        raise ValueError(f'{POPULATION} does not have a column for each single year of age from 0.')
+    age_columns = [column for _, column in ages]
+
+    return {row[code_column]: tuple(accumulate((int(row[column]) for column in age_columns), initial=0))
+            for row in population_reader}
+
+
+def band_population(totals, start=0, end=None):
+    """
+    Return the population aged from start to end inclusive, or start and over if end is None,
+    from an authority's running totals. The last age counts everyone of that age and over.
+    """
+    last = len(totals) - 1
+    return totals[last if end is None else min(end + 1, last)] - totals[min(start, last)]
+
+
+def population_bands(population_ages, codes, bands=AGE_BANDS):
+    """Return the population of each age band for each authority code, or 0 if it has none."""
+    return {code: {band: band_population(population_ages.get(code, (0,)), *ages) for band, ages in bands.items()}
+            for code in codes}
+
+
+def build_reference_data():
+    """
+    Build the reference lookups used to rotate the activity data from the reference files:
+    the english library services, population by age group, nearest neighbours, and the
+    authorities keyed by name.
+    """
+    library_services = None
+    # Read the library services json to create a dictionary of all english library services
+    with open(LIBRARY_SERVICES, mode='r', encoding='utf-8') as lib_services_file:
+        library_services_data = json.load(lib_services_file)
+        library_services = {service['code']: service for service in library_services_data if service['nation'] == 'England'}
+
+    with open(POPULATION, mode='r', newline='', encoding='utf-8-sig') as population_file, \
+            open(AUTHORITIES, mode='r', newline='', encoding='utf-8') as authorities_file, \
+            open_table(NEAREST_NEIGHBOURS, NEIGHBOURS_KEY_FIELD) as neighbours_reader:
+
+        # Create a lookup dictionary for population data, by age group of the services
+        population_ages = read_population_ages(population_file)
+        population = population_bands(
+            population_ages, population_ages,
+            {field: AGE_BANDS[band] for field, band in SERVICE_POPULATION_BANDS.items()})
+
+        # Create a lookup dictionary for nearest neighbours
+        nearest_neighbours = {}
+        for row in neighbours_reader:
+            authority_code = row['Upper tier local authority code']
+            neighbour_1 = row['Neighbour 1']
+            neighbour_2 = row['Neighbour 2']
+            neighbour_3 = row['Neighbour 3']
+            neighbour_4 = row['Neighbour 4']
+            neighbour_5 = row['Neighbour 5']
+            if authority_code not in nearest_neighbours:
+                nearest_neighbours[authority_code] = []
+            nearest_neighbours[authority_code].extend([neighbour_1, neighbour_2, neighbour_3, neighbour_4, neighbour_5])
+
+        # Create a lookup dictionary for authorities
+        authorities = {}
+        authorities_reader = csv.DictReader(authorities_file)
+        for authority_row in authorities_reader:
+            # If not a library service ignore
+            if authority_row['gss-code'] not in library_services:
+                continue
+            auth_object = {
+                'gss-code': authority_row['gss-code'],
+                'official-name': authority_row['official-name'],
+                'nice-name': authority_row['nice-name'],
+            }
+            # Add nice name and population to the library service
+            if authority_row['gss-code'] in library_services:
+                library_services[authority_row['gss-code']]['nice-name'] = authority_row['nice-name']
+                library_services[authority_row['gss-code']]['population'] = population.get(
+                    authority_row['gss-code'], {'under_12': 0, '12_17': 0, 'adult': 0, 'unknown': 0})
+
+            # Add nearest neighbours to the library service
+            if authority_row['gss-code'] in nearest_neighbours:
+                library_services[authority_row['gss-code']]['nearest_neighbours'] = nearest_neighbours[authority_row['gss-code']]
+
+            # Use both official name and nice name as keys for lookup
+            authorities[authority_row['nice-name']] = auth_object
+            authorities[authority_row['official-name']] = auth_object
+
+            # Other spellings, such as those in the published workbook, are matched in lower case
+            names = [authority_row['nice-name'], authority_row['official-name'],
+                     *ALT_NAMES_SEPARATOR.split(authority_row['alt-names'])]
+            for name in names:
+                if name:
+                    authorities.setdefault(name.lower(), auth_object)
+
+    return ReferenceData(library_services, population, nearest_neighbours, authorities, population_ages)
+
+
+def load_reference_data(use_cache=True):
+    """
+    Load the reference lookups, from the cached snapshot if the reference files have not
+    changed since it was taken. Otherwise the lookups are built from the files and the
+    snapshot is refreshed. Other scripts can use this to share the lookups.
+    """
+    if not use_cache:
+        return build_reference_data()
+
+    sources = {path: file_hash(path) for path in REFERENCE_INPUTS}
+    if os.path.exists(REFERENCE_CACHE):
+        try:
+            with open(REFERENCE_CACHE, 'rb') as cache_file:
+                snapshot = pickle.load(cache_file)
+            if snapshot['version'] == REFERENCE_CACHE_VERSION and snapshot['sources'] == sources:
+                return ReferenceData(*snapshot['lookups'])
+        except (OSError, EOFError, KeyError, TypeError, pickle.UnpicklingError):
+            # An unreadable snapshot is simply rebuilt
+            pass
+
+    reference = build_reference_data()
+
+    # The lookups are stored as a plain tuple so the snapshot does not depend on this module
+    snapshot = {'version': REFERENCE_CACHE_VERSION, 'sources': sources, 'lookups': tuple(reference)}
+    temporary_path = REFERENCE_CACHE + '.tmp'
+    with open(temporary_path, 'wb') as cache_file:
+        pickle.dump(snapshot, cache_file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temporary_path, REFERENCE_CACHE)
+
+    return reference
+
+
+def read_json_dataset(path):
+    """Read a JSON dataset in the rows or columnar format as a list of row values."""
+    with open(path, mode='r', encoding='utf-8') as f:
+        data = json.load(f)
+    if isinstance(data, list):
+        return data
+    columns = [[dictionary[code] for code in column] if (dictionary := data['dictionaries'].get(field)) else column
+               for field, column in zip(data['fields'], data['columns'])]
+    return [list(row) for row in zip(*columns)]
+
+
+def file_hash(path):
+    """Return the SHA-256 hex digest of a file's content, or None if it does not exist."""
+    if not os.path.exists(path):
+        return None
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
@@ -0,0 +1,142 @@
+"""
+The run report of each rotation, timing, counting and profiling its stages.
+"""
+
+import json
+import os
+import platform
+import sys
+from collections import Counter, defaultdict
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timezone
+from time import perf_counter
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from .schema import PERIOD_FREQUENCIES, RUN_REPORTS
+
+# The number of functions and allocation sites listed in the profile reports
+PROFILE_LIMIT = 40
+
+
+def peak_rss_kb():
+    """Return the peak resident set size of this process in KB, if it can be measured."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes rather than KB
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+class RunReport:
+    """
+    Collect the instrumentation of a run for the run report: the seconds spent in each
+    stage, counters such as the rows read and skipped, the records of each measure by
+    reporting frequency, and the synthetic months created, and the peak memory.
+    A stage can be timed many times, and its times are added together. Stages can be
+    nested, as each measure's normalisation is part of the row rotation.
+    """
+
+    def __init__(self):
+        self.started = datetime.now(timezone.utc)
+        self.start = perf_counter()
+        self.stages = defaultdict(float)
+        self.counters = defaultdict(Counter)
+        self.frequencies = defaultdict(Counter)
+        self.details = {}
+
+    @contextmanager
+    def stage(self, name):
+        """Time a stage of the run."""
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] += perf_counter() - start
+
+    def timed(self, name, iterable):
+        """Yield the items of an iterable, timing the work of producing them as a stage."""
+        iterator = iter(iterable)
+        while True:
+            start = perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self.stages[name] += perf_counter() - start
+            yield item
+
+    def count(self, counter, key, amount=1):
+        """Add to a counter."""
+        self.counters[counter][key] += amount
+
+    def count_records(self, measure, records):
+        """Count a measure's rotated records, in total and by their reporting frequency."""
+        self.counters['records'][measure] += len(records)
+        self.frequencies[measure].update(
+            PERIOD_FREQUENCIES.get(record.period.rpartition('/')[2], 'other') for record in records)
+
+    def to_json(self):
+        """Return the report, with the throughput of the run."""
+        total_seconds = perf_counter() - self.start
+        rows = self.counters['rows']
+        if 'read' in rows:
+            rows['skipped'] = rows['read'] - rows['rotated']
+        return {
+            'started': self.started.isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            **self.details,
+            'total_seconds': round(total_seconds, 6),
+            'rows_per_second': round(rows['read'] / total_seconds, 2) if rows['read'] and total_seconds else None,
+            'stages': {name: round(seconds, 6) for name, seconds in self.stages.items()},
+            'counters': {name: dict(counts) for name, counts in self.counters.items()},
+            'frequencies': {measure: dict(counts) for measure, counts in self.frequencies.items()},
+            'peak_rss_kb': peak_rss_kb()
+        }
+
+
+def report_stage(report, name):
+    """Time a stage if the run is being reported on, or do nothing."""
+    return report.stage(name) if report is not None else nullcontext()
+
+
+class CountingReader:
+    """Wrap a table reader to count the rows read from it for a run report."""
+
+    def __init__(self, reader, report):
+        self.reader = reader
+        self.fieldnames = reader.fieldnames
+        self.report = report
+
+    def __iter__(self):
+        for row in self.reader:
+            self.report.count('rows', 'read')
+            yield row
+
+
+def write_run_report(report, path=RUN_REPORTS):
+    """Append a run's report to the file of run reports, so runs can be compared."""
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(report.to_json()) + '\n')
+
+
+def write_profile(profile, snapshot, directory):
+    """
+    Write the reports of a profiled run to a directory: the cProfile statistics, to load
+    with pstats or a viewer, the functions with the most cumulative time, and the
+    allocation sites holding the most memory in a tracemalloc snapshot at the end of the run.
+    """
+    import pstats
+
+    os.makedirs(directory, exist_ok=True)
+    profile.dump_stats(os.path.join(directory, 'rotate.pstats'))
+    with open(os.path.join(directory, 'rotate_profile.txt'), 'w', encoding='utf-8') as f:
+        pstats.Stats(profile, stream=f).sort_stats('cumulative').print_stats(PROFILE_LIMIT)
+    with open(os.path.join(directory, 'rotate_memory.txt'), 'w', encoding='utf-8') as f:
+        for statistic in snapshot.statistics('lineno')[:PROFILE_LIMIT]:
+            f.write(f'{statistic}\n')
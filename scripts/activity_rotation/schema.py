@@ -0,0 +1,436 @@
+"""
+The inputs and outputs of the rotation, the schema of each measure, and how the activity data headers
+and financial years are recognised.
+"""
+
+import os
+import re
+from collections import namedtuple
+
+LIBRARY_DATA = './data/libraries_activity_data_2023_2024.csv'
+POPULATION = './data/mye24tablesew.csv'
+AUTHORITIES = './data/uk_local_authorities.csv'
+LIBRARY_SERVICES = './data/library_authorities.json'
+NEAREST_NEIGHBOURS = './data/localauthoritynearestneighboursengland.csv'
+ACTIVITY_HEADERS = './data/activity_data_headers.csv'
+
+SERVICES = './data/services.csv'
+LOANS = './data/loans.csv'
+USERS = './data/users.csv'
+VISITS = './data/visits.csv'
+EVENTS = './data/events.csv'
+ATTENDANCE = './data/event_attendance.csv'
+COMPUTER_USAGE = './data/computers.csv'
+WIFI_SESSIONS = './data/wifi.csv'
+CLICK_COLLECT = './data/click_and_collect.csv'
+
+SERVICES_JSON = './public/services.json'
+LOANS_JSON = './public/loans.json'
+USERS_JSON = './public/users.json'
+VISITS_JSON = './public/visits.json'
+EVENTS_JSON = './public/events.json'
+ATTENDANCE_JSON = './public/attendance.json'
+COMPUTER_USAGE_JSON = './public/computers.json'
+WIFI_SESSIONS_JSON = './public/wifi.json'
+
+# Totals of each measure precomputed for the dashboard charts
+ROLLUPS_JSON = './public/rollups.json'
+
+# Each authority's published rows of every measure, and a summary of the shards
+AUTHORITY_SHARDS = './public/authorities'
+AUTHORITY_SUMMARY = './public/summary.json'
+
+# Each authority's rates per 1,000 population compared with its nearest neighbours, and
+# the authorities that list each authority as a neighbour
+COMPARISONS = './data/comparisons.csv'
+COMPARISONS_JSON = './public/comparisons.json'
+NEIGHBOUR_INDEX_JSON = './public/neighbour_index.json'
+
+# The population of each library service in each age band, the denominators of per capita rates
+POPULATION_BANDS = './data/population_bands.csv'
+
+# Each measure exported as Arrow IPC and Parquet files for analysts
+ARROW_DIRECTORY = './data/arrow'
+
+# A SQLite database of the services and the published records of every measure
+DATABASE = './data/library_activity.sqlite'
+
+# Records the inputs that the outputs were last built from
+BUILD_STATE = './.rotate_build_state.json'
+
+# A snapshot of the reference lookups, reused while the reference files are unchanged.
+# Bump the version when the way the lookups are built changes.
+REFERENCE_CACHE = './.reference_data.pickle'
+REFERENCE_CACHE_VERSION = 3
+
+# The report of each run's stage timings, counters and memory, one JSON object per line
+RUN_REPORTS = './rotate_run_reports.jsonl'
+
+# The reporting frequency of a record, from its period's duration
+PERIOD_FREQUENCIES = {'P1M': 'monthly', 'P3M': 'quarterly', 'P1Y': 'yearly'}
+
+# Maps each JSON dataset to the hash of its content, which the dashboard caches it by,
+# and to its content hashed and precompressed copies if they have been published
+DATASETS_MANIFEST = './public/datasets.json'
+HASH_LENGTH = 12
+
+# Each dataset published as one immutable partition per financial year, and the index of
+# each dataset's partitions. Publishing a year adds or replaces only that year's partition.
+PARTITIONS_DIRECTORY = './public/years'
+PARTITIONS_INDEX = './public/partitions.json'
+
+# The output schema of each measure. Authority is always first and Count always last.
+MEASURE_FIELDS = {
+    'users': ['Authority', 'Period', 'Age group', 'Count'],
+    'events': ['Authority', 'Event type', 'Age group', 'Period', 'Count'],
+    'attendance': ['Authority', 'Event type', 'Age group', 'Period', 'Count'],
+    'loans': ['Authority', 'Format', 'Content age group', 'Period', 'Count'],
+    'click_collect': ['Authority', 'Period', 'Count'],
+    'visits': ['Authority', 'Location', 'Period', 'Count'],
+    'computer_usage': ['Authority', 'Period', 'Count'],
+    'wifi_sessions': ['Authority', 'Period', 'Count']
+}
+
+# The record of each measure, with its fields in output order. Records are written to the
+# CSV and JSON outputs as they are, so these are the outputs' schemas.
+UsersRecord = namedtuple('UsersRecord', ['authority', 'period', 'age_group', 'count'])
+EventsRecord = namedtuple('EventsRecord', ['authority', 'event_type', 'age_group', 'period', 'count'])
+AttendanceRecord = namedtuple('AttendanceRecord', ['authority', 'event_type', 'age_group', 'period', 'count'])
+LoansRecord = namedtuple('LoansRecord', ['authority', 'format', 'content_age_group', 'period', 'count'])
+ClickCollectRecord = namedtuple('ClickCollectRecord', ['authority', 'period', 'count'])
+VisitsRecord = namedtuple('VisitsRecord', ['authority', 'location', 'period', 'count'])
+ComputerUsageRecord = namedtuple('ComputerUsageRecord', ['authority', 'period', 'count'])
+WifiSessionsRecord = namedtuple('WifiSessionsRecord', ['authority', 'period', 'count'])
+
+MEASURE_RECORDS = {
+    'users': UsersRecord,
+    'events': EventsRecord,
+    'attendance': AttendanceRecord,
+    'loans': LoansRecord,
+    'click_collect': ClickCollectRecord,
+    'visits': VisitsRecord,
+    'computer_usage': ComputerUsageRecord,
+    'wifi_sessions': WifiSessionsRecord
+}
+
+# The position of the period in each record type
+PERIOD_INDEXES = {record_type: record_type._fields.index('period') for record_type in MEASURE_RECORDS.values()}
+
+# The CSV and JSON output files of each measure. Click and collect is not published as JSON.
+MEASURE_OUTPUTS = {
+    'users': (USERS, USERS_JSON),
+    'events': (EVENTS, EVENTS_JSON),
+    'attendance': (ATTENDANCE, ATTENDANCE_JSON),
+    'loans': (LOANS, LOANS_JSON),
+    'click_collect': (CLICK_COLLECT, None),
+    'visits': (VISITS, VISITS_JSON),
+    'computer_usage': (COMPUTER_USAGE, COMPUTER_USAGE_JSON),
+    'wifi_sessions': (WIFI_SESSIONS, WIFI_SESSIONS_JSON)
+}
+
+INPUTS = [LIBRARY_DATA, POPULATION, AUTHORITIES, LIBRARY_SERVICES, NEAREST_NEIGHBOURS, ACTIVITY_HEADERS]
+REFERENCE_INPUTS = [LIBRARY_SERVICES, POPULATION, AUTHORITIES, NEAREST_NEIGHBOURS]
+
+JSON_OUTPUTS = [SERVICES_JSON] + [json_path for _, json_path in MEASURE_OUTPUTS.values() if json_path]
+
+# The JSON datasets listed in the manifest
+MANIFEST_DATASETS = JSON_OUTPUTS + [ROLLUPS_JSON, AUTHORITY_SUMMARY, COMPARISONS_JSON, NEIGHBOUR_INDEX_JSON]
+
+# The kinds of output that can be selected, and the kind of each output that is not a single measure's
+OUTPUT_KINDS = ('csv', 'json')
+COMBINED_OUTPUT_KINDS = {
+    POPULATION_BANDS: 'csv',
+    ROLLUPS_JSON: 'json',
+    AUTHORITY_SUMMARY: 'json',
+    COMPARISONS: 'csv',
+    COMPARISONS_JSON: 'json',
+    NEIGHBOUR_INDEX_JSON: 'json'
+}
+
+# The fields that are a measure's dimensions, rather than its authority, period or count
+MEASURE_DIMENSIONS = {
+    measure: [field for field in fields if field not in ('Authority', 'Period', 'Count')]
+    for measure, fields in MEASURE_FIELDS.items()
+}
+
+# The record fields of the dimensions that each measure's periods are normalised within
+MEASURE_GROUPS = {
+    'events': ('event_type', 'age_group'),
+    'attendance': ('event_type', 'age_group'),
+    'loans': ('format', 'content_age_group'),
+    'visits': ('location',),
+    'click_collect': (),
+    'computer_usage': (),
+    'wifi_sessions': ()
+}
+
+SERVICE_FIELDS = ['Authority code', 'Authority nice name', 'Library service',
+                  'Period', 'Users', 'Events', 'Attendance', 'Loans', 'Visits',
+                  'Computer hours', 'Wifi sessions', 'Population under 12',
+                  'Population 12-17', 'Population adult', 'Nearest neighbour 1',
+                  'Nearest neighbour 2', 'Nearest neighbour 3',
+                  'Nearest neighbour 4', 'Nearest neighbour 5']
+
+# The services fields that total a measure
+SERVICE_MEASURES = {
+    'Users': 'users',
+    'Events': 'events',
+    'Attendance': 'attendance',
+    'Loans': 'loans',
+    'Visits': 'visits',
+    'Computer hours': 'computer_usage',
+    'Wifi sessions': 'wifi_sessions'
+}
+
+# The field of each measure that is the age group of its counts
+MEASURE_AGE_GROUPS = {
+    'users': 'Age group',
+    'events': 'Age group',
+    'attendance': 'Age group',
+    'loans': 'Content age group'
+}
+
+# The age groups of the activity data that are compared, each by its rate per 1,000 of the
+# population of the age band of the same name
+COMPARISON_AGE_GROUPS = ['Under 12', '12-17', 'Adult']
+
+# Age bands by their first and last single year of age, or None for that age and over.
+# The population file's last column counts everyone of 90 and over.
+AGE_BANDS = {
+    'Under 5': (0, 4),
+    '5-11': (5, 11),
+    'Under 12': (0, 11),
+    '12-17': (12, 17),
+    '16-24': (16, 24),
+    'Adult': (18, None),
+    '65+': (65, None),
+    'Total': (0, None)
+}
+
+# The age band of each population of a library service
+SERVICE_POPULATION_BANDS = {
+    'under_12': 'Under 12',
+    '12_17': '12-17',
+    'adult': 'Adult'
+}
+
+POPULATION_BAND_FIELDS = ['Authority', 'Age band', 'From age', 'To age', 'Population']
+
+COMPARISON_FIELDS = ['Authority', 'Measure', 'Age group', 'Count', 'Population', 'Rate per 1,000',
+                     'Neighbour median', 'Neighbour mean', 'Rank', 'Group size']
+
+# The database tables that dictionary encode each categorical field
+DATABASE_DICTIONARIES = {
+    'Authority': 'authorities',
+    'Event type': 'event_types',
+    'Age group': 'age_groups',
+    'Content age group': 'age_groups',
+    'Format': 'formats',
+    'Location': 'locations'
+}
+
+# Fields that are dictionary encoded in the columnar JSON format
+CATEGORICAL_FIELDS = ('Authority', 'Event type', 'Age group', 'Content age group',
+                      'Format', 'Location', 'Period', 'Measure')
+
+# Fields that are dictionary encoded in the Arrow and Parquet exports
+ARROW_CATEGORICAL_FIELDS = CATEGORICAL_FIELDS + ('Financial year',)
+
+# Month names as they appear in the activity data headers, in header matching order
+HEADER_MONTHS = [
+    ('april', 4), ('may', 5), ('june', 6), ('july', 7), ('august', 8), ('september', 9),
+    ('october', 10), ('november', 11), ('december', 12), ('january', 1), ('february', 2),
+    ('march', 3)
+]
+
+# The year of activity data filenames such as libraries_activity_data_2023_2024.csv,
+# or of workbooks such as Libraries Activity Data 2023-24 FINAL.xlsx
+FILENAME_YEAR_PATTERN = re.compile(r'(\d{4})[_-](\d{4}|\d{2})(?!\d)')
+
+# A financial year, from April to March, and how its periods are written
+FinancialYear = namedtuple('FinancialYear', [
+    'start', 'label', 'period', 'month_starts', 'quarter_ends'])
+
+# A single activity data column, classified once from its header
+ColumnDescriptor = namedtuple('ColumnDescriptor', [
+    'header', 'measure', 'event_type', 'format', 'location', 'age_group', 'period',
+    'guard', 'digits_only', 'values'])
+
+
+def financial_year(start):
+    """Describe the financial year starting in April of the given year."""
+    month_starts = {}
+    for month, number in HEADER_MONTHS:
+        year = start if number >= 4 else start + 1
+        month_starts[month] = f"{year}-{number:02d}-01"
+    return FinancialYear(
+        start=start,
+        label=f"{start}/{start + 1}",
+        period=f"{start}-04-01/P1Y",
+        month_starts=month_starts,
+        quarter_ends=(f"{start}-06-01", f"{start}-09-01", f"{start}-12-01", f"{start + 1}-03-01"))
+
+
+def financial_year_from_filename(path):
+    """Derive the financial year of an activity data file from its name, or None if it has none."""
+    match = FILENAME_YEAR_PATTERN.search(os.path.basename(path))
+    if match is None:
+        return None
+    start, end = int(match.group(1)), match.group(2)
+    # The end year may be written in full or as its last two digits
+    if (int(end) if len(end) == 4 else start // 100 * 100 + int(end)) != start + 1:
+        return None
+    return financial_year(start)
+
+
+def classify_header(header, year):
+    """
+    Classify an activity data header into a column descriptor for the financial year.
+    Returns None if the column is not part of any measure.
+    The guard is a tuple of columns that must all be empty for the column to be recorded,
+    which is how totals are only used when there is no breakdown.
+    """
+    # Month is a common aspect of the header name e.g. 'september'.
+    period_start = None
+    for month, _ in HEADER_MONTHS:
+        if month in header:
+            period_start = year.month_starts[month]
+            break
+
+    # Age group is common in the header e.g. 'adults', '11_under', '12_17', 'all_ages'
+    age_group = None
+    if 'adult' in header:
+        age_group = 'Adult'
+    elif '11_under' in header:
+        age_group = 'Under 12'
+    elif '12_17' in header:
+        age_group = '12-17'
+    elif 'all_ages' in header:
+        age_group = 'All ages'
+
+    physical_digital = None
+    if 'physical' in header:
+        physical_digital = 'Physical'
+    elif 'digital' in header:
+        physical_digital = 'Digital'
+
+    # Formats are Physical book, Physical audiobook, Ebook, Eaudio
+    format_type = 'Physical book'
+    if '_digital' in header or 'physical_audiobook' in header:
+        format_type = 'Physical audiobook'
+    elif 'ebook' in header:
+        format_type = 'Ebook'
+    elif 'digital_audiobook' in header:
+        format_type = 'Eaudio'
+
+    measure = None
+    event_type = None
+    loan_format = None
+    location = None
+    period = period_start
+    guard = ()
+    digits_only = False
+
+    if header.startswith('active_members'):
+        measure, period, digits_only = 'users', year.period, True
+    elif header.startswith('total_active_members'):
+        # We record the total users IF there is no data for the individual age groups.
+        measure, period, digits_only = 'users', year.period, True
+        age_group = 'Unknown'
+        guard = ('active_members_11_under', 'active_members_adults', 'active_members_12_17')
+    elif header.startswith('physical_events') or header.startswith('digital_events'):
+        measure, event_type = 'events', physical_digital
+    elif header.startswith('total_physical_events'):
+        measure, event_type, age_group = 'events', physical_digital, 'Unknown'
+        guard = ('physical_events_march',)
+    elif header.startswith('total_digital_events'):
+        measure, event_type, age_group = 'events', physical_digital, 'Unknown'
+        guard = ('digital_events_march',)
+    elif header.startswith('physical_attendees') or header.startswith('digital_attendees'):
+        measure, event_type = 'attendance', physical_digital
+    elif header.startswith('total_attendees_physical_events'):
+        measure, event_type, age_group = 'attendance', physical_digital, 'Unknown'
+        guard = ('physical_attendees_march',)
+    elif header.startswith('total_attendees_digital_events'):
+        measure, event_type, age_group = 'attendance', physical_digital, 'Unknown'
+        guard = ('digital_attendees_march',)
+    elif header.startswith('click_and_collect'):
+        measure = 'click_collect'
+    elif header.startswith('loans_') or header.startswith('ebooks_') or \
+            header.startswith('digital_audiobook_issues_'):
+        measure, loan_format = 'loans', format_type
+    elif header.startswith('total_physical_book_issues'):
+        measure, loan_format, age_group = 'loans', format_type, 'Unknown'
+        guard = ('loans_adult_march',)
+    elif header.startswith('total_physical_audiobook_issues'):
+        measure, loan_format, age_group = 'loans', format_type, 'Unknown'
+        guard = ('loans_adult_march_digital',)
+    elif header.startswith('total_ebook_issues'):
+        measure, loan_format, age_group = 'loans', format_type, 'Unknown'
+        guard = ('ebooks_adult_march',)
+    elif header.startswith('total_digital_audiobook_issues'):
+        measure, loan_format, age_group = 'loans', format_type, 'Unknown'
+        guard = ('digital_audiobook_issues_adult_march',)
+    elif header.startswith('physical_visits'):
+        measure = 'visits'
+        location = 'Shared building' if 'no_colocation' in header else 'Library'
+    elif header.startswith('mobile_libraries'):
+        measure, location = 'visits', 'Mobile library'
+    elif header.startswith('home_delivery'):
+        measure, location = 'visits', 'Home delivery'
+    elif header.startswith('hours_public_computers'):
+        measure = 'computer_usage'
+    elif header.startswith('wifi_sessions'):
+        measure = 'wifi_sessions'
+
+    if measure is None:
+        return None
+
+    # The static part of each record in output field order, between Authority and Count
+    values = {
+        'Period': period,
+        'Age group': age_group,
+        'Content age group': age_group,
+        'Event type': event_type,
+        'Format': loan_format,
+        'Location': location
+    }
+    record_values = tuple(values[field] for field in MEASURE_FIELDS[measure][1:-1])
+
+    return ColumnDescriptor(header, measure, event_type, loan_format, location, age_group,
+                            period, guard, digits_only, record_values)
+
+
+def compile_header_schema(headers, year, measures=None):
+    """
+    Compile the activity data headers for a financial year into a list of column descriptors,
+    in column order.
+    Columns that are not part of a measure are dropped, as are totals guarded by a column
+    that does not exist in the data (those could never be recorded). If a set of measures is
+    given, the columns of other measures are dropped too, so they are never parsed.
+    """
+    header_set = set(headers)
+    schema = []
+    for header in headers:
+        column = classify_header(header, year)
+        if column is None or (measures is not None and column.measure not in measures):
+            continue
+        if any(guard_column not in header_set for guard_column in column.guard):
+            continue
+        schema.append(column)
+    return schema
+
+
+def resolve_financial_year(path, start=None):
+    """Return the financial year of an activity data file, given explicitly or derived from its name."""
+    if start is not None:
+        return financial_year(start)
+    year = financial_year_from_filename(path)
+    if year is None:
+        raise ValueError(f"The financial year of '{path}' can't be derived from its name, please give it.")
+    return year
+
+
+def dataset_name(json_path):
+    """Return the name the dashboard uses for a JSON dataset, its file name without .json"""
+    return os.path.basename(json_path)[:-len('.json')]
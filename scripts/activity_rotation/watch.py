@@ -0,0 +1,238 @@
+"""
+Watch mode, rebuilding the outputs whenever the inputs change.
+"""
+
+import csv
+import os
+import sqlite3
+import zipfile
+from collections import defaultdict
+from operator import attrgetter, itemgetter
+from time import perf_counter, sleep
+
+from .build_state import input_fingerprints, load_build_state, outdated_outputs, save_build_state
+from .conversion import missing_services, rotate_authority_row
+from .pipeline import write_outputs
+from .publish import built_partitions, publish_datasets, publish_partitions, write_datasets_manifest
+from .reading import load_reference_data, open_activity_data
+from .report import RunReport, write_run_report
+from .schema import (
+    ACTIVITY_HEADERS, AUTHORITY_SUMMARY, COMPARISONS, COMPARISONS_JSON, DATABASE, INPUTS, LIBRARY_DATA,
+    MEASURE_AGE_GROUPS, MEASURE_FIELDS, MEASURE_OUTPUTS, NEIGHBOUR_INDEX_JSON, POPULATION_BANDS, REFERENCE_INPUTS,
+    ROLLUPS_JSON, RUN_REPORTS, SERVICES, SERVICES_JSON, compile_header_schema)
+from .writers import measure_csv_paths, write_arrow_datasets
+
+# How often watch mode checks the inputs for changes, in seconds
+WATCH_INTERVAL = 0.25
+
+
+def changed_authorities(previous, current, authority):
+    """
+    Return the authorities whose items differ between two lists of items, given a function
+    returning an item's authority. Each authority's items are compared in order.
+    """
+    by_authority = []
+    for items in (previous, current):
+        grouped = defaultdict(list)
+        for item in items:
+            grouped[authority(item)].append(item)
+        by_authority.append(grouped)
+    before, after = by_authority
+    return {code for code in before.keys() | after.keys() if before.get(code) != after.get(code)}
+
+
+class ActivityWatcher:
+    """
+    Rebuild the outputs whenever the inputs change, keeping the reference lookups and the
+    rotation of each activity row in memory between builds. Only the rows that have changed
+    are rotated again, and only the outputs whose content depends on them are rewritten.
+    If a set of selected outputs is given, only those outputs are kept up to date.
+    """
+
+    def __init__(self, activity_path, year, json_format='rows', selection=None, use_cache=True,
+                 publish=False, report_path=RUN_REPORTS, arrow=False):
+        self.activity_path = activity_path
+        self.year = year
+        self.json_format = json_format
+        self.selection = selection
+        self.use_cache = use_cache
+        self.publish = publish
+        self.report_path = report_path
+        self.arrow = arrow
+        self.paths = [activity_path if path == LIBRARY_DATA else path for path in INPUTS]
+        self.reference = None
+        self.fieldnames = None
+        self.rotated_rows = {}
+        self.services = None
+        self.records = None
+
+    def input_states(self):
+        """Return the modification time and size of each input, or None if it is missing."""
+        states = {}
+        for path in self.paths:
+            try:
+                stat = os.stat(path)
+                states[path] = (stat.st_mtime_ns, stat.st_size)
+            except FileNotFoundError:
+                states[path] = None
+        return states
+
+    def rotate(self, report):
+        """
+        Rotate the activity data, reusing the rotation of any row that is unchanged since the
+        last build. Returns the services and each measure's records, as rotate_year does.
+        """
+        services = []
+        records = {measure: [] for measure in MEASURE_FIELDS}
+        rotated_rows = {}
+        with open_activity_data(self.activity_path) as activity_reader:
+            # Rows are remembered by their values, which only mean the same with the same headers
+            if activity_reader.fieldnames != self.fieldnames:
+                self.rotated_rows = {}
+            schema = compile_header_schema(activity_reader.fieldnames, self.year)
+            for row in activity_reader:
+                report.count('rows', 'read')
+                key = tuple(row.values())
+                if key not in rotated_rows:
+                    if key in self.rotated_rows:
+                        rotated_rows[key] = self.rotated_rows[key]
+                        report.count('watch', 'reused')
+                    else:
+                        rotated_rows[key] = rotate_authority_row(row, schema, self.reference, self.year, report)
+                        report.count('watch', 'rotated')
+                if rotated_rows[key] is None:
+                    continue
+                service, authority_records = rotated_rows[key]
+                report.count('rows', 'rotated')
+                services.append(service)
+                for measure, measure_records in authority_records.items():
+                    records[measure].extend(measure_records)
+            self.fieldnames = activity_reader.fieldnames
+        self.rotated_rows = rotated_rows
+
+        existing_codes = {service['Authority code'] for service in services}
+        services.extend(missing_services(self.reference.library_services, existing_codes, self.year))
+        return services, records
+
+    def changes(self, services, records):
+        """
+        Return the authorities whose records of each measure, or services, have changed since
+        the last build, by measure (or 'services'). Measures that are unchanged are left out,
+        and a measure whose records have only been reordered has no changed authorities.
+        """
+        changes = {}
+        for measure, measure_records in records.items():
+            if measure_records != self.records[measure]:
+                changes[measure] = changed_authorities(self.records[measure], measure_records,
+                                                       attrgetter('authority'))
+        if services != self.services:
+            changes['services'] = changed_authorities(self.services, services, itemgetter('Authority code'))
+        return changes
+
+    def changed_outputs(self, changes, reference_changed):
+        """
+        Return the outputs whose content depends on the services or records that changed.
+        The comparisons only depend on the services and the measures counted by age group.
+        """
+        outputs = set()
+        for measure, (csv_path, json_path) in MEASURE_OUTPUTS.items():
+            if measure in changes:
+                outputs.update(path for path in (csv_path, json_path) if path is not None)
+        if 'services' in changes:
+            outputs.update((SERVICES, SERVICES_JSON))
+        if any(measure in changes for measure, (_, json_path) in MEASURE_OUTPUTS.items() if json_path is not None):
+            outputs.update((ROLLUPS_JSON, AUTHORITY_SUMMARY))
+        if 'services' in changes or any(measure in changes for measure in MEASURE_AGE_GROUPS):
+            outputs.update((COMPARISONS, COMPARISONS_JSON, NEIGHBOUR_INDEX_JSON))
+        if changes:
+            outputs.add(DATABASE)
+        if reference_changed:
+            outputs.add(POPULATION_BANDS)
+        return outputs
+
+    def build(self, changed_paths=None):
+        """
+        Rebuild the outputs after the given input paths have changed. The first build
+        rebuilds the outputs that are out of date with the recorded build state.
+        """
+        report = RunReport()
+        report.details['options'] = {
+            'mode': 'watch',
+            'json_format': self.json_format,
+            'inputs': [self.activity_path],
+            'changed': sorted(changed_paths or [])
+        }
+        report.details['years'] = [self.year.label]
+
+        reference_changed = self.reference is None or bool(set(changed_paths or ()) & set(REFERENCE_INPUTS))
+        if reference_changed:
+            with report.stage('reference_loading'):
+                self.reference = load_reference_data(self.use_cache)
+        if reference_changed or ACTIVITY_HEADERS in (changed_paths or ()):
+            self.rotated_rows = {}
+        with report.stage('row_rotation'):
+            services, records = self.rotate(report)
+
+        fingerprints = input_fingerprints(self.json_format, self.year, self.activity_path)
+        changes = None
+        if self.records is None:
+            outputs = outdated_outputs(load_build_state(), fingerprints)
+        else:
+            changes = self.changes(services, records)
+            outputs = self.changed_outputs(changes, reference_changed)
+            # The reference data can change any authority's outputs, so those combining
+            # every authority are rewritten rather than updated
+            if reference_changed:
+                changes = None
+        if self.selection is not None:
+            outputs &= self.selection
+        self.services, self.records = services, records
+        report.details['fingerprints'] = fingerprints
+        report.details['outputs'] = sorted(outputs)
+
+        if outputs:
+            write_outputs(self.reference, services, records, self.year, self.json_format, outputs, report=report,
+                          changes=changes)
+        # The outputs that were not rewritten still have the same content, so all of the
+        # watched outputs are up to date with the current inputs. The state is saved before
+        # publishing, as the partitions are checked against it.
+        save_build_state(fingerprints, self.selection)
+        if outputs and self.publish:
+            with report.stage('publish'):
+                publish_datasets()
+                publish_partitions(self.year, built_partitions(self.year))
+        if outputs:
+            write_datasets_manifest()
+        if outputs and self.arrow:
+            with report.stage('arrow'):
+                write_arrow_datasets([path for path in measure_csv_paths() if path in outputs])
+        write_run_report(report, self.report_path)
+
+        watch = report.counters['watch']
+        print(f"Rebuilt {len(outputs)} outputs in {perf_counter() - report.start:.2f}s, "
+              f"rotating {watch['rotated']} of {watch['rotated'] + watch['reused']} rows.")
+
+    def watch(self, interval=WATCH_INTERVAL):
+        """Build, then rebuild whenever an input changes, until interrupted."""
+        states = self.input_states()
+        self.build()
+        print(f"Watching {', '.join(self.paths)} for changes.")
+        while True:
+            sleep(interval)
+            current = self.input_states()
+            if current == states:
+                continue
+            # Wait for the inputs to settle, as a file may be saved in several writes
+            while True:
+                sleep(interval)
+                settled = self.input_states()
+                if settled == current:
+                    break
+                current = settled
+            changed = {path for path in self.paths if current[path] != states[path]}
+            states = current
+            try:
+                self.build(changed)
+            except (OSError, ValueError, KeyError, csv.Error, zipfile.BadZipFile, sqlite3.Error) as error:
+                # The inputs may be part way through being corrected, so keep watching
+                print(f'Could not rebuild the outputs: {error}')
@@ -0,0 +1,727 @@
+"""
+The writers of each kind of output: CSV and JSON files, rollups, per-authority shards, the SQLite
+database, comparisons, population bands and the Arrow and Parquet exports.
+"""
+
+import csv
+import hashlib
+import json
+import os
+import re
+import shutil
+import sqlite3
+import statistics
+import tempfile
+from collections import Counter, defaultdict
+
+from .reading import population_bands
+from .schema import (
+    AGE_BANDS, ARROW_CATEGORICAL_FIELDS, ARROW_DIRECTORY, AUTHORITY_SHARDS, AUTHORITY_SUMMARY, CATEGORICAL_FIELDS,
+    COMPARISONS, COMPARISONS_JSON, COMPARISON_AGE_GROUPS, COMPARISON_FIELDS, DATABASE, DATABASE_DICTIONARIES,
+    HASH_LENGTH, MEASURE_AGE_GROUPS, MEASURE_DIMENSIONS, MEASURE_FIELDS, MEASURE_OUTPUTS, NEIGHBOUR_INDEX_JSON,
+    POPULATION_BANDS, POPULATION_BAND_FIELDS, ROLLUPS_JSON, SERVICE_FIELDS, SERVICE_MEASURES, dataset_name)
+
+# PyArrow is optional, and only imported for the Arrow and Parquet exports
+pa = None
+
+# The number of records inserted into the database at a time
+DATABASE_BATCH_SIZE = 5000
+
+# The number of values of each column a columnar JSON writer holds before spooling them
+COLUMN_BATCH_SIZE = 5000
+
+# Counts that are whole numbers, as others are reported as text
+INTEGER_PATTERN = r'^-?\d+$'
+
+
+def require_pyarrow():
+    """Import PyArrow for the Arrow and Parquet exports, raising ImportError if it is not installed."""
+    global pa
+    if pa is None:
+        import pyarrow
+        import pyarrow.compute
+        import pyarrow.csv
+        import pyarrow.ipc
+        import pyarrow.parquet
+        pa = pyarrow
+    return pa
+
+
+def write_population_bands(reference, path=POPULATION_BANDS, bands=AGE_BANDS):
+    """Write the population of each library service in each age band."""
+    populations = population_bands(reference.population_ages, reference.library_services, bands)
+    write_csv(path, POPULATION_BAND_FIELDS, (
+        (code, band, *bands[band], population)
+        for code, band_populations in populations.items() for band, population in band_populations.items()))
+
+
+def write_csv(path, fields, records):
+    """Write records, as sequences of values in field order, to a CSV file with a header row."""
+    with open(path, mode='w', newline='', encoding='utf-8') as csv_out:
+        writer = csv.writer(csv_out)
+        writer.writerow(fields)
+        writer.writerows(records)
+
+
+def write_json_dataset(path, fields, values, json_format):
+    """Write a dataset of row values to a JSON file in the rows or columnar format."""
+    with open(path, 'w', encoding='utf-8') as f:
+        if json_format == 'columnar':
+            writer = ColumnarJsonWriter(f, fields)
+            for item in values:
+                writer.write(item)
+            writer.close()
+        else:
+            json.dump(values, f)
+
+
+class JsonArrayWriter:
+    """Write a JSON array one item at a time, producing the same text as json.dump."""
+
+    def __init__(self, file):
+        self.file = file
+        self.empty = True
+        self.file.write('[')
+
+    def write(self, item):
+        """Append an item to the array."""
+        if not self.empty:
+            self.file.write(', ')
+        self.file.write(json.dumps(item))
+        self.empty = False
+
+    def close(self):
+        """Close the array. The underlying file is left open."""
+        self.file.write(']')
+
+
+class ColumnarJsonWriter:
+    """
+    Write a JSON dataset in the columnar format: one array per field, with categorical
+    fields dictionary encoded as integer codes into the dictionaries listed in the header.
+    Counts reported as digit strings are stored as numbers.
+    Each column is spooled to a temporary file as items are written, so memory only grows
+    with the dictionaries, and the dataset is written when the writer is closed.
+    """
+
+    # Encoding with a shared encoder avoids building one for every value
+    encode = staticmethod(json.JSONEncoder(separators=(',', ':')).encode)
+
+    def __init__(self, file, fields):
+        self.file = file
+        self.fields = fields
+        self.dictionaries = {field: {} for field in fields if field in CATEGORICAL_FIELDS}
+        self.spools = [tempfile.TemporaryFile('w+', encoding='utf-8') for _ in fields]
+        self.columns = [[] for _ in fields]
+        self.spooled = False
+        self.length = 0
+
+    def write(self, item):
+        """Append an item's values to the columns, spooling them once there is a batch."""
+        for field, column, value in zip(self.fields, self.columns, item):
+            codes = self.dictionaries.get(field)
+            if codes is not None:
+                code = codes.get(value)
+                if code is None:
+                    code = codes[value] = len(codes)
+                column.append(str(code))
+            elif isinstance(value, str) and value.isdigit():
+                column.append(str(int(value)))
+            else:
+                column.append(self.encode(value))
+        self.length += 1
+        if len(self.columns[0]) >= COLUMN_BATCH_SIZE:
+            self.spool()
+
+    def spool(self):
+        """Append the batch of values of each column to its spool file."""
+        if not self.columns[0]:
+            return
+        for spool, column in zip(self.spools, self.columns):
+            if self.spooled:
+                spool.write(',')
+            spool.write(','.join(column))
+            column.clear()
+        self.spooled = True
+
+    def close(self):
+        """Write the dataset and remove the spool files. The underlying file is left open."""
+        self.spool()
+        dictionaries = {field: list(codes) for field, codes in self.dictionaries.items()}
+        self.file.write(f'{{"fields":{self.encode(self.fields)},"dictionaries":{self.encode(dictionaries)},'
+                        f'"length":{self.length},"columns":[')
+        for index, spool in enumerate(self.spools):
+            self.file.write(',[' if index else '[')
+            spool.seek(0)
+            shutil.copyfileobj(spool, self.file)
+            self.file.write(']')
+            spool.close()
+        self.file.write(']}')
+
+
+class RollupBuilder:
+    """
+    Accumulate a measure's published records into totals by month, by each dimension, by
+    authority and dimension, and a cube of monthly totals for each authority and combination
+    of dimension values. Combinations are keyed by their values joined with '|', and all of
+    the combinations are listed.
+    Records without a positive count are ignored, as they are by the dashboard.
+    """
+
+    def __init__(self, measure):
+        self.dimensions = MEASURE_DIMENSIONS[measure]
+        self.dimension_indexes = [MEASURE_FIELDS[measure].index(dimension) for dimension in self.dimensions]
+        self.total = 0
+        self.by_month = defaultdict(int)
+        self.by_dimension = {dimension: defaultdict(int) for dimension in self.dimensions}
+        self.by_authority = {}
+        self.cube = {}
+
+    def add(self, record):
+        """Add a record's count to the totals."""
+        try:
+            count = int(record.count)
+        except (TypeError, ValueError):
+            return
+        if count <= 0:
+            return
+
+        authority = record.authority
+        month = record.period
+        # A dimension value may be missing, and is totalled as an empty value
+        values = [record[index] or '' for index in self.dimension_indexes]
+
+        self.total += count
+        self.by_month[month] += count
+
+        authority_totals = self.by_authority.get(authority)
+        if authority_totals is None:
+            authority_totals = self.by_authority[authority] = {
+                'total': 0, **{dimension: defaultdict(int) for dimension in self.dimensions}}
+        authority_totals['total'] += count
+        for dimension, value in zip(self.dimensions, values):
+            self.by_dimension[dimension][value] += count
+            authority_totals[dimension][value] += count
+
+        combinations = self.cube.setdefault(authority, {})
+        months = combinations.setdefault('|'.join(values), defaultdict(int))
+        months[month] += count
+
+    def to_json(self):
+        """Return the rollup, with the monthly totals as arrays in month order."""
+        months = sorted(self.by_month)
+        combinations = sorted({combination for authority in self.cube.values() for combination in authority})
+        return {
+            'dimensions': self.dimensions,
+            'months': months,
+            'combinations': [combination.split('|') for combination in combinations],
+            'total': self.total,
+            'by_month': [self.by_month[month] for month in months],
+            'by_dimension': self.by_dimension,
+            'by_authority': self.by_authority,
+            'cube': {
+                authority: {
+                    combination: [combination_months.get(month, 0) for month in months]
+                    for combination, combination_months in combinations.items()
+                }
+                for authority, combinations in self.cube.items()
+            }
+        }
+
+
+def read_rollups(path=ROLLUPS_JSON):
+    """Read the rollups of each measure written by write_rollups, or none if there are none."""
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def write_rollups(path, builders, previous=None):
+    """
+    Write the rollups of each measure to a JSON file. The measures without a builder keep
+    their previous rollups, if given.
+    """
+    previous = previous or {}
+    rollups = {}
+    for measure in MEASURE_OUTPUTS:
+        if measure in builders:
+            rollups[measure] = builders[measure].to_json()
+        elif measure in previous:
+            rollups[measure] = previous[measure]
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(rollups, f, separators=(',', ':'))
+
+
+class ShardBuilder:
+    """
+    Collect the published rows of each measure by authority, for the per-authority shards.
+    Rows are encoded and appended to a spool file for each authority and dataset as they
+    are added, so memory does not grow with the data, and each shard is read back only to
+    be written.
+    Each shard lists an authority's original records before the months created from
+    quarterly and yearly values, in the same order as the national datasets. The total
+    count of each authority's rows of each dataset is kept as they are added.
+    """
+
+    # Encoding with a shared encoder avoids building one for every row
+    encode = staticmethod(json.JSONEncoder(separators=(',', ':')).encode)
+
+    def __init__(self):
+        self.directory = tempfile.TemporaryDirectory()
+        # The names of the datasets spooled for each authority, in the order they were added
+        self.authorities = {}
+        self.totals = defaultdict(Counter)
+
+    def spool_path(self, authority, name, part):
+        return os.path.join(self.directory.name, f'{authority}.{name}.{part}.jsonl')
+
+    def add(self, name, conversions):
+        """Add records converted for JSON, each followed by the new months created from it."""
+        by_authority = defaultdict(list)
+        for converted in conversions:
+            by_authority[converted[0].authority].append(converted)
+        for authority, authority_conversions in by_authority.items():
+            names = self.authorities.setdefault(authority, [])
+            if name not in names:
+                names.append(name)
+            with open(self.spool_path(authority, name, 'original'), 'a', encoding='utf-8') as original, \
+                    open(self.spool_path(authority, name, 'new'), 'a', encoding='utf-8') as new:
+                for converted in authority_conversions:
+                    original.write(self.encode(converted[0]) + '\n')
+                    new.writelines(self.encode(new_record) + '\n' for new_record in converted[1:])
+                    # Counts that are not positive are left out, as they are from the rollups
+                    self.totals[authority][name] += sum(max(integer_or_none(record.count) or 0, 0)
+                                                        for record in converted)
+
+    def shards(self):
+        """
+        Yield each authority's code and shard, in code order. The shard maps each dataset
+        name to its rows, each already encoded as compact JSON.
+        """
+        for authority in sorted(self.authorities):
+            shard = {}
+            for name in self.authorities[authority]:
+                shard[name] = []
+                for part in ('original', 'new'):
+                    with open(self.spool_path(authority, name, part), encoding='utf-8') as spool:
+                        shard[name].extend(line.rstrip('\n') for line in spool)
+            yield authority, shard
+
+    def close(self):
+        """Remove the spool files."""
+        self.directory.cleanup()
+
+
+def write_authority_shards(builder, directory=AUTHORITY_SHARDS, summary_path=AUTHORITY_SUMMARY, changed=None):
+    """
+    Write a JSON file for each authority with its rows of each measure, and a summary of
+    the datasets and shards. Each shard is listed with a hash of its content so the
+    dashboard can tell when a cached copy is out of date, and with its total count of each
+    dataset, which are summed into the national total of each dataset. Shards of authorities no longer
+    in the data are removed.
+    If a set of changed authorities is given, the builder only holds their rows, and the
+    other authorities keep their shards as listed in the previous summary.
+    """
+    os.makedirs(directory, exist_ok=True)
+    datasets = {
+        dataset_name(json_path): {'fields': MEASURE_FIELDS[measure], 'rows': 0, 'authorities': 0, 'total': 0}
+        for measure, (_, json_path) in MEASURE_OUTPUTS.items() if json_path is not None
+    }
+
+    authorities = {}
+    if changed is not None and os.path.exists(summary_path):
+        with open(summary_path, encoding='utf-8') as f:
+            authorities = {authority: shard for authority, shard in json.load(f)['authorities'].items()
+                           if authority not in changed}
+    try:
+        for authority, shard in builder.shards():
+            # The rows are already encoded, so the shard is joined rather than dumped
+            content = ('{' + ','.join(f'{json.dumps(name)}:[{",".join(rows)}]' for name, rows in shard.items())
+                       + '}').encode('utf-8')
+            write_if_changed(os.path.join(directory, f'{authority}.json'), content)
+            authorities[authority] = {
+                'hash': hashlib.sha256(content).hexdigest()[:HASH_LENGTH],
+                'rows': {name: len(rows) for name, rows in shard.items()},
+                'totals': {name: builder.totals[authority][name] for name in shard}
+            }
+    finally:
+        builder.close()
+
+    for shard in authorities.values():
+        for name, rows in shard['rows'].items():
+            datasets[name]['rows'] += rows
+            datasets[name]['authorities'] += 1
+            datasets[name]['total'] += shard['totals'][name]
+
+    for existing in os.listdir(directory):
+        if existing.endswith('.json') and existing[:-len('.json')] not in authorities:
+            os.remove(os.path.join(directory, existing))
+
+    with open(summary_path, 'w', encoding='utf-8') as f:
+        json.dump({'datasets': datasets, 'authorities': dict(sorted(authorities.items()))}, f,
+                  separators=(',', ':'))
+
+
+def column_name(field):
+    """Return the database column name of a field e.g. Population 12-17 is population_12_17"""
+    return re.sub(r'[^a-z0-9]+', '_', field.lower()).strip('_')
+
+
+def integer_or_none(value):
+    """Return a count or population as an integer, or None if it is missing."""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class DatabaseWriter:
+    """
+    Build the SQLite database: a table per measure with its categorical fields dictionary
+    encoded, the dictionary tables, and the services with their population and nearest
+    neighbours. Rows are inserted in batches within a single transaction, and the indexes
+    are created once the tables are loaded. The database is built in a temporary file
+    which replaces the previous one when the writer is closed.
+    """
+
+    def __init__(self, path=DATABASE):
+        self.path = path
+        self.temp_path = path + '.tmp'
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+        self.connection = sqlite3.connect(self.temp_path, isolation_level=None)
+        self.connection.execute('PRAGMA journal_mode = OFF')
+        self.connection.execute('PRAGMA synchronous = OFF')
+        self.connection.execute('BEGIN')
+
+        self.dictionaries = {table: {} for table in set(DATABASE_DICTIONARIES.values())}
+        for table in self.dictionaries:
+            extra = ', name TEXT' if table == 'authorities' else ''
+            self.connection.execute(
+                f'CREATE TABLE {table} (id INTEGER PRIMARY KEY, code TEXT NOT NULL UNIQUE{extra})')
+
+        self.service_columns, self.measure_columns = self.table_columns()
+        self.connection.execute(
+            f"CREATE TABLE services (authority_id INTEGER NOT NULL REFERENCES authorities (id), "
+            f"{', '.join(column + ' ' + self.service_type(column) for column in self.service_columns[1:])})")
+
+        for measure, fields in MEASURE_FIELDS.items():
+            columns = self.measure_columns[measure]
+            definitions = [
+                f'{column} INTEGER NOT NULL REFERENCES {DATABASE_DICTIONARIES[field]} (id)'
+                if field in DATABASE_DICTIONARIES else f'{column} {"INTEGER" if field == "Count" else "TEXT"}'
+                for field, column in zip(fields, columns)
+            ]
+            self.connection.execute(f"CREATE TABLE {measure} ({', '.join(definitions)})")
+
+        self.pending = defaultdict(list)
+
+    @classmethod
+    def table_columns(cls):
+        """Return the columns of the services table, and of each measure's table."""
+        service_columns = ['authority_id'] + [
+            column_name(field) for field in SERVICE_FIELDS if field not in ('Authority code', 'Authority nice name')]
+        measure_columns = {measure: [cls.measure_column(field) for field in fields]
+                           for measure, fields in MEASURE_FIELDS.items()}
+        return service_columns, measure_columns
+
+    @staticmethod
+    def measure_column(field):
+        """Return the column of a measure field, with an _id suffix for dictionary encoded fields."""
+        return column_name(field) + ('_id' if field in DATABASE_DICTIONARIES else '')
+
+    @staticmethod
+    def service_type(column):
+        """Return the type of a services column. All but the service name and period are integers."""
+        return 'TEXT' if column in ('library_service', 'period') else 'INTEGER'
+
+    def code_id(self, table, code, name=None):
+        """Return the id of a value in a dictionary table, adding it if it is new."""
+        codes = self.dictionaries[table]
+        code_id = codes.get(code)
+        if code_id is None:
+            code_id = codes[code] = len(codes) + 1
+            if table == 'authorities':
+                self.connection.execute('INSERT INTO authorities VALUES (?, ?, ?)', (code_id, code, name))
+            else:
+                self.connection.execute(f'INSERT INTO {table} VALUES (?, ?)', (code_id, code))
+        elif name is not None and table == 'authorities':
+            self.connection.execute('UPDATE authorities SET name = ? WHERE id = ?', (name, code_id))
+        return code_id
+
+    def add_service(self, service):
+        """Add a service summary, with its nearest neighbours as authority ids."""
+        row = [self.code_id('authorities', service['Authority code'], service['Authority nice name'])]
+        for field in SERVICE_FIELDS:
+            if field in ('Authority code', 'Authority nice name'):
+                continue
+            value = service[field]
+            if field.startswith('Nearest neighbour'):
+                value = self.code_id('authorities', value) if value else None
+            elif self.service_type(column_name(field)) == 'INTEGER':
+                value = integer_or_none(value)
+            row.append(value)
+        self.queue('services', row)
+
+    def add_records(self, measure, records):
+        """Add a measure's records, as published in the JSON data."""
+        fields = MEASURE_FIELDS[measure]
+        for record in records:
+            row = []
+            for field, value in zip(fields, record):
+                if field in DATABASE_DICTIONARIES:
+                    value = self.code_id(DATABASE_DICTIONARIES[field], value)
+                elif field == 'Count':
+                    value = integer_or_none(value)
+                row.append(value)
+            self.queue(measure, row)
+
+    def queue(self, table, row):
+        """Queue a row for insertion, inserting the table's queue once it is a full batch."""
+        rows = self.pending[table]
+        rows.append(row)
+        if len(rows) >= DATABASE_BATCH_SIZE:
+            self.flush(table)
+
+    def flush(self, table):
+        """Insert a table's queued rows."""
+        rows = self.pending.pop(table, [])
+        if rows:
+            placeholders = ', '.join('?' * len(rows[0]))
+            self.connection.executemany(f'INSERT INTO {table} VALUES ({placeholders})', rows)
+
+    def close(self):
+        """Insert the remaining rows, index the measure tables, and replace the database."""
+        for table in list(self.pending):
+            self.flush(table)
+
+        # An authority may be on more than one row of the activity data, so it may have
+        # more than one service summary, as in the CSV and JSON services
+        self.connection.execute('CREATE INDEX services_authority ON services (authority_id)')
+        for measure, fields in MEASURE_FIELDS.items():
+            self.connection.execute(
+                f'CREATE INDEX {measure}_authority_period ON {measure} (authority_id, period)')
+            for field in MEASURE_DIMENSIONS[measure]:
+                column = self.measure_column(field)
+                self.connection.execute(
+                    f'CREATE INDEX {measure}_{column_name(field)}_period ON {measure} ({column}, period)')
+
+        self.connection.execute('COMMIT')
+        self.connection.execute('ANALYZE')
+        self.connection.close()
+        os.replace(self.temp_path, self.path)
+
+
+class DatabaseUpdater(DatabaseWriter):
+    """
+    Update a database built by DatabaseWriter in place, when only some authorities have
+    changed. The services, or a measure's rows, of each changed authority are deleted, for
+    their current rows to be added as they are to a new database. The update is a single
+    transaction, committed when the updater is closed.
+    """
+
+    def __init__(self, changes, path=DATABASE):
+        self.path = path
+        self.connection = sqlite3.connect(path, isolation_level=None)
+        self.connection.execute('BEGIN')
+        self.service_columns, self.measure_columns = self.table_columns()
+        self.dictionaries = {table: dict(self.connection.execute(f'SELECT code, id FROM {table}'))
+                             for table in set(DATABASE_DICTIONARIES.values())}
+        self.pending = defaultdict(list)
+
+        # The services table and each measure's table are keyed by the authority
+        authority_ids = self.dictionaries['authorities']
+        for table, authorities in changes.items():
+            self.connection.executemany(f'DELETE FROM {table} WHERE authority_id = ?', [
+                (authority_ids[authority],) for authority in authorities if authority in authority_ids])
+
+    def close(self):
+        """Insert the remaining rows and commit the update."""
+        for table in list(self.pending):
+            self.flush(table)
+        self.connection.execute('COMMIT')
+        self.connection.close()
+
+
+class ComparisonBuilder:
+    """
+    Collect the service summaries and each authority's counts by age group, to compare the
+    rates per 1,000 population of each authority and measure with its nearest neighbours.
+    The population of each age group is that of its age band, from the running totals of
+    each authority's population by single year of age.
+    """
+
+    def __init__(self, population_ages):
+        self.population_ages = population_ages
+        self.services = []
+        self.age_group_counts = {}
+
+    def add_service(self, service):
+        """Add a service summary, with its population and nearest neighbours."""
+        self.services.append(service)
+
+    def add_records(self, measure, records):
+        """Add a measure's records to the counts of each age group."""
+        field = MEASURE_AGE_GROUPS.get(measure)
+        if field is None:
+            return
+        index = MEASURE_FIELDS[measure].index(field)
+        for record in records:
+            count = integer_or_none(record.count)
+            if count is None:
+                continue
+            counts = self.age_group_counts.setdefault(record.authority, {}).setdefault(measure, defaultdict(int))
+            counts[record[index]] += count
+
+    def authorities(self):
+        """
+        Return the nearest neighbours and total of each service measure of each authority, in
+        the order they were added. An authority may be on more than one row of the activity
+        data, so its totals are summed across its service summaries.
+        """
+        authorities = {}
+        for service in self.services:
+            code = service['Authority code']
+            authority = authorities.get(code)
+            if authority is None:
+                authority = authorities[code] = {
+                    'neighbours': [service[f'Nearest neighbour {rank}'] for rank in range(1, 6)],
+                    'totals': dict.fromkeys(SERVICE_MEASURES)
+                }
+            for field in SERVICE_MEASURES:
+                count = integer_or_none(service[field])
+                if count is not None:
+                    authority['totals'][field] = (authority['totals'][field] or 0) + count
+        return authorities
+
+    def comparisons(self):
+        """
+        Return a record for each authority, measure and age group (or Total) with the rate
+        per 1,000 population of that age group, the median and mean rate of the authority's
+        nearest neighbours, and the authority's rank among itself and its neighbours,
+        highest first. Counts without a known age group are not compared.
+        """
+        authorities = self.authorities()
+        bands = {group: AGE_BANDS[group] for group in ('Total', *COMPARISON_AGE_GROUPS)}
+        populations = population_bands(self.population_ages, authorities, bands)
+        comparisons = []
+        rates = {}
+        for code, authority in authorities.items():
+            for field, measure in SERVICE_MEASURES.items():
+                groups = [('Total', authority['totals'][field], populations[code]['Total'])]
+                counts = self.age_group_counts.get(code, {}).get(measure, {})
+                groups.extend((group, counts[group], populations[code][group])
+                              for group in COMPARISON_AGE_GROUPS if group in counts)
+                for group, count, population in groups:
+                    rate = round(count * 1000 / population, 2) if count and population else None
+                    rates[code, field, group] = rate
+                    comparisons.append({
+                        'Authority': code, 'Measure': field, 'Age group': group, 'Count': count,
+                        'Population': population, 'Rate per 1,000': rate
+                    })
+
+        for comparison in comparisons:
+            code = comparison['Authority']
+            key = (comparison['Measure'], comparison['Age group'])
+            neighbour_rates = [rates[neighbour, *key] for neighbour in authorities[code]['neighbours']
+                               if rates.get((neighbour, *key)) is not None]
+            rate = comparison['Rate per 1,000']
+            comparison['Neighbour median'] = (
+                round(statistics.median(neighbour_rates), 2) if neighbour_rates else None)
+            comparison['Neighbour mean'] = round(statistics.mean(neighbour_rates), 2) if neighbour_rates else None
+            comparison['Rank'] = (
+                1 + sum(neighbour_rate > rate for neighbour_rate in neighbour_rates) if rate is not None else None)
+            comparison['Group size'] = len(neighbour_rates) + (rate is not None)
+        return comparisons
+
+    def neighbour_index(self):
+        """Return the authorities that list each authority as one of their nearest neighbours."""
+        index = defaultdict(list)
+        for code, authority in self.authorities().items():
+            for neighbour in authority['neighbours']:
+                if neighbour:
+                    index[neighbour].append(code)
+        return dict(sorted(index.items()))
+
+
+def write_comparisons(builder, outputs, json_format):
+    """Write the comparison table as CSV and JSON, and the neighbour index, if selected."""
+    comparisons = builder.comparisons()
+    if outputs(COMPARISONS):
+        write_csv(COMPARISONS, COMPARISON_FIELDS, (comparison.values() for comparison in comparisons))
+    if outputs(COMPARISONS_JSON):
+        values = [list(comparison.values()) for comparison in comparisons]
+        write_json_dataset(COMPARISONS_JSON, COMPARISON_FIELDS, values, json_format)
+    if outputs(NEIGHBOUR_INDEX_JSON):
+        with open(NEIGHBOUR_INDEX_JSON, 'w', encoding='utf-8') as f:
+            json.dump(builder.neighbour_index(), f, separators=(',', ':'))
+
+
+def open_json_writer(file, fields, json_format):
+    """Create an incremental writer for a JSON dataset in the rows or columnar format."""
+    if json_format == 'columnar':
+        return ColumnarJsonWriter(file, fields)
+    return JsonArrayWriter(file)
+
+
+def write_if_changed(path, content):
+    """Write bytes to a file unless it already has that content, leaving its mtime alone."""
+    if os.path.exists(path):
+        with open(path, 'rb') as f:
+            if f.read() == content:
+                return
+    with open(path, 'wb') as f:
+        f.write(content)
+
+
+def measure_csv_paths(measures=None, directory=None):
+    """Return the CSV output of each measure, or the given measures, in the directory if one is given."""
+    return [os.path.join(directory, os.path.basename(csv_path)) if directory else csv_path
+            for measure, (csv_path, _) in MEASURE_OUTPUTS.items() if not measures or measure in measures]
+
+
+def read_measure_table(csv_path):
+    """
+    Read a measure's CSV output as an Arrow table, with the categorical fields dictionary
+    encoded and the counts as integers. Counts reported as text are null.
+    """
+    pa = require_pyarrow()
+    with open(csv_path, mode='r', newline='', encoding='utf-8') as f:
+        fields = next(csv.reader(f))
+    column_types = {field: pa.dictionary(pa.int32(), pa.string()) if field in ARROW_CATEGORICAL_FIELDS
+                    else pa.string() for field in fields}
+    table = pa.csv.read_csv(csv_path, convert_options=pa.csv.ConvertOptions(
+        column_types=column_types, null_values=[''], strings_can_be_null=True))
+
+    counts = table.column('Count')
+    whole_numbers = pa.compute.match_substring_regex(counts, INTEGER_PATTERN)
+    counts = pa.compute.if_else(whole_numbers, counts, pa.scalar(None, pa.string())).cast(pa.int64())
+    # The file is read in blocks, each with its own dictionaries, which an Arrow file cannot hold
+    return table.set_column(fields.index('Count'), 'Count', counts).unify_dictionaries()
+
+
+def write_arrow_datasets(csv_paths, directory=ARROW_DIRECTORY):
+    """
+    Write each measure's CSV output as an Arrow IPC file, uncompressed so that it can be
+    memory mapped, and a Parquet file, named after the CSV file.
+    """
+    pa = require_pyarrow()
+    os.makedirs(directory, exist_ok=True)
+    for csv_path in csv_paths:
+        table = read_measure_table(csv_path)
+        name = os.path.splitext(os.path.basename(csv_path))[0]
+        with pa.OSFile(os.path.join(directory, f'{name}.arrow'), 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        pa.parquet.write_table(table, os.path.join(directory, f'{name}.parquet'))
+
+
+def open_arrow_dataset(path):
+    """
+    Open an Arrow file written by write_arrow_datasets as a table, memory mapped so its
+    columns are read from the file as they are used rather than loaded into memory.
+    """
+    pa = require_pyarrow()
+    with pa.memory_map(path, 'r') as source:
+        return pa.ipc.open_file(source).read_all()
@@ -0,0 +1,230 @@
+"""
+This script benchmarks the rotation pipeline of the activity_rotation package against synthetic
+activity data with the same columns as the published return, scaled up to many times the
+number of authorities. Each stage is timed separately and the results are written as JSON
+so that runs can be compared.
+"""
+
+import argparse
+import csv
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+from datetime import datetime, timezone
+from time import perf_counter
+
+from activity_rotation.conversion import (
+    convert_values_for_json, extract_authority_row, missing_services, normalise_authority_records)
+from activity_rotation.reading import load_reference_data
+from activity_rotation.report import peak_rss_kb
+from activity_rotation.schema import (
+    JSON_OUTPUTS, LIBRARY_DATA, MEASURE_FIELDS, MEASURE_OUTPUTS, SERVICE_FIELDS, SERVICES,
+    SERVICES_JSON, compile_header_schema, financial_year)
+from activity_rotation.writers import write_csv, write_json_dataset
+
+BENCHMARK_RESULTS = './benchmark_results.json'
+
+DEFAULT_SCALES = [1, 10, 100, 1000]
+DEFAULT_MIX = 'monthly=0.7,quarterly=0.2,yearly=0.1'
+
+# The months reported for each frequency, by header month name
+FREQUENCY_MONTHS = {
+    'monthly': None,
+    'quarterly': ('june', 'september', 'december', 'march'),
+    'yearly': ('april',)
+}
+
+STAGES = ['reference_loading', 'row_rotation', 'frequency_normalisation', 'csv_write',
+          'monthly_expansion', 'json_write']
+
+
+def parse_mix(mix):
+    """Parse a reporting frequency mix such as monthly=0.7,quarterly=0.2,yearly=0.1"""
+    weights = {}
+    for part in mix.split(','):
+        frequency, _, weight = part.partition('=')
+        if frequency not in FREQUENCY_MONTHS:
+            raise ValueError(f"Unknown reporting frequency '{frequency}' in the mix.")
+        weights[frequency] = float(weight)
+    return weights
+
+
+def generate_activity_data(path, scale, weights, year, seed=0):
+    """
+    Write a synthetic activity data file with the columns of the published return and
+    scale times as many authority rows. Each authority reports each measure breakdown
+    monthly, quarterly or yearly, chosen at random with the given weights.
+    """
+    rng = random.Random(seed)
+    with open(LIBRARY_DATA, mode='r', newline='', encoding='utf-8-sig') as library_data_file:
+        reader = csv.DictReader(library_data_file)
+        headers = reader.fieldnames
+        authorities = [(row['library_details'], row['authority']) for row in reader]
+
+    # Group the columns of each measure breakdown, so a breakdown is reported at one frequency
+    month_names = {month_start: month for month, month_start in year.month_starts.items()}
+    breakdowns = {}
+    for column in compile_header_schema(headers, year):
+        # Totals are only used when there is no breakdown, so they are left empty
+        if column.guard:
+            continue
+        key = (column.measure, column.event_type, column.format, column.location, column.age_group)
+        breakdowns.setdefault(key, []).append((column.header, month_names.get(column.period)))
+
+    frequencies = list(weights)
+    frequency_weights = [weights[frequency] for frequency in frequencies]
+
+    with open(path, mode='w', newline='', encoding='utf-8') as activity_out:
+        writer = csv.writer(activity_out)
+        writer.writerow(headers)
+        for index in range(len(authorities) * scale):
+            library_details, authority = authorities[index % len(authorities)]
+            row = {'library_details': library_details, 'authority': authority}
+            for columns in breakdowns.values():
+                frequency = rng.choices(frequencies, frequency_weights)[0]
+                reported_months = FREQUENCY_MONTHS[frequency]
+                for header, month in columns:
+                    if month is None or reported_months is None or month in reported_months:
+                        row[header] = str(rng.randint(0, 5000))
+            writer.writerow([row.get(header, '') for header in headers])
+
+
+def run_stages(path, year):
+    """Run each stage of the rotation over an activity data file, timing them separately."""
+    timings = {}
+
+    start = perf_counter()
+    reference = load_reference_data(use_cache=False)
+    timings['reference_loading'] = perf_counter() - start
+
+    with open(path, mode='r', newline='', encoding='utf-8-sig') as library_data_file:
+        start = perf_counter()
+        reader = csv.DictReader(library_data_file)
+        schema = compile_header_schema(reader.fieldnames, year)
+        extracted = []
+        for row in reader:
+            authority = extract_authority_row(row, schema, reference, year)
+            if authority is not None:
+                extracted.append(authority)
+        timings['row_rotation'] = perf_counter() - start
+
+    start = perf_counter()
+    records = {measure: [] for measure in MEASURE_FIELDS}
+    services = []
+    for service, authority_records in extracted:
+        services.append(service)
+        for measure, measure_records in normalise_authority_records(authority_records, year).items():
+            records[measure].extend(measure_records)
+    existing_codes = {service['Authority code'] for service in services}
+    services.extend(missing_services(reference.library_services, existing_codes, year))
+    timings['frequency_normalisation'] = perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        def output_path(path):
+            return os.path.join(output_dir, os.path.basename(path))
+
+        start = perf_counter()
+        for measure, (csv_path, _) in MEASURE_OUTPUTS.items():
+            write_csv(output_path(csv_path), MEASURE_FIELDS[measure], records[measure])
+        write_csv(output_path(SERVICES), SERVICE_FIELDS, (service.values() for service in services))
+        timings['csv_write'] = perf_counter() - start
+
+        start = perf_counter()
+        values = {SERVICES_JSON: (SERVICE_FIELDS, [list(service.values()) for service in services])}
+        for measure, (_, json_path) in MEASURE_OUTPUTS.items():
+            if json_path is not None:
+                converted = convert_values_for_json(measure, records[measure], year)
+                values[json_path] = (MEASURE_FIELDS[measure], converted)
+        timings['monthly_expansion'] = perf_counter() - start
+
+        start = perf_counter()
+        for json_path in JSON_OUTPUTS:
+            fields, json_values = values[json_path]
+            write_json_dataset(output_path(json_path), fields, json_values, 'rows')
+        timings['json_write'] = perf_counter() - start
+
+    return {
+        'rows': len(extracted),
+        'records': {measure: len(measure_records) for measure, measure_records in records.items()},
+        'json_rows': {os.path.basename(path): len(json_values) for path, (_, json_values) in values.items()},
+        'stages': timings,
+        'total_seconds': sum(timings.values()),
+        'peak_rss_kb': peak_rss_kb()
+    }
+
+
+def benchmark_scale(scale, weights, year, seed):
+    """
+    Benchmark the rotation at a scale. The stages are run in a fresh process so that the
+    peak memory of each scale is measured on its own.
+    """
+    with tempfile.TemporaryDirectory() as data_dir:
+        path = os.path.join(data_dir, f'activity_x{scale}.csv')
+        start = perf_counter()
+        generate_activity_data(path, scale, weights, year, seed)
+        generation_seconds = perf_counter() - start
+
+        completed = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--run', path, '--year', str(year.start)],
+            check=True, capture_output=True, text=True)
+        result = json.loads(completed.stdout.splitlines()[-1])
+        result['scale'] = scale
+        result['input_bytes'] = os.path.getsize(path)
+        result['generation_seconds'] = generation_seconds
+        result['rows_per_second'] = result['rows'] / result['total_seconds'] if result['total_seconds'] else None
+        return result
+
+
+def main():
+    """Run the benchmark from the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--scales', type=int, nargs='+', default=DEFAULT_SCALES,
+                        help='multiples of the number of authorities to benchmark')
+    parser.add_argument('--mix', default=DEFAULT_MIX,
+                        help='the weights of each reporting frequency in the synthetic data')
+    parser.add_argument('--year', type=int, default=2023,
+                        help='the start year of the synthetic financial year')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='the random seed for the synthetic data')
+    parser.add_argument('--output', default=BENCHMARK_RESULTS,
+                        help='the file to write the results to')
+    parser.add_argument('--run', metavar='FILE', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    year = financial_year(args.year)
+
+    # Run the stages over a single file, reporting to the parent process
+    if args.run:
+        print(json.dumps(run_stages(args.run, year)))
+        return
+
+    try:
+        weights = parse_mix(args.mix)
+    except ValueError as error:
+        parser.error(str(error))
+
+    results = []
+    for scale in args.scales:
+        result = benchmark_scale(scale, weights, year, args.seed)
+        results.append(result)
+        stages = ', '.join(f"{stage} {result['stages'][stage]:.3f}s" for stage in STAGES)
+        print(f"x{scale}: {result['rows']} rows in {result['total_seconds']:.3f}s "
+              f"({stages}), peak RSS {result['peak_rss_kb']} KB")
+
+    with open(args.output, mode='w', encoding='utf-8') as f:
+        json.dump({
+            'created': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'mix': weights,
+            'seed': args.seed,
+            'results': results
+        }, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
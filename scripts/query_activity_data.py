@@ -0,0 +1,154 @@
+"""
+This script queries the SQLite database built by rotate_activity_data.py, totalling a
+measure's counts filtered by authority, period and dimension values, and grouped by any
+of its fields. For example, the loans per resident of an authority's nearest neighbours
+by month:
+
+python scripts/query_activity_data.py loans --neighbours-of E09000001 --group-by Authority Period --per-capita
+"""
+
+import argparse
+import csv
+import sqlite3
+import sys
+
+from activity_rotation.schema import DATABASE, DATABASE_DICTIONARIES, MEASURE_FIELDS
+from activity_rotation.writers import column_name
+
+# The total population of each authority, for counts per resident. An authority may have
+# more than one service summary, so it is joined once with its largest population.
+POPULATION = ('(SELECT authority_id, MAX(population_under_12 + population_12_17 + population_adult) '
+              'AS population FROM services GROUP BY authority_id)')
+
+
+def connect(path=DATABASE):
+    """Open the database read only."""
+    connection = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    connection.row_factory = sqlite3.Row
+    return connection
+
+
+def nearest_neighbours(connection, code):
+    """Return the codes of an authority's nearest neighbours, nearest first."""
+    columns = ', '.join(f'neighbour_{rank}.code' for rank in range(1, 6))
+    joins = ' '.join(
+        f'LEFT JOIN authorities AS neighbour_{rank} ON neighbour_{rank}.id = services.nearest_neighbour_{rank}'
+        for rank in range(1, 6))
+    row = connection.execute(
+        f'SELECT {columns} FROM services JOIN authorities ON authorities.id = services.authority_id '
+        f'{joins} WHERE authorities.code = ?', (code,)).fetchone()
+    return [neighbour for neighbour in row or [] if neighbour is not None]
+
+
+def query_measure(connection, measure, authorities=None, start=None, end=None, filters=None,
+                  group_by=('Authority',), per_capita=False):
+    """
+    Total a measure's counts by the group by fields, for the given authority codes (or all
+    authorities), periods between start and end inclusive, and dimension values given as
+    a mapping of field to a list of values. Periods are months as YYYY-MM, or financial
+    years for users. Counts per resident need the results to be grouped by authority.
+    Returns a dictionary for each group, with the group by fields and the Count.
+    """
+    fields = MEASURE_FIELDS[measure]
+    filters = filters or {}
+    for field in [*group_by, *filters]:
+        if field not in fields or field == 'Count':
+            raise ValueError(f"The {measure} measure has no '{field}' field.")
+    if per_capita and 'Authority' not in group_by:
+        raise ValueError('Counts per resident need the results to be grouped by Authority.')
+
+    # Join the dictionary tables of the fields that are selected or filtered on
+    joins = []
+    expressions = {}
+    for field in fields[:-1]:
+        if field in DATABASE_DICTIONARIES:
+            alias = column_name(field)
+            joins.append(f'JOIN {DATABASE_DICTIONARIES[field]} AS {alias} '
+                         f'ON {alias}.id = {measure}.{alias}_id')
+            expressions[field] = f'{alias}.code'
+        else:
+            expressions[field] = f'{measure}.{column_name(field)}'
+
+    conditions = []
+    parameters = []
+    if authorities:
+        conditions.append(f"authority.code IN ({', '.join('?' * len(authorities))})")
+        parameters.extend(authorities)
+    if start:
+        conditions.append(f'{measure}.period >= ?')
+        parameters.append(start)
+    if end:
+        conditions.append(f'{measure}.period <= ?')
+        parameters.append(end)
+    for field, values in filters.items():
+        conditions.append(f"{expressions[field]} IN ({', '.join('?' * len(values))})")
+        parameters.extend(values)
+
+    columns = [f'{expressions[field]} AS "{field}"' for field in group_by]
+    columns.append(f'SUM({measure}.count) AS "Count"')
+    if per_capita:
+        joins.append(f'JOIN {POPULATION} AS services ON services.authority_id = authority.id')
+        columns.append(f'CAST(SUM({measure}.count) AS REAL) / MAX(services.population) AS "Per capita"')
+
+    sql = f"SELECT {', '.join(columns)} FROM {measure} {' '.join(joins)}"
+    if conditions:
+        sql += f" WHERE {' AND '.join(conditions)}"
+    if group_by:
+        grouping = ', '.join(expressions[field] for field in group_by)
+        sql += f' GROUP BY {grouping} ORDER BY {grouping}'
+    return [dict(row) for row in connection.execute(sql, parameters)]
+
+
+def parse_filter(value):
+    """Parse a filter such as Format=Ebook,Eaudio into the field and its values."""
+    field, separator, values = value.partition('=')
+    if not separator:
+        raise argparse.ArgumentTypeError(f"'{value}' is not a filter of the form Field=Value,Value")
+    return field, values.split(',')
+
+
+def main():
+    """Run a query from the command line, writing the results as CSV."""
+    parser = argparse.ArgumentParser(
+        description=__doc__.strip(), formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('measure', choices=list(MEASURE_FIELDS),
+                        help='the measure to total')
+    parser.add_argument('--database', default=DATABASE,
+                        help='the database built by rotate_activity_data.py')
+    parser.add_argument('--authorities', nargs='+', metavar='CODE',
+                        help='only include these authorities')
+    parser.add_argument('--neighbours-of', metavar='CODE',
+                        help="only include this authority's nearest neighbours")
+    parser.add_argument('--from', dest='start', metavar='PERIOD',
+                        help='the first period to include e.g. 2023-04')
+    parser.add_argument('--to', dest='end', metavar='PERIOD',
+                        help='the last period to include e.g. 2024-03')
+    parser.add_argument('--filter', type=parse_filter, action='append', default=[],
+                        help='only include these values of a field e.g. Format=Ebook,Eaudio')
+    parser.add_argument('--group-by', nargs='*', default=['Authority'], metavar='FIELD',
+                        help='the fields to group the totals by')
+    parser.add_argument('--per-capita', action='store_true',
+                        help='include the count per resident of each authority')
+    args = parser.parse_args()
+
+    connection = connect(args.database)
+    authorities = list(args.authorities or [])
+    if args.neighbours_of:
+        authorities.extend(nearest_neighbours(connection, args.neighbours_of))
+        if not authorities:
+            parser.error(f'{args.neighbours_of} has no nearest neighbours in the database')
+
+    try:
+        rows = query_measure(connection, args.measure, authorities, args.start, args.end,
+                             dict(args.filter), args.group_by, args.per_capita)
+    except ValueError as error:
+        parser.error(str(error))
+
+    fields = args.group_by + ['Count'] + (['Per capita'] if args.per_capita else [])
+    writer = csv.DictWriter(sys.stdout, fieldnames=fields)
+    writer.writeheader()
+    writer.writerows(rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,298 @@
+"""
+This script serves the datasets published by rotate_activity_data.py over HTTP, so that
+dashboards and other tools can fetch the totals they need rather than whole files. The
+datasets are loaded once and indexed by authority, period and each dimension. For example
+the loans of two authorities by format and month:
+
+python scripts/serve_activity_data.py --port 8765
+curl 'http://localhost:8765/loans?authority=E09000001,E09000033&group_by=format,period'
+
+Filters and groups are given by field, in lower case with underscores e.g. content_age_group,
+and periods can be limited with from and to e.g. from=2023-04&to=2023-09. Responses are
+JSON, compressed with gzip when the client accepts it, and carry an ETag. Repeated queries
+are answered from a cache of the most recent responses.
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from functools import lru_cache
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+from activity_rotation.reading import read_json_dataset
+from activity_rotation.schema import MEASURE_FIELDS, MEASURE_OUTPUTS
+from activity_rotation.writers import column_name, integer_or_none
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+
+# The number of query responses kept in the cache
+CACHE_SIZE = 256
+
+# Responses smaller than this are not worth compressing
+GZIP_MIN_BYTES = 512
+
+# The query parameters that are not a field filter
+QUERY_OPTIONS = ('from', 'to', 'group_by')
+
+
+class QueryError(ValueError):
+    """A query that cannot be answered, with the HTTP status to respond with."""
+
+    def __init__(self, message, status=HTTPStatus.BAD_REQUEST):
+        super().__init__(message)
+        self.status = status
+
+
+class MeasureIndex:
+    """
+    A measure's rows, with the positions of the rows that have each value of each field,
+    so that a query only visits the rows matching its filters.
+    """
+
+    def __init__(self, measure, rows):
+        self.measure = measure
+        self.fields = MEASURE_FIELDS[measure]
+        self.parameters = {column_name(field): field for field in self.fields[:-1]}
+        self.rows = rows
+        self.counts = [integer_or_none(row[-1]) for row in rows]
+        self.indexes = {field: defaultdict(list) for field in self.fields[:-1]}
+        for position, row in enumerate(rows):
+            for field, value in zip(self.fields[:-1], row):
+                self.indexes[field][value].append(position)
+        self.periods = sorted(self.indexes['Period'])
+
+    def matching_rows(self, filters, start=None, end=None):
+        """
+        Return the positions of the rows with one of the given values of each filtered field,
+        and a period between start and end inclusive, in row order.
+        """
+        selections = []
+        for field, values in filters.items():
+            index = self.indexes[field]
+            selections.append(set().union(*(index.get(value, ()) for value in values)))
+        if start or end:
+            low = bisect_left(self.periods, start) if start else 0
+            high = bisect_right(self.periods, end) if end else len(self.periods)
+            selections.append(set().union(*(self.indexes['Period'][period] for period in self.periods[low:high])))
+        if not selections:
+            return range(len(self.rows))
+        # Intersect the smallest selection with the others
+        selections.sort(key=len)
+        return sorted(selections[0].intersection(*selections[1:]))
+
+    def query(self, filters=None, start=None, end=None, group_by=('Authority',)):
+        """
+        Total the counts of the matching rows by the group by fields. Returns the rows of
+        totals, each the group by values followed by the count, in order of the values.
+        """
+        columns = [self.fields.index(field) for field in group_by]
+        totals = defaultdict(int)
+        for position in self.matching_rows(filters or {}, start, end):
+            count = self.counts[position]
+            if count is None:
+                continue
+            row = self.rows[position]
+            totals[tuple(row[column] for column in columns)] += count
+        return [[*key, total] for key, total in sorted(totals.items(), key=lambda item: [str(v) for v in item[0]])]
+
+    def describe(self):
+        """Describe the measure's fields and the query parameters that filter them."""
+        return {'fields': self.fields, 'parameters': list(self.parameters), 'rows': len(self.rows)}
+
+
+def load_indexes():
+    """Load and index each published measure dataset that has been built."""
+    indexes = {}
+    for measure, (_, json_path) in MEASURE_OUTPUTS.items():
+        if json_path is not None and os.path.exists(json_path):
+            indexes[measure] = MeasureIndex(measure, read_json_dataset(json_path))
+    return indexes
+
+
+def canonical_query(query):
+    """
+    Return the parameters of a query string in a canonical order, so that the same query
+    written differently is cached once. Values may be repeated or comma separated.
+    """
+    parameters = defaultdict(list)
+    for name, value in parse_qsl(query, keep_blank_values=True):
+        parameters[name].extend(part for part in value.split(',') if part)
+    # The order of the group by fields is the order of the results, so it is kept
+    return tuple(sorted((name, tuple(values if name == 'group_by' else sorted(set(values))))
+                        for name, values in parameters.items()))
+
+
+def run_query(index, parameters):
+    """Answer a query with canonical parameters, returning the JSON result."""
+    parameters = dict(parameters)
+    for name in ('from', 'to'):
+        if len(parameters.get(name, ())) > 1:
+            raise QueryError(f"Only one '{name}' period can be given.")
+    filters = {}
+    for name, values in parameters.items():
+        if name in QUERY_OPTIONS:
+            continue
+        if name not in index.parameters:
+            raise QueryError(f"The {index.measure} measure has no '{name}' field.")
+        filters[index.parameters[name]] = values
+
+    group_by = []
+    for name in parameters.get('group_by', ('authority',)):
+        if name not in index.parameters:
+            raise QueryError(f"The {index.measure} measure has no '{name}' field to group by.")
+        group_by.append(index.parameters[name])
+
+    start = next(iter(parameters.get('from', ())), None)
+    end = next(iter(parameters.get('to', ())), None)
+    return {
+        'measure': index.measure,
+        'fields': group_by + ['Count'],
+        'rows': index.query(filters, start, end, group_by)
+    }
+
+
+def etag_matches(etag, if_none_match):
+    """
+    Return whether an If-None-Match header lists the ETag, or is *. The header is a comma
+    separated list of ETags, which are compared exactly apart from any weak W/ prefix.
+    """
+    for entry in if_none_match.split(','):
+        entry = entry.strip()
+        if entry == '*':
+            return True
+        if entry.startswith('W/'):
+            entry = entry[len('W/'):]
+        if entry == etag:
+            return True
+    return False
+
+
+def accepts_encoding(encoding, accept_encoding):
+    """
+    Return whether an Accept-Encoding header accepts a content coding. The header is a comma
+    separated list of codings (or *), each with an optional quality value, and a coding with
+    a quality of 0 is not acceptable. A coding that is listed takes precedence over *.
+    """
+    wildcard = None
+    for entry in accept_encoding.split(','):
+        coding, *parameters = [part.strip() for part in entry.split(';')]
+        quality = 1.0
+        for parameter in parameters:
+            name, _, value = parameter.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        coding = coding.lower()
+        if coding == encoding:
+            return quality > 0
+        if coding == '*':
+            wildcard = quality > 0
+    return bool(wildcard)
+
+
+class ActivityDataServer(ThreadingHTTPServer):
+    """Serve queries over the indexed measures, caching the most recent responses."""
+
+    daemon_threads = True
+
+    def __init__(self, address, indexes, cache_size=CACHE_SIZE):
+        super().__init__(address, QueryHandler)
+        self.indexes = indexes
+        self.response = lru_cache(maxsize=cache_size)(self.build_response)
+
+    def build_response(self, path, parameters):
+        """
+        Answer a request for a path with canonical query parameters. Returns the status,
+        the JSON body, its gzip compressed copy (or None if it is small) and its ETag.
+        """
+        status = HTTPStatus.OK
+        try:
+            measure = path.strip('/')
+            if not measure:
+                result = {'measures': {name: index.describe() for name, index in self.indexes.items()}}
+            elif measure in self.indexes:
+                result = run_query(self.indexes[measure], parameters)
+            else:
+                raise QueryError(f"There is no '{measure}' measure.", HTTPStatus.NOT_FOUND)
+        except QueryError as error:
+            status = error.status
+            result = {'error': str(error)}
+
+        body = json.dumps(result, separators=(',', ':')).encode('utf-8')
+        compressed = gzip.compress(body, mtime=0) if len(body) >= GZIP_MIN_BYTES else None
+        etag = f'"{hashlib.sha256(body).hexdigest()[:16]}"'
+        return status, body, compressed, etag
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    """Answer GET and HEAD requests for the measures and queries over them."""
+
+    server_version = 'ActivityDataServer/1.0'
+
+    def do_GET(self):
+        self.respond(include_body=True)
+
+    def do_HEAD(self):
+        self.respond(include_body=False)
+
+    def respond(self, include_body):
+        """Send the (cached) response to the request, or Not Modified if the client has it."""
+        url = urlsplit(self.path)
+        status, body, compressed, etag = self.server.response(url.path, canonical_query(url.query))
+
+        if status == HTTPStatus.OK and etag_matches(etag, self.headers.get('If-None-Match', '')):
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+
+        accepts_gzip = accepts_encoding('gzip', self.headers.get('Accept-Encoding', ''))
+        content = compressed if compressed is not None and accepts_gzip else body
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.send_header('ETag', etag)
+        self.send_header('Vary', 'Accept-Encoding')
+        self.send_header('Cache-Control', 'no-cache')
+        if content is compressed:
+            self.send_header('Content-Encoding', 'gzip')
+        self.end_headers()
+        if include_body:
+            self.wfile.write(content)
+
+
+def main():
+    """Load the datasets and serve them until interrupted."""
+    parser = argparse.ArgumentParser(
+        description=__doc__.strip(), formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default=DEFAULT_HOST,
+                        help='the address to listen on')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT,
+                        help='the port to listen on')
+    parser.add_argument('--cache-size', type=int, default=CACHE_SIZE,
+                        help='the number of query responses to cache')
+    args = parser.parse_args()
+
+    indexes = load_indexes()
+    if not indexes:
+        parser.error('No datasets have been built, run rotate_activity_data.py first')
+
+    with ActivityDataServer((args.host, args.port), indexes, args.cache_size) as server:
+        print(f'Serving {len(indexes)} measures at http://{args.host}:{server.server_port}/')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':
+    main()
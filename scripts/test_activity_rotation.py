@@ -0,0 +1,786 @@
+"""
+Tests of the rotation of the activity data, run with:
+
+python -m unittest discover -s scripts
+
+The rotation's paths are relative to the repository root, so the tests run from there
+whichever directory they are started in.
+"""
+
+import csv
+import gzip
+import http.client
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+import zipfile
+from collections import defaultdict
+from contextlib import redirect_stdout
+from datetime import datetime
+from unittest import mock
+from xml.sax.saxutils import escape
+
+from activity_rotation import conversion, writers
+from activity_rotation.build_state import input_fingerprints, load_build_state, outdated_outputs
+from activity_rotation.conversion import convert_values_for_json, convert_values_to_monthly, rotate_rows
+from activity_rotation.pipeline import rotate_year
+from activity_rotation.publish import publish_partitions
+from activity_rotation.reading import XlsxDictReader, load_reference_data, load_workbook_headers, open_table
+from activity_rotation.schema import (
+    ACTIVITY_HEADERS, AUTHORITY_SHARDS, AUTHORITY_SUMMARY, DATABASE, INPUTS, JSON_OUTPUTS, LIBRARY_DATA, MEASURE_FIELDS,
+    MEASURE_OUTPUTS, MEASURE_RECORDS, PARTITIONS_INDEX, ROLLUPS_JSON, SERVICE_MEASURES, dataset_name, financial_year)
+from activity_rotation.watch import ActivityWatcher
+from activity_rotation.writers import (
+    ColumnarJsonWriter, ComparisonBuilder, DatabaseWriter, RollupBuilder, integer_or_none)
+from benchmark_rotation import generate_activity_data, parse_mix
+from query_activity_data import connect, query_measure
+from serve_activity_data import ActivityDataServer, accepts_encoding, etag_matches, load_indexes
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# The repository root, which the rotation's paths are relative to
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The script that runs the rotation
+ROTATE_SCRIPT = os.path.join(REPOSITORY, 'scripts', 'rotate_activity_data.py')
+
+# The script that queries the database
+QUERY_SCRIPT = os.path.join(REPOSITORY, 'scripts', 'query_activity_data.py')
+
+# The measures whose periods are published as months
+MONTHLY_MEASURES = [measure for measure in MEASURE_FIELDS if measure != 'users']
+
+# The working directory the tests were started in
+started_in = None
+
+
+def setUpModule():
+    global started_in
+    started_in = os.getcwd()
+    os.chdir(REPOSITORY)
+
+
+def tearDownModule():
+    os.chdir(started_in)
+
+
+def read_measure_records(measure):
+    """Read a measure's rotated records from its shipped CSV file."""
+    record_type = MEASURE_RECORDS[measure]
+    with open(MEASURE_OUTPUTS[measure][0], newline='') as f:
+        reader = csv.reader(f)
+        next(reader)
+        return [record_type(*row[:-1], int(row[-1])) for row in reader]
+
+
+def cell_reference(column, row):
+    """Return the reference of a cell by its zero based column and row e.g. AB12"""
+    letters = ''
+    column += 1
+    while column:
+        column, remainder = divmod(column - 1, 26)
+        letters = chr(ord('A') + remainder) + letters
+    return f'{letters}{row + 1}'
+
+
+def write_workbook(path, sheets, inline_strings=False):
+    """
+    Write an XLSX workbook with a worksheet of rows for each name. Text is written as shared
+    strings, or inline, numbers as numbers and booleans as booleans. Cells that are None
+    are left out, as spreadsheet programs leave out empty cells.
+    """
+    shared_strings = {}
+    worksheets = []
+    for rows in sheets.values():
+        xml_rows = []
+        for row_index, row in enumerate(rows):
+            cells = []
+            for column, value in enumerate(row):
+                reference = cell_reference(column, row_index)
+                if value is None:
+                    continue
+                if isinstance(value, bool):
+                    cells.append(f'<c r="{reference}" t="b"><v>{int(value)}</v></c>')
+                elif isinstance(value, (int, float)):
+                    cells.append(f'<c r="{reference}"><v>{value}</v></c>')
+                elif inline_strings:
+                    cells.append(f'<c r="{reference}" t="inlineStr"><is><t>{escape(value)}</t></is></c>')
+                else:
+                    index = shared_strings.setdefault(value, len(shared_strings))
+                    cells.append(f'<c r="{reference}" t="s"><v>{index}</v></c>')
+            xml_rows.append(f'<row r="{row_index + 1}">{"".join(cells)}</row>')
+        worksheets.append(''.join(xml_rows))
+
+    main = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+    relationships = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+    with zipfile.ZipFile(path, 'w') as archive:
+        archive.writestr('xl/workbook.xml', f'<workbook xmlns="{main}" xmlns:r="{relationships}"><sheets>' + ''.join(
+            f'<sheet name="{escape(name)}" sheetId="{index}" r:id="rId{index}"/>'
+            for index, name in enumerate(sheets, 1)) + '</sheets></workbook>')
+        archive.writestr('xl/_rels/workbook.xml.rels', (
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">' + ''.join(
+                f'<Relationship Id="rId{index}" Target="worksheets/sheet{index}.xml"/>'
+                for index in range(1, len(sheets) + 1)) + '</Relationships>'))
+        archive.writestr('xl/sharedStrings.xml', f'<sst xmlns="{main}">' + ''.join(
+            f'<si><t>{escape(text)}</t></si>' for text in shared_strings) + '</sst>')
+        for index, sheet_data in enumerate(worksheets, 1):
+            archive.writestr(f'xl/worksheets/sheet{index}.xml',
+                             f'<worksheet xmlns="{main}"><sheetData>{sheet_data}</sheetData></worksheet>')
+
+
+def baseline_convert_values_to_monthly(data):
+    """
+    The conversion of quarterly and annual values to monthly that convert_values_to_monthly
+    replaced, on records as dictionaries. It extends the list it iterates, and assumes the
+    2023/2024 financial year.
+    """
+    for record in data:
+        if 'Period' in record and 'P1M' in record['Period']:
+            original_date_obj = datetime.strptime(record['Period'].split('/')[0], "%Y-%m-%d")
+            record['Period'] = original_date_obj.strftime("%Y-%m")
+        elif 'Period' in record and 'P3M' in record['Period']:
+            new_count = int(int(record['Count']) / 3)
+            record['Count'] = new_count
+            original_date_obj = datetime.strptime(record['Period'].split('/')[0], "%Y-%m-%d")
+            record['Period'] = original_date_obj.strftime("%Y-%m")
+
+            original_date_month = original_date_obj.month
+            original_date_year = original_date_obj.year
+            if original_date_month == 11:
+                first_new_month = original_date_obj.replace(month=12, year=original_date_year + 1).strftime("%Y-%m")
+                second_new_month = original_date_obj.replace(month=1, year=original_date_year + 1).strftime("%Y-%m")
+            elif original_date_month == 12:
+                first_new_month = original_date_obj.replace(month=1, year=original_date_year + 1).strftime("%Y-%m")
+                second_new_month = original_date_obj.replace(month=2, year=original_date_year + 1).strftime("%Y-%m")
+            else:
+                first_new_month = original_date_obj.replace(month=original_date_month + 1).strftime("%Y-%m")
+                second_new_month = original_date_obj.replace(month=original_date_month + 2).strftime("%Y-%m")
+
+            data.extend([
+                {**record, 'Period': first_new_month, 'Count': new_count},
+                {**record, 'Period': second_new_month, 'Count': new_count}
+            ])
+        elif 'Period' in record and 'P1Y' in record['Period']:
+            new_count = int(int(record['Count']) / 12)
+            record['Count'] = new_count
+            record['Period'] = '2023-04'
+
+            new_records = []
+            for i in range(1, 12):
+                new_month = (4 + i - 1) % 12 + 1
+                new_year = 2023 + ((4 + i - 1) // 12)
+                new_records.append({**record, 'Period': f"{new_year}-{new_month:02d}", 'Count': new_count})
+            data.extend(new_records)
+
+    return data
+
+
+class ConvertValuesToMonthlyTest(unittest.TestCase):
+
+    def test_matches_baseline_on_shipped_data(self):
+        for measure in MONTHLY_MEASURES:
+            with self.subTest(measure=measure):
+                fields = MEASURE_FIELDS[measure]
+                records = read_measure_records(measure)
+                expected = baseline_convert_values_to_monthly([dict(zip(fields, record)) for record in records])
+                monthly = convert_values_to_monthly(records)
+                self.assertEqual([dict(zip(fields, record)) for record in monthly], expected)
+
+    def test_does_not_change_its_input(self):
+        records = read_measure_records('loans')
+        original = list(records)
+        convert_values_to_monthly(records)
+        self.assertEqual(records, original)
+
+    def test_expands_periods_of_any_year(self):
+        record_type = MEASURE_RECORDS['computer_usage']
+        records = [record_type('E09000001', '2024-11-01/P3M', 30), record_type('E09000001', '2021-10-01/P6M', 60)]
+        self.assertEqual([(record.period, record.count) for record in convert_values_to_monthly(records)], [
+            ('2024-11', 10), ('2021-10', 10), ('2024-12', 10), ('2025-01', 10),
+            ('2021-11', 10), ('2021-12', 10), ('2022-01', 10), ('2022-02', 10), ('2022-03', 10)])
+
+
+class ShippedDataTestCase(unittest.TestCase):
+    """Rotates the shipped activity data once for the tests of the class."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.year = financial_year(2023)
+        cls.reference = load_reference_data(use_cache=False)
+        cls.services, cls.records = rotate_year(LIBRARY_DATA, cls.year, cls.reference)
+
+    def split_service(self, service):
+        """Split a service summary into two rows of the same authority, each with part of its totals."""
+        first, second = dict(service), dict(service)
+        for field in SERVICE_MEASURES:
+            total = service[field] or 0
+            first[field] = total - total // 2 or None
+            second[field] = total // 2 or None
+        return first, second
+
+
+@unittest.skipIf(numpy is None, 'The numpy engine needs numpy.')
+class EngineParityTest(ShippedDataTestCase):
+
+    # Values that are not counted, or that the numpy engine does not parse as plain counts
+    EDGE_VALUES = ['', ' 7', '+7', '-3', '007', '0', '2236995718', '99999999999999999999']
+
+    # Values that are not counts, which are kept as reported by a measure that is not totalled
+    TEXT_VALUES = ['1.5', 'abc', '']
+
+    def assert_engines_match(self, path):
+        rotated = {}
+        for engine in ('python', 'numpy'):
+            with open(path, newline='', encoding='utf-8-sig') as f:
+                rotated[engine] = list(rotate_rows(csv.DictReader(f), self.reference, self.year, engine=engine))
+        self.assertTrue(rotated['python'])
+        self.assertEqual(rotated['numpy'], rotated['python'])
+
+    def test_matches_python_on_shipped_data(self):
+        self.assert_engines_match(LIBRARY_DATA)
+
+    def test_matches_python_across_chunks(self):
+        with mock.patch.object(conversion, 'NUMPY_CHUNK_SIZE', 7):
+            self.assert_engines_match(LIBRARY_DATA)
+
+    def test_matches_python_on_edge_values(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'activity.csv')
+            generate_activity_data(path, 2, parse_mix('monthly=0.4,quarterly=0.3,yearly=0.3'), self.year, seed=3)
+            with open(path, newline='', encoding='utf-8') as f:
+                rows = list(csv.reader(f))
+            text_column = rows[0].index('click_and_collect_april')
+            for index, row in enumerate(rows[1:]):
+                for column in range(2 + index % 5, len(row), 37):
+                    row[column] = self.EDGE_VALUES[(index + column) % len(self.EDGE_VALUES)]
+                row[text_column] = self.TEXT_VALUES[index % len(self.TEXT_VALUES)]
+            with open(path, mode='w', newline='', encoding='utf-8') as f:
+                csv.writer(f).writerows(rows)
+            self.assert_engines_match(path)
+
+
+class XlsxDictReaderTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'returns.xlsx')
+
+    def write(self, inline_strings=False):
+        write_workbook(self.path, {
+            'Notes': [['About these returns'], ['Published 2024']],
+            'Returns': [
+                ['Library authority returns'],
+                [],
+                ['authority', 'Loans 2024', 'Open', None, ''],
+                ['Barnet', 12.0, True],
+                [None, None, None],
+                ['Camden', 3.5, False, 'not in a column'],
+                ['Ealing & Acton', None, False]
+            ]
+        }, inline_strings)
+
+    def test_reads_rows_under_the_key_field_header(self):
+        for inline_strings in (False, True):
+            with self.subTest(inline_strings=inline_strings):
+                self.write(inline_strings)
+                with open_table(self.path, 'authority', headers={'Loans': 'loans'}) as reader:
+                    self.assertEqual(reader.fieldnames, ['authority', 'loans', 'Open'])
+                    self.assertEqual(list(reader), [
+                        {'authority': 'Barnet', 'loans': '12', 'Open': 'TRUE'},
+                        {'authority': 'Camden', 'loans': '3.5', 'Open': 'FALSE'},
+                        {'authority': 'Ealing & Acton', 'loans': '', 'Open': 'FALSE'}
+                    ])
+
+    def test_reads_named_worksheet(self):
+        self.write()
+        with open_table(self.path, sheet='Notes') as reader:
+            self.assertEqual(reader.fieldnames, ['About these returns'])
+            self.assertEqual(list(reader), [{'About these returns': 'Published 2024'}])
+
+    def test_rejects_missing_worksheet_or_header(self):
+        self.write()
+        with self.assertRaisesRegex(ValueError, "no worksheet named 'Loans'"):
+            XlsxDictReader(self.path, sheet='Loans')
+        with self.assertRaisesRegex(ValueError, "no worksheet with a 'authority' header"):
+            XlsxDictReader(self.path, 'authority', sheet='Notes')
+        with self.assertRaisesRegex(ValueError, "no worksheet with a 'code' header"):
+            XlsxDictReader(self.path, 'code')
+
+
+class WorkbookActivityDataTest(ShippedDataTestCase):
+
+    # Authorities spelt in the workbook as one of their alternative names in the authorities data
+    WORKBOOK_NAMES = {
+        'City of Bristol': 'Bristol, City of',
+        'Hammersmith and Fulham': 'Hammersmith & Fulham',
+        'St. Helens': 'ST HELENS'
+    }
+
+    def test_rotates_the_workbook_as_the_csv_export(self):
+        with open(LIBRARY_DATA, newline='', encoding='utf-8-sig') as f:
+            fields, *rows = list(csv.reader(f))
+        # The workbook's headers are those the fields are exported from, with their year
+        workbook_headers = {field: f'{header} 2024' for header, field in load_workbook_headers().items()}
+        authority = fields.index('authority')
+        renamed = set()
+        workbook_rows = [['Libraries activity data 2023/2024'], [], [workbook_headers.get(field, field)
+                                                                      for field in fields]]
+        for row in rows:
+            if row[authority] in self.WORKBOOK_NAMES:
+                renamed.add(row[authority])
+                row[authority] = self.WORKBOOK_NAMES[row[authority]]
+            workbook_rows.append([int(value) if value.isdigit() else value or None for value in row])
+        self.assertEqual(renamed, self.WORKBOOK_NAMES.keys())
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'activity.xlsx')
+            write_workbook(path, {'Cover': [['Libraries activity data']], 'Data': workbook_rows})
+            services, records = rotate_year(path, self.year, self.reference)
+        self.assertEqual(services, self.services)
+        self.assertEqual(records, self.records)
+
+
+class ComparisonBuilderTest(ShippedDataTestCase):
+
+    def build(self, services):
+        """Return a comparison builder of the given services and the shipped records."""
+        builder = ComparisonBuilder(self.reference.population_ages)
+        for service in services:
+            builder.add_service(service)
+        for measure, records in self.records.items():
+            builder.add_records(measure, records)
+        return builder
+
+    def test_authority_on_more_than_one_row(self):
+        first, second = self.split_service(self.services[0])
+        builder = self.build(self.services)
+        duplicated = self.build([first, *self.services[1:], second])
+        # An authority's totals are summed across its rows, and it is compared once
+        self.assertEqual(duplicated.comparisons(), builder.comparisons())
+        self.assertEqual(duplicated.neighbour_index(), builder.neighbour_index())
+
+    def test_rates_use_age_band_populations(self):
+        fields = {'Under 12': 'Population under 12', '12-17': 'Population 12-17', 'Adult': 'Population adult'}
+        services = {service['Authority code']: service for service in self.services}
+        compared = set()
+        for comparison in self.build(self.services).comparisons():
+            service = services[comparison['Authority']]
+            group = comparison['Age group']
+            # The age bands of the groups cover every age once, as the total's band does
+            population = (sum(service[field] for field in fields.values()) if group == 'Total'
+                          else service[fields[group]])
+            self.assertEqual(comparison['Population'], population, (comparison['Authority'], group))
+            compared.add(group)
+        self.assertEqual(compared, {'Total', *fields})
+
+
+class DatabaseTestCase(ShippedDataTestCase):
+
+    @classmethod
+    def build_database(cls, path, services):
+        """Build a database of the given services and the shipped records, as the rotation does."""
+        database = DatabaseWriter(path)
+        for service in services:
+            database.add_service(service)
+        for measure, records in cls.records.items():
+            for record in records:
+                database.add_records(measure, convert_values_for_json(measure, [record], cls.year))
+        database.close()
+
+
+class DatabaseWriterTest(DatabaseTestCase):
+
+    def test_authority_on_more_than_one_row(self):
+        first, second = self.split_service(self.services[0])
+        code = first['Authority code']
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'activity.sqlite')
+            duplicated_path = os.path.join(directory, 'duplicated.sqlite')
+            self.build_database(path, self.services)
+            self.build_database(duplicated_path, [first, *self.services[1:], second])
+
+            connection = connect(duplicated_path)
+            try:
+                rows = connection.execute(
+                    'SELECT COUNT(*) FROM services JOIN authorities ON authorities.id = services.authority_id '
+                    'WHERE authorities.code = ?', (code,)).fetchone()[0]
+                self.assertEqual(rows, 2)
+                duplicated = query_measure(connection, 'loans', per_capita=True)
+            finally:
+                connection.close()
+
+            # Counts per resident divide by the authority's population once, not once per row
+            connection = connect(path)
+            try:
+                self.assertEqual(duplicated, query_measure(connection, 'loans', per_capita=True))
+            finally:
+                connection.close()
+
+
+class QueryCliTest(DatabaseTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.directory = tempfile.TemporaryDirectory()
+        cls.database = os.path.join(cls.directory.name, 'activity.sqlite')
+        cls.build_database(cls.database, cls.services)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.directory.cleanup()
+
+    def query(self, *args):
+        """Run the query script on the test database, returning its process."""
+        return subprocess.run([sys.executable, QUERY_SCRIPT, *args, '--database', self.database],
+                              capture_output=True, text=True)
+
+    def query_rows(self, *args):
+        """Run a query, returning its CSV rows."""
+        result = self.query(*args)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        return list(csv.DictReader(io.StringIO(result.stdout)))
+
+    def test_totals_filtered_counts(self):
+        code = self.services[0]['Authority code']
+        expected = defaultdict(int)
+        for record in convert_values_for_json('loans', self.records['loans'], self.year):
+            count = integer_or_none(record.count)
+            if record.authority == code and '2023-04' <= record.period <= '2023-06' and count is not None:
+                expected[record.format] += count
+
+        rows = self.query_rows('loans', '--authorities', code, '--from', '2023-04', '--to', '2023-06',
+                               '--group-by', 'Format')
+        self.assertEqual({row['Format']: int(row['Count']) for row in rows}, expected)
+
+    def test_neighbours_of(self):
+        service = next(service for service in self.services if service['Nearest neighbour 1'])
+        neighbours = {service[f'Nearest neighbour {rank}'] for rank in range(1, 6)} - {None}
+        rows = self.query_rows('visits', '--neighbours-of', service['Authority code'], '--per-capita')
+        self.assertTrue(rows)
+        self.assertLessEqual({row['Authority'] for row in rows}, neighbours)
+        self.assertTrue(all(float(row['Per capita']) > 0 for row in rows))
+
+    def test_rejects_unknown_field(self):
+        result = self.query('loans', '--group-by', 'Colour')
+        self.assertEqual(result.returncode, 2)
+        self.assertIn("The loans measure has no 'Colour' field.", result.stderr)
+
+
+class ServerTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ActivityDataServer(('127.0.0.1', 0), load_indexes())
+        cls.thread = threading.Thread(target=cls.server.serve_forever)
+        cls.thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.thread.join()
+        cls.server.server_close()
+
+    def request(self, path, headers=None):
+        """Request a path from the server, returning the response and its body."""
+        connection = http.client.HTTPConnection('127.0.0.1', self.server.server_port)
+        try:
+            connection.request('GET', path, headers=headers or {})
+            response = connection.getresponse()
+            return response, response.read()
+        finally:
+            connection.close()
+
+    def test_accepts_encoding(self):
+        for header, expected in [
+            ('gzip', True), ('GZIP', True), ('deflate, gzip;q=0.5', True), ('*', True),
+            ('gzip;q=0', False), ('gzip; q=0.000', False), ('*;q=0', False), ('gzip;q=0, *', False),
+            ('br, *;q=0.1', True), ('identity', False), ('x-gzip2', False), ('', False)
+        ]:
+            with self.subTest(header=header):
+                self.assertEqual(accepts_encoding('gzip', header), expected)
+
+    def test_etag_matches(self):
+        self.assertTrue(etag_matches('"abc"', '"xyz", "abc"'))
+        self.assertTrue(etag_matches('"abc"', 'W/"abc"'))
+        self.assertTrue(etag_matches('"abc"', '*'))
+        self.assertFalse(etag_matches('"abc"', '"abcd", "ab"'))
+        self.assertFalse(etag_matches('"abc"', ''))
+
+    def test_compresses_when_accepted(self):
+        path = '/loans?group_by=format,period'
+        response, body = self.request(path)
+        self.assertEqual(response.status, 200)
+        self.assertIsNone(response.getheader('Content-Encoding'))
+        self.assertTrue(json.loads(body)['rows'])
+
+        response, compressed = self.request(path, {'Accept-Encoding': 'br, gzip;q=0.8'})
+        self.assertEqual(response.getheader('Content-Encoding'), 'gzip')
+        self.assertEqual(response.getheader('Vary'), 'Accept-Encoding')
+        self.assertEqual(gzip.decompress(compressed), body)
+
+        response, refused = self.request(path, {'Accept-Encoding': 'gzip;q=0, deflate'})
+        self.assertIsNone(response.getheader('Content-Encoding'))
+        self.assertEqual(refused, body)
+
+    def test_not_modified_when_etag_matches(self):
+        response, body = self.request('/visits?group_by=period')
+        etag = response.getheader('ETag')
+        self.assertTrue(body)
+
+        response, body = self.request('/visits?group_by=period', {'If-None-Match': f'"other", {etag}'})
+        self.assertEqual(response.status, 304)
+        self.assertEqual(body, b'')
+
+        # The same query written differently has the same ETag
+        response, _ = self.request('/visits?group_by=period&from=', {'If-None-Match': etag})
+        self.assertEqual(response.status, 304)
+        response, _ = self.request('/visits?group_by=authority', {'If-None-Match': etag})
+        self.assertEqual(response.status, 200)
+
+
+class ColumnarJsonWriterTest(unittest.TestCase):
+
+    def test_writes_spooled_columns(self):
+        fields = MEASURE_FIELDS['loans']
+        items = [
+            ('E09000001', 'Physical', 'Adult', '2023-04', 10),
+            ('E09000002', 'eBook', 'Adult', '2023-04', '20'),
+            ('E09000001', 'Physical', 'Children', '2023-05', 'n/a'),
+            ('E09000003', 'Physical', 'Adult', '2023-05', None),
+            ('E09000002', 'eAudio', 'Children', '2023-06', 0)
+        ]
+        for batch_size in (2, 5, 100):
+            with self.subTest(batch_size=batch_size), mock.patch.object(writers, 'COLUMN_BATCH_SIZE', batch_size):
+                f = io.StringIO()
+                writer = ColumnarJsonWriter(f, fields)
+                for item in items:
+                    writer.write(item)
+                writer.close()
+                self.assertEqual(f.getvalue(), json.dumps({
+                    'fields': fields,
+                    'dictionaries': {
+                        'Authority': ['E09000001', 'E09000002', 'E09000003'],
+                        'Format': ['Physical', 'eBook', 'eAudio'],
+                        'Content age group': ['Adult', 'Children'],
+                        'Period': ['2023-04', '2023-05', '2023-06']
+                    },
+                    'length': 5,
+                    'columns': [[0, 1, 0, 2, 1], [0, 1, 0, 0, 2], [0, 0, 1, 0, 1], [0, 0, 1, 1, 2],
+                                [10, 20, 'n/a', None, 0]]
+                }, separators=(',', ':')))
+
+    def test_writes_empty_dataset(self):
+        f = io.StringIO()
+        ColumnarJsonWriter(f, ['Authority', 'Count']).close()
+        self.assertEqual(json.loads(f.getvalue()), {
+            'fields': ['Authority', 'Count'], 'dictionaries': {'Authority': []}, 'length': 0, 'columns': [[], []]})
+
+
+class AuthoritySummaryTest(unittest.TestCase):
+
+    def test_totals_match_shards_and_rollups(self):
+        with open(AUTHORITY_SUMMARY, encoding='utf-8') as f:
+            summary = json.load(f)
+        with open(ROLLUPS_JSON, encoding='utf-8') as f:
+            rollups = json.load(f)
+
+        totals = defaultdict(int)
+        for code, authority in summary['authorities'].items():
+            with open(os.path.join(AUTHORITY_SHARDS, f'{code}.json'), encoding='utf-8') as f:
+                shard = json.load(f)
+            for name, rows in shard.items():
+                self.assertEqual(authority['rows'][name], len(rows))
+                total = sum(max(integer_or_none(row[-1]) or 0, 0) for row in rows)
+                self.assertEqual(authority['totals'][name], total, (code, name))
+                totals[name] += total
+
+        for measure, (_, json_path) in MEASURE_OUTPUTS.items():
+            if json_path is not None:
+                name = dataset_name(json_path)
+                self.assertEqual(summary['datasets'][name]['total'], totals[name], name)
+                self.assertEqual(summary['datasets'][name]['total'], rollups[measure]['total'], name)
+
+
+class RollupBuilderTest(unittest.TestCase):
+
+    def test_totals_missing_dimension_values(self):
+        record_type = MEASURE_RECORDS['loans']
+        builder = RollupBuilder('loans')
+        for record in [record_type('E09000001', 'Ebook', None, '2023-04', 5),
+                       record_type('E09000001', 'Ebook', 'Adult', '2023-04', '7'),
+                       record_type('E09000001', None, None, '2023-05', 3),
+                       record_type('E09000002', 'Ebook', 'Adult', '2023-05', 0)]:
+            builder.add(record)
+        rollup = builder.to_json()
+        self.assertEqual(rollup['total'], 15)
+        self.assertEqual(rollup['combinations'], [['Ebook', ''], ['Ebook', 'Adult'], ['', '']])
+        self.assertEqual(rollup['by_dimension']['Content age group'], {'': 8, 'Adult': 7})
+        self.assertEqual(rollup['cube'], {'E09000001': {'Ebook|': [5, 0], 'Ebook|Adult': [7, 0], '|': [0, 3]}})
+
+
+class ScratchTestCase(unittest.TestCase):
+    """
+    Runs the rotation in a scratch directory with a copy of the inputs, so that the outputs
+    and build state of the repository are left alone.
+    """
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        for path in INPUTS:
+            os.makedirs(self.path(os.path.dirname(path)), exist_ok=True)
+            shutil.copy(path, self.path(path))
+        os.makedirs(self.path('public'))
+
+    def path(self, path):
+        """Return the path of a file in the scratch directory."""
+        return os.path.join(self.directory, path)
+
+    def rotate(self, *args):
+        """Run the rotation script in the scratch directory with the given options, returning its output."""
+        result = subprocess.run([sys.executable, ROTATE_SCRIPT, *args], cwd=self.directory, capture_output=True,
+                                text=True)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        return result.stdout
+
+    def read_json(self, path):
+        with open(self.path(path), encoding='utf-8') as f:
+            return json.load(f)
+
+    def enter(self):
+        """Work in the scratch directory for the rest of the test."""
+        os.chdir(self.directory)
+        self.addCleanup(os.chdir, REPOSITORY)
+
+    def edit_activity_data(self):
+        """
+        Change a count in the scratch activity data, add a second row of one authority and
+        remove another authority's row.
+        """
+        with open(self.path(LIBRARY_DATA), newline='', encoding='utf-8-sig') as f:
+            rows = list(csv.reader(f))
+        column = rows[0].index('physical_events_adults_april')
+        rows[3][column] = str(int(rows[3][column] or 0) + 7)
+        rows.append(list(rows[9]))
+        del rows[7]
+        with open(self.path(LIBRARY_DATA), mode='w', newline='', encoding='utf-8') as f:
+            csv.writer(f).writerows(rows)
+
+    def outputs(self):
+        """Return the content of each output file, and the totals and services in the database."""
+        contents = {}
+        for directory in ('data', 'public'):
+            for root, _, names in os.walk(self.path(directory)):
+                for name in names:
+                    if not name.endswith('.sqlite'):
+                        with open(os.path.join(root, name), 'rb') as f:
+                            contents[os.path.relpath(os.path.join(root, name), self.directory)] = f.read()
+        connection = connect(self.path(DATABASE))
+        try:
+            for measure, fields in MEASURE_FIELDS.items():
+                contents[measure] = query_measure(connection, measure, group_by=fields[:-1])
+            # The ids of the authorities depend on the order they were added in, so the
+            # authority and its neighbours are compared by code
+            codes = dict(connection.execute('SELECT id, code FROM authorities'))
+            service_columns, _ = DatabaseWriter.table_columns()
+            cursor = connection.execute(f"SELECT {', '.join(service_columns)} FROM services")
+            contents['services'] = sorted(
+                tuple(codes.get(value) if column == 'authority_id' or column.startswith('nearest_neighbour')
+                      else value for column, value in zip(service_columns, row)) for row in cursor)
+        finally:
+            connection.close()
+        return contents
+
+    def assert_same_outputs(self, expected, actual):
+        """Assert that two builds' outputs are the same, apart from their build state and manifest."""
+        self.assertEqual(expected.keys(), actual.keys())
+        for name, content in expected.items():
+            if not name.startswith('.') and name != os.path.join('public', 'datasets.json'):
+                self.assertEqual(content, actual[name], name)
+
+
+class StreamingTest(ScratchTestCase):
+
+    def test_writes_the_outputs_of_a_batch_build(self):
+        self.edit_activity_data()
+        for options in ([], ['--json-format', 'columnar']):
+            with self.subTest(options=options):
+                self.rotate('--force', *options)
+                batch = self.outputs()
+                self.rotate('--force', '--stream', *options)
+                self.assert_same_outputs(batch, self.outputs())
+
+
+class BuildStateTest(ScratchTestCase):
+
+    def outdated(self):
+        """Return the outputs of the scratch directory that the next build would rebuild."""
+        self.enter()
+        return outdated_outputs(load_build_state(), input_fingerprints('rows', financial_year(2023)))
+
+    def test_up_to_date_after_build(self):
+        self.rotate()
+        self.assertEqual(self.outdated(), set())
+
+    def test_rebuilds_measures_when_headers_change(self):
+        self.rotate()
+        with open(self.path(ACTIVITY_HEADERS), 'a', newline='', encoding='utf-8') as f:
+            f.write('Extra workbook header,extra_field\r\n')
+        outdated = self.outdated()
+        for csv_path, json_path in MEASURE_OUTPUTS.values():
+            self.assertIn(csv_path, outdated)
+            if json_path is not None:
+                self.assertIn(json_path, outdated)
+        self.assertNotIn('All outputs are up to date.', self.rotate())
+        self.assertEqual(self.outdated(), set())
+
+
+class WatchTest(ScratchTestCase):
+
+    def test_updates_outputs_as_a_full_build_does(self):
+        self.enter()
+        watcher = ActivityWatcher(LIBRARY_DATA, financial_year(2023))
+        with redirect_stdout(io.StringIO()):
+            watcher.build()
+
+        self.edit_activity_data()
+        with redirect_stdout(io.StringIO()):
+            watcher.build({LIBRARY_DATA})
+        updated = self.outputs()
+
+        self.rotate('--force')
+        self.assert_same_outputs(self.outputs(), updated)
+
+
+class PublishPartitionsTest(ScratchTestCase):
+
+    def test_publishes_up_to_date_build(self):
+        self.rotate()
+        output = self.rotate('--publish')
+        self.assertIn('All outputs are up to date.', output)
+        index = self.read_json(PARTITIONS_INDEX)
+        self.assertEqual(sorted(index), sorted(dataset_name(path) for path in JSON_OUTPUTS))
+        for partitions in index.values():
+            self.assertEqual(list(partitions), ['2023/2024'])
+            self.assertTrue(os.path.exists(self.path(os.path.join('public', partitions['2023/2024']['file']))))
+
+    def test_writes_no_empty_index(self):
+        self.enter()
+        publish_partitions(financial_year(2023), [])
+        self.assertFalse(os.path.exists(PARTITIONS_INDEX))
+
+
+if __name__ == '__main__':
+    unittest.main()
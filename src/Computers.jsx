@@ -27,8 +27,7 @@ import { useApplicationState } from './hooks/useApplicationState'
 import CardGrid from './components/CardGrid'
 
 import { getActiveServices } from './models/service'
-import * as computersModel from './models/computers'
-import * as wifiModel from './models/wifi'
+import * as rollupsModel from './models/rollups'
 
 ChartJS.register(
   CategoryScale,
@@ -98,7 +97,7 @@ const serviceChartOptions = {
 }
 
 const Computers = () => {
-  const [{ filteredServices, services, computers, wifi }, dispatchApplication] =
+  const [{ filteredServices, services, rollups }, dispatchApplication] =
     useApplicationState()
 
   const [computersWiFiChart, setComputersWiFiChart] = useState({
@@ -126,61 +125,43 @@ const Computers = () => {
   }, [])
 
   useEffect(() => {
-    const getComputers = async () => {
-      const computers = await computersModel.getComputers()
-      dispatchApplication({ type: 'SetComputers', computers })
+    const getRollups = async () => {
+      const rollups = await rollupsModel.getRollups()
+      dispatchApplication({ type: 'SetRollups', rollups })
     }
-    const getWiFi = async () => {
-      const wifi = await wifiModel.getWiFi()
-      dispatchApplication({ type: 'SetWiFi', wifi })
-    }
-    if (!computers || !wifi) {
-      getComputers()
-      getWiFi()
-    }
-  }, [services, computers, wifi, dispatchApplication])
 
-  useEffect(() => {
-    if (!computers || !wifi) return
+    // Trigger download of the rollups (if not already done)
+    if (!rollups) getRollups()
+  }, [rollups, dispatchApplication])
 
-    const activeServices = getActiveServices(services, filteredServices)
+  useEffect(() => {
+    if (!rollups?.computer_usage || !rollups?.wifi_sessions || !services) return
 
-    const filteredWifi = wifi.filter(m =>
-      activeServices.find(s => s.code === m.serviceCode)
-    )
+    const computerRollup = rollups.computer_usage
+    const wifiRollup = rollups.wifi_sessions
 
-    const filteredComputers = computers.filter(m =>
-      activeServices.find(s => s.code === m.serviceCode)
-    )
+    const activeServices = getActiveServices(services, filteredServices)
 
-    // Create a new set of labels from both datasets
-    const monthLabels = Array.from(
-      new Set([
-        ...filteredComputers.map(c => c.month),
-        ...filteredWifi.map(w => w.month)
-      ])
-    ).sort()
+    // The labels are the months of either rollup, already formatted as YYYY-MM
+    const monthLabels = rollupsModel.getMonths(computerRollup, wifiRollup)
 
+    // The monthly totals of the filtered services
     const computersWiFiDatasets = [
       {
         label: 'Computer hours',
-        data: monthLabels.map(label => {
-          return (
-            filteredComputers
-              .filter(c => c.month === label)
-              .reduce((sum, v) => sum + (v.countHours || 0), 0) || 0
-          )
-        })
+        data: rollupsModel.sumMonthsFor(
+          computerRollup,
+          monthLabels,
+          filteredServices
+        )
       },
       {
         label: 'WiFi sessions',
-        data: monthLabels.map(label => {
-          return (
-            filteredWifi
-              .filter(w => w.month === label)
-              .reduce((sum, v) => sum + (v.countSessions || 0), 0) || 0
-          )
-        })
+        data: rollupsModel.sumMonthsFor(
+          wifiRollup,
+          monthLabels,
+          filteredServices
+        )
       }
     ]
 
@@ -207,11 +188,7 @@ const Computers = () => {
           )?.code
           if (!serviceCode) return null
 
-          return (
-            filteredComputers
-              .filter(c => c.serviceCode === serviceCode)
-              .reduce((sum, v) => sum + (v.countHours || 0), 0) || 0
-          )
+          return rollupsModel.getServiceTotal(computerRollup, serviceCode)
         })
       },
       {
@@ -222,11 +199,7 @@ const Computers = () => {
           )?.code
           if (!serviceCode) return null
 
-          return (
-            filteredWifi
-              .filter(w => w.serviceCode === serviceCode)
-              .reduce((sum, v) => sum + (v.countSessions || 0), 0) || 0
-          )
+          return rollupsModel.getServiceTotal(wifiRollup, serviceCode)
         })
       }
     ]
@@ -243,7 +216,7 @@ const Computers = () => {
       labels: serviceLabels,
       datasets: serviceDatasets
     })
-  }, [filteredServices, services, computers, wifi])
+  }, [filteredServices, services, rollups])
 
   return (
     <Box>
@@ -28,8 +28,7 @@ import { useApplicationState } from './hooks/useApplicationState'
 import CardGrid from './components/CardGrid'
 
 import { getActiveServices } from './models/service'
-import * as eventsModel from './models/events'
-import * as attendanceModel from './models/attendance'
+import * as rollupsModel from './models/rollups'
 
 ChartJS.register(
   CategoryScale,
@@ -75,10 +74,8 @@ const serviceChartOptions = {
 }
 
 const Events = () => {
-  const [
-    { services, filteredServices, events, attendance },
-    dispatchApplication
-  ] = useApplicationState()
+  const [{ services, filteredServices, rollups }, dispatchApplication] =
+    useApplicationState()
 
   const [eventsAttendanceChartData, setEventsAttendanceChartData] = useState([])
   const [serviceChart, setServiceChart] = useState({ labels: [], datasets: [] })
@@ -103,29 +100,27 @@ const Events = () => {
   }, [])
 
   useEffect(() => {
-    const getEvents = async () => {
-      const events = await eventsModel.getEvents()
-      dispatchApplication({ type: 'SetEvents', events })
+    const getRollups = async () => {
+      const rollups = await rollupsModel.getRollups()
+      dispatchApplication({ type: 'SetRollups', rollups })
     }
 
-    const getAttendance = async () => {
-      const attendance = await attendanceModel.getAttendance()
-      dispatchApplication({ type: 'SetAttendance', attendance })
-    }
-    if (!events && !attendance) {
-      getEvents()
-      getAttendance()
-    }
-  }, [events, attendance, dispatchApplication])
+    // Trigger download of the rollups (if not already done)
+    if (!rollups) getRollups()
+  }, [rollups, dispatchApplication])
 
   useEffect(() => {
-    if (!events || !attendance) return
+    if (!rollups?.events || !rollups?.attendance || !services) return
+
+    const eventRollup = rollups.events
+    const attendanceRollup = rollups.attendance
+    const eventTypeIndex = eventRollup.dimensions.indexOf('Event type')
+    const attendanceTypeIndex =
+      attendanceRollup.dimensions.indexOf('Event type')
 
     const activeServices = getActiveServices(services, filteredServices)
 
-    const monthLabels = [
-      ...new Set([...events.map(e => e.month), ...attendance.map(a => a.month)])
-    ].sort()
+    const monthLabels = rollupsModel.getMonths(eventRollup, attendanceRollup)
 
     const eventAttendanceCharts = []
 
@@ -135,33 +130,25 @@ const Events = () => {
         // One dataset for attendance and one for events
         {
           label: `Attendance - ${eventType}`,
-          data: monthLabels.map(month => {
-            // Get the count of attendance for this event type and month
-            return attendance
-              .filter(
-                a =>
-                  a.type === eventType &&
-                  a.month === month &&
-                  activeServices.find(s => s.code === a.serviceCode)
-              )
-              .reduce((sum, a) => sum + (a.countAttendance || 0), 0)
-          }),
+          // The monthly attendance of this event type for the filtered services
+          data: rollupsModel.sumMonthsFor(
+            attendanceRollup,
+            monthLabels,
+            filteredServices,
+            values => values[attendanceTypeIndex] === eventType
+          ),
           yAxisID: 'y1',
           type: 'line'
         },
         {
           label: `Events - ${eventType}`,
-          data: monthLabels.map(month => {
-            // Get the count of events for this event type and month
-            return events
-              .filter(
-                e =>
-                  e.type === eventType &&
-                  e.month === month &&
-                  activeServices.find(s => s.code === e.serviceCode)
-              )
-              .reduce((sum, e) => sum + (e.countEvents || 0), 0)
-          }),
+          // The monthly events of this event type for the filtered services
+          data: rollupsModel.sumMonthsFor(
+            eventRollup,
+            monthLabels,
+            filteredServices,
+            values => values[eventTypeIndex] === eventType
+          ),
           yAxisID: 'y',
           stack: 'Stack 0'
         }
@@ -243,23 +230,10 @@ const Events = () => {
         )?.code
         if (!serviceCode) return 0
 
-        if (label === 'Events') {
-          return events
-            .filter(
-              e =>
-                activeServices.find(s => s.code === e.serviceCode) &&
-                e.serviceCode === serviceCode
-            )
-            .reduce((sum, e) => sum + (e.countEvents || 0), 0)
-        } else {
-          return attendance
-            .filter(
-              a =>
-                activeServices.find(s => s.code === a.serviceCode) &&
-                a.serviceCode === serviceCode
-            )
-            .reduce((sum, a) => sum + (a.countAttendance || 0), 0)
-        }
+        return rollupsModel.getServiceTotal(
+          label === 'Events' ? eventRollup : attendanceRollup,
+          serviceCode
+        )
       })
       return {
         label,
@@ -279,7 +253,7 @@ const Events = () => {
       labels: serviceLabels,
       datasets
     })
-  }, [filteredServices, services, events, attendance])
+  }, [filteredServices, services, rollups])
 
   return (
     <Box>
@@ -28,7 +28,7 @@ import loansByServiceMd from './content/loans-by-service.md'
 import { useApplicationState } from './hooks/useApplicationState'
 
 import { getActiveServices } from './models/service'
-import * as loansModel from './models/loans'
+import * as rollupsModel from './models/rollups'
 
 import CardGrid from './components/CardGrid'
 
@@ -73,7 +73,7 @@ const serviceChartOptions = {
 }
 
 const Loans = () => {
-  const [{ filteredServices, services, loans }, dispatchApplication] =
+  const [{ filteredServices, services, rollups }, dispatchApplication] =
     useApplicationState()
 
   const [formatCharts, setFormatCharts] = useState([])
@@ -97,31 +97,37 @@ const Loans = () => {
   }, [])
 
   useEffect(() => {
-    const getLoans = async () => {
-      const loans = await loansModel.getLoans()
-      dispatchApplication({ type: 'SetLoans', loans })
+    const getRollups = async () => {
+      const rollups = await rollupsModel.getRollups()
+      dispatchApplication({ type: 'SetRollups', rollups })
     }
 
-    // Trigger download of loans data (if not already done)
-    if (!loans) getLoans()
-  }, [services, loans, dispatchApplication])
+    // Trigger download of the rollups (if not already done)
+    if (!rollups) getRollups()
+  }, [rollups, dispatchApplication])
 
   useEffect(() => {
-    if (!loans) return
+    if (!rollups?.loans || !services) return
+
+    const loanRollup = rollups.loans
+    const formatIndex = loanRollup.dimensions.indexOf('Format')
+    const ageGroupIndex = loanRollup.dimensions.indexOf('Content age group')
 
     const activeServices = getActiveServices(services, filteredServices)
 
     const formatCharts = []
 
-    const itemFormats = [...new Set(loans.map(m => m.format))].sort((a, b) => {
-      const order = ['Physical book', 'Ebook', 'Physical audiobook', 'Eaudio']
-      const aIndex = order.indexOf(a)
-      const bIndex = order.indexOf(b)
-      if (aIndex !== -1 && bIndex !== -1) {
-        return aIndex - bIndex
-      }
-      return a.localeCompare(b)
-    })
+    const itemFormats = rollupsModel
+      .getDimensionValues(loanRollup, 'Format')
+      .sort((a, b) => {
+        const order = ['Physical book', 'Ebook', 'Physical audiobook', 'Eaudio']
+        const aIndex = order.indexOf(a)
+        const bIndex = order.indexOf(b)
+        if (aIndex !== -1 && bIndex !== -1) {
+          return aIndex - bIndex
+        }
+        return a.localeCompare(b)
+      })
 
     itemFormats.forEach(format => {
       const formatChartOptions = {
@@ -161,36 +167,25 @@ const Loans = () => {
           }
         }
       }
-      const formatLoans = loans.filter(m => m.format === format)
-
-      let formatLabels = []
       const datasets = []
-      // The labels are the months in the data. The months are already formattted as YYYY-MM
-      formatLabels = [...new Set(formatLoans.map(loan => loan.month))].sort()
+      // The labels are the months in the rollup, already formatted as YYYY-MM
+      const formatLabels = loanRollup.months
 
       // We want a dataset for each content age group
-      const contentAgeGroups = [
-        ...new Set(formatLoans.map(m => m.contentAgeGroup))
-      ].sort()
+      const contentAgeGroups = rollupsModel.getDimensionValues(
+        loanRollup,
+        'Content age group',
+        values => values[formatIndex] === format
+      )
       contentAgeGroups.forEach(contentAgeGroup => {
-        // We want a dataset for each age group
-        const data = []
-        formatLabels.forEach(label => {
-          // For each label (month) we need to count the count of loans for this age group
-          let count = 0
-          formatLoans.forEach(loan => {
-            if (
-              loan.countLoans &&
-              loan.month === label &&
-              loan.contentAgeGroup === contentAgeGroup &&
-              (filteredServices.length === 0 ||
-                filteredServices.includes(loan.serviceCode))
-            ) {
-              count += loan.countLoans
-            }
-          })
-          data.push(count)
-        })
+        // The monthly loans of this format and age group for the filtered services
+        const data = rollupsModel.sumMonths(
+          loanRollup,
+          filteredServices,
+          values =>
+            values[formatIndex] === format &&
+            values[ageGroupIndex] === contentAgeGroup
+        )
         datasets.push({
           label: contentAgeGroup,
           data,
@@ -216,12 +211,11 @@ const Loans = () => {
         const serviceCode = service?.code
         if (!serviceCode) return null
 
-        const serviceFormatLoans = loans.filter(
-          m => m.serviceCode === serviceCode && m.format === format
-        )
-        const totalLoans = serviceFormatLoans.reduce(
-          (acc, loan) => acc + (loan.countLoans || 0),
-          0
+        const totalLoans = rollupsModel.getAuthorityTotal(
+          loanRollup,
+          serviceCode,
+          'Format',
+          format
         )
         const servicePopulation = service?.totalPopulation || 1
         const loansPerCapita = Math.round(totalLoans / servicePopulation)
@@ -246,7 +240,7 @@ const Loans = () => {
       labels: serviceLabels,
       datasets
     })
-  }, [filteredServices, loans, services])
+  }, [filteredServices, rollups, services])
   return (
     <Box>
       <Typography variant='h4' gutterBottom>
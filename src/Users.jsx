@@ -26,7 +26,7 @@ import Typography from '@mui/material/Typography'
 import { useApplicationState } from './hooks/useApplicationState'
 
 import { getActiveServices } from './models/service'
-import * as usersModel from './models/users'
+import * as rollupsModel from './models/rollups'
 
 import CardGrid from './components/CardGrid'
 import UsersMap from './components/UsersMap'
@@ -86,7 +86,7 @@ const serviceChartOptions = {
 
 const Users = () => {
   const [
-    { filteredServices, services, serviceLookup, users },
+    { filteredServices, services, serviceLookup, rollups },
     dispatchApplication
   ] = useApplicationState()
 
@@ -118,41 +118,38 @@ const Users = () => {
   }, [])
 
   useEffect(() => {
-    const getUsers = async () => {
-      const users = await usersModel.getUsers()
-      dispatchApplication({ type: 'SetUsers', users })
+    const getRollups = async () => {
+      const rollups = await rollupsModel.getRollups()
+      dispatchApplication({ type: 'SetRollups', rollups })
     }
 
-    // Trigger download of users data (if not already done)
-    if (!users) getUsers()
-  }, [services, users, dispatchApplication])
+    // Trigger download of the rollups (if not already done)
+    if (!rollups) getRollups()
+  }, [rollups, dispatchApplication])
 
   useEffect(() => {
-    if (!users || !serviceLookup) return
+    if (!rollups?.users || !serviceLookup) return
+
+    const userRollup = rollups.users
+    const ageGroupIndex = userRollup.dimensions.indexOf('Age group')
 
     const activeServices = getActiveServices(services, filteredServices)
 
-    const yearLabels = [...new Set(users.map(m => m.period))].sort()
+    // The periods of the users rollup are financial years
+    const yearLabels = userRollup.months
     // We have a dataset for each age group
-    const ageGroups = [...new Set(users.map(m => m.ageGroup))].sort()
+    const ageGroups = rollupsModel.getDimensionValues(userRollup, 'Age group')
     ageGroups.push('Non-users') // Add non-users as an age group
     const ageGroupChartDatasets = ageGroups.map((ageGroup, i) => {
+      // The users in that age group in each period, of the filtered services
+      const totals = rollupsModel.sumMonths(
+        userRollup,
+        filteredServices,
+        values => values[ageGroupIndex] === ageGroup
+      )
       // For each age group we need the data for each period
-      const data = yearLabels.map(label => {
-        // For each period we need the total users in that age group
-        let total = 0
-        users.forEach(m => {
-          if (m.period === label && m.ageGroup === ageGroup) {
-            // If we are filtering by service, only include if the service is in the filtered list
-            if (
-              !filteredServices ||
-              filteredServices.length === 0 ||
-              filteredServices.includes(m.serviceCode)
-            ) {
-              total += m.countUsers
-            }
-          }
-        })
+      const data = yearLabels.map((label, index) => {
+        let total = totals[index]
 
         if (ageGroup === 'Non-users') {
           // We need to add in the non-users for this period.
@@ -236,7 +233,7 @@ const Users = () => {
         }
       ]
     })
-  }, [users, services, filteredServices, serviceLookup])
+  }, [rollups, services, filteredServices, serviceLookup])
 
   return (
     <Box>
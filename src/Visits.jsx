@@ -27,7 +27,7 @@ import visitsByServiceMd from './content/visits-by-service.md'
 import { useApplicationState } from './hooks/useApplicationState'
 
 import { getActiveServices } from './models/service'
-import * as visitsModel from './models/visits'
+import * as rollupsModel from './models/rollups'
 
 import CardGrid from './components/CardGrid'
 
@@ -103,7 +103,7 @@ const serviceChartOptions = {
 }
 
 const Visits = () => {
-  const [{ filteredServices, services, visits }, dispatchApplication] =
+  const [{ filteredServices, services, rollups }, dispatchApplication] =
     useApplicationState()
 
   const [visitData, setVisitData] = useState(null)
@@ -127,39 +127,38 @@ const Visits = () => {
   }, [])
 
   useEffect(() => {
-    const getVisits = async () => {
-      const visits = await visitsModel.getVisits()
-      dispatchApplication({ type: 'SetVisits', visits })
+    const getRollups = async () => {
+      const rollups = await rollupsModel.getRollups()
+      dispatchApplication({ type: 'SetRollups', rollups })
     }
 
-    // Trigger download of visit data (if not already done)
-    if (!visits) getVisits()
-  }, [services, visits, dispatchApplication])
+    // Trigger download of the rollups (if not already done)
+    if (!rollups) getRollups()
+  }, [rollups, dispatchApplication])
 
   useEffect(() => {
-    if (!visits) return
+    if (!rollups?.visits || !services) return
 
-    let visitData = {}
+    const visitRollup = rollups.visits
+    const locationIndex = visitRollup.dimensions.indexOf('Location')
 
-    const filteredVisits = filteredServices?.length
-      ? visits.filter(v => filteredServices.includes(v.serviceCode))
-      : visits
+    const locationTypes = rollupsModel.getDimensionValues(
+      visitRollup,
+      'Location'
+    )
 
-    const locationTypes = [...new Set(visits.map(m => m.location))].sort()
+    // The labels are the months in the rollup, already formatted as YYYY-MM
+    const labels = visitRollup.months
 
-    // The labels are the months in the data. The months are already formattted as YYYY-MM
-    const labels = [...new Set(filteredVisits.map(m => m.month))].sort()
-
-    visitData = {
+    const visitData = {
       labels,
-      datasets: locationTypes.map((location, index) => {
+      datasets: locationTypes.map(location => {
         return {
           label: location,
-          data: labels.map(
-            month =>
-              filteredVisits
-                .filter(v => v.location === location && v.month === month)
-                .reduce((sum, v) => sum + (v.countVisits || 0), 0) || 0
+          data: rollupsModel.sumMonths(
+            visitRollup,
+            filteredServices,
+            values => values[locationIndex] === location
           )
         }
       })
@@ -175,13 +174,12 @@ const Visits = () => {
         label: locationType,
         data: serviceLabels.map(serviceLabel => {
           const service = services.find(s => s.niceName === serviceLabel)
-          const visitCount = filteredVisits
-            .filter(v => {
-              return (
-                service.code === v.serviceCode && v.location === locationType
-              )
-            })
-            .reduce((sum, v) => sum + (v.countVisits || 0), 0)
+          const visitCount = rollupsModel.getAuthorityTotal(
+            visitRollup,
+            service.code,
+            'Location',
+            locationType
+          )
 
           const visitsPerCapita = service?.totalPopulation
             ? visitCount / service.totalPopulation
@@ -200,7 +198,7 @@ const Visits = () => {
     })
 
     setServiceChart({ labels: serviceLabels, datasets })
-  }, [visits, filteredServices, services])
+  }, [rollups, filteredServices, services])
 
   return (
     <Box>
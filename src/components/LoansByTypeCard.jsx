@@ -11,6 +11,7 @@ import { Doughnut } from 'react-chartjs-2'
 import { useApplicationState } from '../hooks/useApplicationState'
 
 import { getActiveServices } from '../models/service'
+import { getSelectedRows, loadSelectedDatasets } from '../models/dataset'
 
 import * as loansModel from '../models/loans'
 
@@ -20,24 +21,30 @@ const LoansByTypeCard = () => {
   const [{ filteredServices, services, loans }, dispatchApplication] =
     useApplicationState()
 
+  const [selectedLoans, setSelectedLoans] = useState(null)
   const [loansData, setLoansData] = useState(null)
 
-  useEffect(() => {
-    const getLoans = async () => {
-      const loans = await loansModel.getLoans()
-      dispatchApplication({ type: 'SetLoans', loans })
-    }
-
-    // Trigger download of loans data (if not already done)
-    if (!loans) getLoans()
-  }, [services, loans, dispatchApplication])
+  useEffect(
+    () =>
+      loadSelectedDatasets(filteredServices, [
+        {
+          load: loansModel.getLoans,
+          national: loans,
+          receiveNational: loans =>
+            dispatchApplication({ type: 'SetLoans', loans }),
+          receiveSelected: setSelectedLoans
+        }
+      ]),
+    [filteredServices, loans, dispatchApplication]
+  )
 
   useEffect(() => {
-    if (!loans || !filteredServices || !services) return
+    const rows = getSelectedRows(filteredServices, loans, selectedLoans)
+    if (!rows || !filteredServices || !services) return
 
     const activeServices = getActiveServices(services, filteredServices)
 
-    const filteredLoans = loans.filter(loan =>
+    const filteredLoans = rows.filter(loan =>
       activeServices.includes(loan.serviceCode)
     )
 
@@ -56,7 +63,7 @@ const LoansByTypeCard = () => {
     }
 
     setLoansData(loansData)
-  }, [services, filteredServices, loans])
+  }, [services, filteredServices, loans, selectedLoans])
 
   return (
     <Card variant='outlined' sx={{ height: '100%', flexGrow: 1 }}>
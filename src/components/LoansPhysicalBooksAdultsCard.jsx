@@ -9,28 +9,37 @@ import {
   getServicesAdultPopulation
 } from '../models/service'
 
+import * as rollupsModel from '../models/rollups'
+
 import NumberCard from './NumberCard'
 
 const LoansPhysicalBooksAdultsCard = () => {
-  const [{ filteredServices, services, loans }] = useApplicationState()
+  const [{ filteredServices, services, rollups }] = useApplicationState()
 
   const [loansAdultsCount, setLoansAdultsCount] = useState(0)
   const [loansAdultsPerCapita, setLoansAdultsPerCapita] = useState(0)
   const [noData, setNoData] = useState(false)
 
   useEffect(() => {
-    if (!loans || !services) return
+    if (!rollups?.loans || !services) return
 
     const activeServices = getActiveServices(services, filteredServices)
 
-    const loansAdultPhysicalBooks = loans.filter(
-      l => l.format === 'Physical book' && l.contentAgeGroup === 'Adult'
+    // The physical book loans of each service, by format and content age group,
+    // are totalled from the rollup's cube
+    const loanRollup = rollups.loans
+    const formatIndex = loanRollup.dimensions.indexOf('Format')
+    const ageGroupIndex = loanRollup.dimensions.indexOf('Content age group')
+    const serviceLoans = rollupsModel.getAuthorityTotals(
+      loanRollup,
+      filteredServices,
+      values =>
+        values[formatIndex] === 'Physical book' &&
+        values[ageGroupIndex] === 'Adult'
     )
 
     const loanServices = activeServices?.filter(
-      service =>
-        loansAdultPhysicalBooks.filter(l => l.serviceCode === service.code)
-          .length > 0
+      service => serviceLoans[service.code] > 0
     )
 
     if (!loanServices || loanServices.length === 0) {
@@ -39,13 +48,10 @@ const LoansPhysicalBooksAdultsCard = () => {
       setNoData(false)
     }
 
-    const totalLoans = loansAdultPhysicalBooks
-      .filter(
-        l =>
-          filteredServices.length === 0 ||
-          filteredServices.includes(l.serviceCode)
-      )
-      .reduce((sum, loan) => sum + loan.countLoans, 0)
+    const totalLoans = Object.values(serviceLoans).reduce(
+      (sum, loans) => sum + loans,
+      0
+    )
 
     // The population is the totalPopulation of the active services that are being considered
     const totalPopulation = getServicesAdultPopulation(loanServices)
@@ -55,7 +61,7 @@ const LoansPhysicalBooksAdultsCard = () => {
 
     setLoansAdultsCount(totalLoans)
     setLoansAdultsPerCapita(loansPerCapita)
-  }, [services, filteredServices, loans])
+  }, [services, filteredServices, rollups])
 
   return (
     <NumberCard
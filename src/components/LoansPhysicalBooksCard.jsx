@@ -6,10 +6,12 @@ import { formatCompactNumber } from '../helpers/numbers'
 
 import { getActiveServices, getServicesPopulation } from '../models/service'
 
+import * as rollupsModel from '../models/rollups'
+
 import NumberCard from './NumberCard'
 
 const LoansPhysicalBooksCard = () => {
-  const [{ filteredServices, services, loans }] = useApplicationState()
+  const [{ filteredServices, services, rollups }] = useApplicationState()
 
   const [loansPhysicalBooksCount, setLoansPhysicalBooksCount] = useState(0)
   const [loansPhysicalBooksPerCapita, setLoansPhysicalBooksPerCapita] =
@@ -17,16 +19,22 @@ const LoansPhysicalBooksCard = () => {
   const [noData, setNoData] = useState(false)
 
   useEffect(() => {
-    if (!loans || !services) return
+    if (!rollups?.loans || !services) return
 
     const activeServices = getActiveServices(services, filteredServices)
 
-    const loansPhysicalBooks = loans.filter(l => l.format === 'Physical book')
+    // The physical book loans of each service are totalled in the rollup
+    const loanRollup = rollups.loans
+    const getPhysicalBooks = code =>
+      rollupsModel.getAuthorityTotal(
+        loanRollup,
+        code,
+        'Format',
+        'Physical book'
+      )
 
     const loanServices = activeServices?.filter(
-      service =>
-        loansPhysicalBooks.filter(l => l.serviceCode === service.code).length >
-        0
+      service => getPhysicalBooks(service.code) > 0
     )
 
     if (!loanServices || loanServices.length === 0) {
@@ -35,13 +43,14 @@ const LoansPhysicalBooksCard = () => {
       setNoData(false)
     }
 
-    const totalLoans = loansPhysicalBooks
-      .filter(
-        l =>
-          filteredServices.length === 0 ||
-          filteredServices.includes(l.serviceCode)
-      )
-      .reduce((sum, loan) => sum + loan.countLoans, 0)
+    const loanCodes =
+      filteredServices.length > 0
+        ? filteredServices
+        : Object.keys(loanRollup.by_authority)
+    const totalLoans = loanCodes.reduce(
+      (sum, code) => sum + getPhysicalBooks(code),
+      0
+    )
 
     // The population is the totalPopulation of the active services that are being considered
     const totalPopulation = getServicesPopulation(loanServices)
@@ -51,7 +60,7 @@ const LoansPhysicalBooksCard = () => {
 
     setLoansPhysicalBooksCount(totalLoans)
     setLoansPhysicalBooksPerCapita(loansPerCapita)
-  }, [services, filteredServices, loans])
+  }, [services, filteredServices, rollups])
 
   return (
     <NumberCard
@@ -9,30 +9,38 @@ import {
   getServicesChildPopulation
 } from '../models/service'
 
+import * as rollupsModel from '../models/rollups'
+
 import NumberCard from './NumberCard'
 
 const LoansPhysicalBooksChildrenCard = () => {
-  const [{ filteredServices, services, loans }] = useApplicationState()
+  const [{ filteredServices, services, rollups }] = useApplicationState()
 
   const [loansChildrenCount, setLoansChildrenCount] = useState(0)
   const [loansChildrenPerCapita, setLoansChildrenPerCapita] = useState(0)
   const [noData, setNoData] = useState(false)
 
   useEffect(() => {
-    if (!loans || !services) return
+    if (!rollups?.loans || !services) return
 
     const activeServices = getActiveServices(services, filteredServices)
 
-    const loansChildrenPhysicalBooks = loans.filter(
-      l =>
-        l.format === 'Physical book' &&
-        (l.contentAgeGroup === '12-17' || l.contentAgeGroup === 'Under 12')
+    // The physical book loans of each service, by format and content age group,
+    // are totalled from the rollup's cube
+    const loanRollup = rollups.loans
+    const formatIndex = loanRollup.dimensions.indexOf('Format')
+    const ageGroupIndex = loanRollup.dimensions.indexOf('Content age group')
+    const serviceLoans = rollupsModel.getAuthorityTotals(
+      loanRollup,
+      filteredServices,
+      values =>
+        values[formatIndex] === 'Physical book' &&
+        (values[ageGroupIndex] === '12-17' ||
+          values[ageGroupIndex] === 'Under 12')
     )
 
     const loanServices = activeServices?.filter(
-      service =>
-        loansChildrenPhysicalBooks.filter(l => l.serviceCode === service.code)
-          .length > 0
+      service => serviceLoans[service.code] > 0
     )
 
     if (!loanServices || loanServices.length === 0) {
@@ -41,13 +49,10 @@ const LoansPhysicalBooksChildrenCard = () => {
       setNoData(false)
     }
 
-    const totalLoans = loansChildrenPhysicalBooks
-      .filter(
-        l =>
-          filteredServices.length === 0 ||
-          filteredServices.includes(l.serviceCode)
-      )
-      .reduce((sum, loan) => sum + loan.countLoans, 0)
+    const totalLoans = Object.values(serviceLoans).reduce(
+      (sum, loans) => sum + loans,
+      0
+    )
 
     // The population is the totalPopulation of the active services that are being considered
     const totalPopulation = getServicesChildPopulation(loanServices)
@@ -57,7 +62,7 @@ const LoansPhysicalBooksChildrenCard = () => {
 
     setLoansChildrenCount(totalLoans)
     setLoansChildrenPerCapita(loansPerCapita)
-  }, [services, filteredServices, loans])
+  }, [services, filteredServices, rollups])
 
   return (
     <NumberCard
@@ -9,25 +9,33 @@ import {
   getServicesAdultPopulation
 } from '../models/service'
 
+import * as rollupsModel from '../models/rollups'
+
 import NumberCard from './NumberCard'
 
 const UsersAdultCard = () => {
-  const [{ filteredServices, services, users }] = useApplicationState()
+  const [{ filteredServices, services, rollups }] = useApplicationState()
 
   const [usersCount, setUsersCount] = useState(0)
   const [percentageUsers, setPercentageUsers] = useState(0)
   const [noData, setNoData] = useState(false)
 
   useEffect(() => {
-    if (!users || !services) return
+    if (!rollups?.users || !services) return
 
     const activeServices = getActiveServices(services, filteredServices)
 
+    // The users of each service in the age group, from the rollup's cube
+    const userRollup = rollups.users
+    const ageGroupIndex = userRollup.dimensions.indexOf('Age group')
+    const serviceUsers = rollupsModel.getAuthorityTotals(
+      userRollup,
+      filteredServices,
+      values => values[ageGroupIndex] === 'Adult'
+    )
+
     const adultUserServices = activeServices?.filter(
-      service =>
-        users.filter(
-          u => u.ageGroup === 'Adult' && u.serviceCode === service.code
-        ).length > 0
+      service => serviceUsers[service.code] > 0
     )
 
     if (!adultUserServices || adultUserServices.length === 0) {
@@ -36,14 +44,10 @@ const UsersAdultCard = () => {
       setNoData(false)
     }
 
-    const totalAdultUsers = users
-      .filter(
-        u =>
-          u.ageGroup === 'Adult' &&
-          (filteredServices.length === 0 ||
-            filteredServices.includes(u.serviceCode))
-      )
-      .reduce((sum, user) => sum + user.countUsers, 0)
+    const totalAdultUsers = Object.values(serviceUsers).reduce(
+      (sum, users) => sum + users,
+      0
+    )
 
     const totalAdultPopulation =
       getServicesAdultPopulation(adultUserServices) || 0
@@ -55,7 +59,7 @@ const UsersAdultCard = () => {
 
     setUsersCount(totalAdultUsers)
     setPercentageUsers(percentageUsers)
-  }, [services, filteredServices, users])
+  }, [services, filteredServices, rollups])
 
   return (
     <NumberCard
@@ -9,25 +9,33 @@ import {
   getServicesJuniorPopulation
 } from '../models/service'
 
+import * as rollupsModel from '../models/rollups'
+
 import NumberCard from './NumberCard'
 
 const UsersJuniorCard = () => {
-  const [{ filteredServices, services, users }] = useApplicationState()
+  const [{ filteredServices, services, rollups }] = useApplicationState()
 
   const [usersCount, setUsersCount] = useState(0)
   const [percentageUsers, setPercentageUsers] = useState(0)
   const [noData, setNoData] = useState(false)
 
   useEffect(() => {
-    if (!users || !services) return
+    if (!rollups?.users || !services) return
 
     const activeServices = getActiveServices(services, filteredServices)
 
+    // The users of each service in the age group, from the rollup's cube
+    const userRollup = rollups.users
+    const ageGroupIndex = userRollup.dimensions.indexOf('Age group')
+    const serviceUsers = rollupsModel.getAuthorityTotals(
+      userRollup,
+      filteredServices,
+      values => values[ageGroupIndex] === '12-17'
+    )
+
     const juniorUserServices = activeServices?.filter(
-      service =>
-        users.filter(
-          u => u.ageGroup === '12-17' && u.serviceCode === service.code
-        ).length > 0
+      service => serviceUsers[service.code] > 0
     )
 
     if (!juniorUserServices || juniorUserServices.length === 0) {
@@ -36,14 +44,10 @@ const UsersJuniorCard = () => {
       setNoData(false)
     }
 
-    const totalJuniorUsers = users
-      .filter(
-        u =>
-          u.ageGroup === '12-17' &&
-          (filteredServices.length === 0 ||
-            filteredServices.includes(u.serviceCode))
-      )
-      .reduce((sum, user) => sum + user.countUsers, 0)
+    const totalJuniorUsers = Object.values(serviceUsers).reduce(
+      (sum, users) => sum + users,
+      0
+    )
 
     const totalJuniorPopulation =
       getServicesJuniorPopulation(juniorUserServices) || 0
@@ -55,7 +59,7 @@ const UsersJuniorCard = () => {
 
     setUsersCount(totalJuniorUsers)
     setPercentageUsers(percentageUsers)
-  }, [services, filteredServices, users])
+  }, [services, filteredServices, rollups])
 
   return (
     <NumberCard
@@ -11,6 +11,7 @@ import Map, { FullscreenControl, Layer, Source } from 'react-map-gl/maplibre'
 import { useApplicationState } from '../hooks/useApplicationState'
 
 import { getActiveServices } from '../models/service'
+import { getSelectedRows, loadSelectedDatasets } from '../models/dataset'
 import { getUsersPopulationPercentages } from '../models/users'
 
 import * as usersModel from '../models/users'
@@ -24,6 +25,7 @@ const UsersMap = () => {
     dispatchApplication
   ] = useApplicationState()
 
+  const [selectedUsers, setSelectedUsers] = useState(null)
   const [displayAgeGroup, setDisplayAgeGroup] = useState('total')
 
   const [opacityExpression, setOpacityExpression] = useState([])
@@ -38,16 +40,23 @@ const UsersMap = () => {
   const libraryAuthorityTiles =
     'https://api-geography.librarydata.uk/rest/libraryauthorities/{z}/{x}/{y}.mvt'
 
-  useEffect(() => {
-    const getUsers = async () => {
-      const users = await usersModel.getUsers()
-      dispatchApplication({ type: 'SetUsers', users })
-    }
-    if (!users) getUsers()
-  }, [users, dispatchApplication])
+  useEffect(
+    () =>
+      loadSelectedDatasets(filteredServices, [
+        {
+          load: usersModel.getUsers,
+          national: users,
+          receiveNational: users =>
+            dispatchApplication({ type: 'SetUsers', users }),
+          receiveSelected: setSelectedUsers
+        }
+      ]),
+    [filteredServices, users, dispatchApplication]
+  )
 
   useEffect(() => {
-    if (!users || !services) return
+    const rows = getSelectedRows(filteredServices, users, selectedUsers)
+    if (!rows || !services) return
 
     const activeServices = getActiveServices(services, filteredServices)
 
@@ -59,7 +68,7 @@ const UsersMap = () => {
 
     const populationPercentages = getUsersPopulationPercentages(
       userServices,
-      users
+      rows
     )
 
     // Calculate the maximum percentage across all the services to create a scale
@@ -180,7 +189,15 @@ const UsersMap = () => {
 
     setServicesWithDataFilter(servicesFilter)
     setServicesNoDataFilter(servicesWithNoDataFilter)
-  }, [services, filteredServices, map, users, displayAgeGroup, mapLoaded])
+  }, [
+    services,
+    filteredServices,
+    map,
+    users,
+    selectedUsers,
+    displayAgeGroup,
+    mapLoaded
+  ])
 
   const setViewState = viewState => {
     dispatchApplication({
@@ -9,25 +9,33 @@ import {
   getServicesUnder12Population
 } from '../models/service'
 
+import * as rollupsModel from '../models/rollups'
+
 import NumberCard from './NumberCard'
 
 const UsersUnder12Card = () => {
-  const [{ filteredServices, services, users }] = useApplicationState()
+  const [{ filteredServices, services, rollups }] = useApplicationState()
 
   const [usersCount, setUsersCount] = useState(0)
   const [percentageUsers, setPercentageUsers] = useState(0)
   const [noData, setNoData] = useState(false)
 
   useEffect(() => {
-    if (!users || !services) return
+    if (!rollups?.users || !services) return
 
     const activeServices = getActiveServices(services, filteredServices)
 
+    // The users of each service in the age group, from the rollup's cube
+    const userRollup = rollups.users
+    const ageGroupIndex = userRollup.dimensions.indexOf('Age group')
+    const serviceUsers = rollupsModel.getAuthorityTotals(
+      userRollup,
+      filteredServices,
+      values => values[ageGroupIndex] === 'Under 12'
+    )
+
     const under12UserServices = activeServices?.filter(
-      service =>
-        users.filter(
-          u => u.ageGroup === 'Under 12' && u.serviceCode === service.code
-        ).length > 0
+      service => serviceUsers[service.code] > 0
     )
 
     if (!under12UserServices || under12UserServices.length === 0) {
@@ -36,14 +44,10 @@ const UsersUnder12Card = () => {
       setNoData(false)
     }
 
-    const totalUnder12Users = users
-      .filter(
-        u =>
-          u.ageGroup === 'Under 12' &&
-          (filteredServices.length === 0 ||
-            filteredServices.includes(u.serviceCode))
-      )
-      .reduce((sum, user) => sum + user.countUsers, 0)
+    const totalUnder12Users = Object.values(serviceUsers).reduce(
+      (sum, users) => sum + users,
+      0
+    )
 
     const totalUnder12Population =
       getServicesUnder12Population(under12UserServices) || 0
@@ -55,7 +59,7 @@ const UsersUnder12Card = () => {
 
     setUsersCount(totalUnder12Users)
     setPercentageUsers(percentageUsers)
-  }, [services, filteredServices, users])
+  }, [services, filteredServices, rollups])
 
   return (
     <NumberCard
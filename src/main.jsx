@@ -9,6 +9,17 @@ import '@fontsource/roboto/700.css'
 import App from './App.jsx'
 
 import { ApplicationStateProvider } from './providers/applicationStateProvider'
+import { setDatasetWorker } from './models/dataset'
+
+// The datasets are parsed in a worker, created here as the worker imports the models
+if (typeof Worker !== 'undefined') {
+  setDatasetWorker(
+    () =>
+      new Worker(new URL('./models/datasetWorker.js', import.meta.url), {
+        type: 'module'
+      })
+  )
+}
 
 createRoot(document.getElementById('root')).render(
   <StrictMode>
@@ -1,4 +1,4 @@
-import axios from 'axios'
+import { getDatasetObjects } from './dataset'
 
 export class Attendance {
   constructor (obj) {
@@ -16,11 +16,6 @@ export class Attendance {
   }
 }
 
-export async function getAttendance () {
-  const response = await axios.get('./attendance.json')
-  if (response && response.data && response.data.length > 0) {
-    return response.data.map(a => new Attendance().fromJson(a))
-  } else {
-    return []
-  }
+export async function getAttendance (serviceCodes = []) {
+  return getDatasetObjects('attendance', Attendance, serviceCodes)
 }
@@ -0,0 +1,47 @@
+import { getDataset, getDatasetObjects } from './dataset'
+
+export class Comparison {
+  constructor (obj) {
+    Object.assign(this, obj)
+  }
+
+  fromJson (json) {
+    this.serviceCode = json[0]
+    this.measure = json[1]
+    this.ageGroup = json[2]
+    this.count = json[3]
+    this.population = json[4]
+    // Rates are per 1,000 of the population of the age group
+    this.rate = json[5]
+    this.neighbourMedian = json[6]
+    this.neighbourMean = json[7]
+    // The rank among the service and its nearest neighbours, highest rate first
+    this.rank = json[8]
+    this.groupSize = json[9]
+
+    return this
+  }
+}
+
+export async function getComparisons () {
+  return getDatasetObjects('comparisons', Comparison)
+}
+
+// The services that list each service as one of their nearest neighbours
+export async function getNeighbourIndex () {
+  const index = await getDataset('neighbour_index')
+  return index && typeof index === 'object' ? index : {}
+}
+
+export const getComparison = (
+  comparisons,
+  serviceCode,
+  measure,
+  ageGroup = 'Total'
+) =>
+  comparisons.find(
+    c =>
+      c.serviceCode === serviceCode &&
+      c.measure === measure &&
+      c.ageGroup === ageGroup
+  )
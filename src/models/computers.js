@@ -1,4 +1,4 @@
-import axios from 'axios'
+import { getDatasetObjects } from './dataset'
 
 export class Computers {
   constructor (obj) {
@@ -14,11 +14,6 @@ export class Computers {
   }
 }
 
-export async function getComputers () {
-  const response = await axios.get('./computers.json')
-  if (response && response.data && response.data.length > 0) {
-    return response.data.map(a => new Computers().fromJson(a))
-  } else {
-    return []
-  }
+export async function getComputers (serviceCodes = []) {
+  return getDatasetObjects('computers', Computers, serviceCodes)
 }
@@ -0,0 +1,286 @@
+import axios from 'axios'
+
+// The manifest gives the hash of each dataset's content, and the file to fetch
+// it from, a content hashed copy that can be cached forever once it has been
+// published. Without a manifest datasets are fetched from their fixed names.
+const manifestUrl = './datasets.json'
+let manifest = null
+
+const getManifest = () => {
+  if (!manifest) {
+    manifest = axios
+      .get(manifestUrl)
+      .then(response =>
+        response && typeof response.data === 'object' ? response.data : {}
+      )
+      .catch(() => ({}))
+  }
+  return manifest
+}
+
+export const getDatasetUrl = async name => {
+  const datasets = await getManifest()
+  return datasets[name] ? `./${datasets[name].file}` : `./${name}.json`
+}
+
+// The version of a dataset is the hash of its content, or null without one
+const getDatasetVersion = async name => {
+  const datasets = await getManifest()
+  return datasets[name]?.sha256 || null
+}
+
+// Datasets are published either as an array of row arrays, or in a columnar
+// format with one array per field and categorical fields dictionary encoded:
+// { fields: [...], dictionaries: { field: [values] }, length, columns: [[...]] }
+export const decodeRows = data => {
+  if (Array.isArray(data)) return data
+  if (!data || !data.columns) return []
+
+  const { fields, dictionaries, columns, length } = data
+  const decoders = fields.map((field, i) => {
+    const column = columns[i]
+    const dictionary = dictionaries[field]
+    return dictionary ? r => dictionary[column[r]] : r => column[r]
+  })
+
+  const rows = new Array(length)
+  for (let r = 0; r < length; r++) {
+    rows[r] = decoders.map(decode => decode(r))
+  }
+  return rows
+}
+
+// Each dataset is also published as one partition per financial year, named by
+// its content hash so it can be cached forever. The index lists the partitions.
+const partitionIndexUrl = './partitions.json'
+let partitionIndex = null
+const partitionRows = {}
+
+const getPartitionIndex = () => {
+  if (!partitionIndex) {
+    partitionIndex = axios
+      .get(partitionIndexUrl)
+      .then(response =>
+        response && typeof response.data === 'object' ? response.data : {}
+      )
+      .catch(() => ({}))
+  }
+  return partitionIndex
+}
+
+// The financial years that a dataset has been published for, oldest first
+export const getDatasetYears = async name => {
+  const index = await getPartitionIndex()
+  return Object.keys(index[name] || {}).sort()
+}
+
+const getPartitionRows = file => {
+  if (!partitionRows[file]) {
+    partitionRows[file] = axios
+      .get(`./${file}`)
+      .then(response => decodeRows(response?.data))
+      .catch(error => {
+        delete partitionRows[file]
+        throw error
+      })
+  }
+  return partitionRows[file]
+}
+
+export const getDataset = async name => {
+  const response = await axios.get(await getDatasetUrl(name))
+  return response?.data
+}
+
+// Each authority's rows of every dataset are also published as a shard, so a
+// selection of services only needs their shards. The summary lists the shards
+// with a hash of their content, which is added to the URL to refresh the cache.
+const shardCacheSize = 32
+const shards = new Map()
+let summary = null
+const nationalRows = {}
+
+const getSummary = () => {
+  if (!summary) {
+    summary = getDataset('summary')
+      .then(data => (data && typeof data === 'object' ? data : {}))
+      .catch(() => ({}))
+  }
+  return summary
+}
+
+// Shards are kept in a least recently used cache, ordered from least to most
+// recently used, so selecting a service again does not fetch it again
+const getShard = code => {
+  let shard = shards.get(code)
+  if (shard) {
+    shards.delete(code)
+  } else {
+    shard = getSummary()
+      .then(summary => {
+        const authority = summary.authorities?.[code]
+        if (!authority) return {}
+        return axios
+          .get(`./authorities/${code}.json?v=${authority.hash}`)
+          .then(response => response?.data || {})
+      })
+      .catch(() => {
+        shards.delete(code)
+        return {}
+      })
+  }
+  shards.set(code, shard)
+  if (shards.size > shardCacheSize) shards.delete(shards.keys().next().value)
+  return shard
+}
+
+// The rows of a dataset for the given services, from their shards, or for all
+// services from the national dataset. Given financial years, such as 2023/2024,
+// the rows of all services are instead those of the years' partitions.
+export const getDatasetRows = async (
+  name,
+  serviceCodes = [],
+  years = null
+) => {
+  if (serviceCodes.length > 0) {
+    const authorityShards = await Promise.all(serviceCodes.map(getShard))
+    return authorityShards.flatMap(shard => decodeRows(shard[name]))
+  }
+  if (years) {
+    const partitions = (await getPartitionIndex())[name] || {}
+    const files = years
+      .filter(year => partitions[year])
+      .map(year => partitions[year].file)
+    const yearRows = await Promise.all(files.map(getPartitionRows))
+    return yearRows.flat()
+  }
+  if (!nationalRows[name]) {
+    nationalRows[name] = getDataset(name)
+      .then(decodeRows)
+      .catch(error => {
+        delete nationalRows[name]
+        throw error
+      })
+  }
+  return nationalRows[name]
+}
+
+// Loads datasets for the selected services. The rows of all services are kept in
+// the application state once loaded, and the rows of a selection apart from them,
+// so clearing the selection shows the rows of all services without reloading.
+// Each loader is { load, national, receiveNational, receiveSelected }: a function
+// that gets the dataset for service codes, the rows of all services if loaded,
+// and functions that receive the rows of all services and of the selection.
+// Returns a function that stops receiving, for an effect to clean up with, so that
+// data downloaded for a selection that has since changed is ignored.
+export const loadSelectedDatasets = (serviceCodes, loaders) => {
+  let current = true
+  const selected = serviceCodes.length > 0
+  loaders.forEach(({ load, national, receiveNational, receiveSelected }) => {
+    // Until the selection's rows arrive, those of all services are shown
+    receiveSelected(null)
+    if (!selected && national) return
+    load(serviceCodes).then(data => {
+      if (current) (selected ? receiveSelected : receiveNational)(data)
+    })
+  })
+  return () => {
+    current = false
+  }
+}
+
+// The rows of a dataset to show for the selected services: the selection's rows
+// once loaded, or else the rows of all services, which callers filter
+export const getSelectedRows = (serviceCodes, national, selected) =>
+  serviceCodes.length > 0 && selected ? selected : national
+
+// The datasets of all services are parsed and hydrated in a worker, which keeps
+// them by version in IndexedDB. The worker is created by the application, as it
+// imports the models itself, and without one datasets are hydrated here.
+let createWorker = null
+let datasetWorker = null
+const workerRequests = new Map()
+const workerObjects = {}
+let nextRequestId = 0
+
+export const setDatasetWorker = factory => {
+  createWorker = factory
+}
+
+const rejectWorkerRequests = error => {
+  workerRequests.forEach(request => request.reject(error))
+  workerRequests.clear()
+}
+
+const getWorker = () => {
+  if (datasetWorker === null && createWorker) {
+    try {
+      datasetWorker = createWorker()
+    } catch {
+      datasetWorker = false
+      return null
+    }
+    datasetWorker.onmessage = ({ data }) => {
+      const request = workerRequests.get(data.id)
+      workerRequests.delete(data.id)
+      if (data.error) request?.reject(new Error(data.error))
+      else request?.resolve(data.objects)
+    }
+    // If the worker cannot run, datasets are hydrated on the main thread
+    datasetWorker.onerror = () => {
+      datasetWorker.terminate()
+      datasetWorker = false
+      rejectWorkerRequests(new Error('The dataset worker stopped'))
+    }
+  }
+  return datasetWorker || null
+}
+
+const getWorkerObjects = name => {
+  const worker = getWorker()
+  if (!worker) return Promise.resolve(null)
+  if (!workerObjects[name]) {
+    workerObjects[name] = Promise.all([
+      getDatasetUrl(name),
+      getDatasetVersion(name)
+    ])
+      .then(([url, version]) => {
+        // Without a version the objects could not be kept, so this is an error
+        // rather than a reason to hydrate them again on every visit
+        if (!version) {
+          throw new Error(`The manifest has no version of the ${name} dataset`)
+        }
+        return new Promise((resolve, reject) => {
+          const id = nextRequestId++
+          workerRequests.set(id, { resolve, reject })
+          // The worker resolves URLs against its script, so they are absolute
+          worker.postMessage({
+            id,
+            name,
+            url: new URL(url, document.baseURI).href,
+            version
+          })
+        })
+      })
+      .catch(error => {
+        delete workerObjects[name]
+        throw error
+      })
+  }
+  return workerObjects[name]
+}
+
+// The rows of a dataset as instances of its model, for the given services or
+// for all services. Each call returns new instances, so callers may change them.
+export const getDatasetObjects = async (name, Model, serviceCodes = []) => {
+  if (serviceCodes.length === 0) {
+    // If the worker fails the dataset is hydrated here, reporting why
+    const objects = await getWorkerObjects(name).catch(error => {
+      console.error(error)
+      return null
+    })
+    if (objects) return objects.map(obj => new Model(obj))
+  }
+  const rows = await getDatasetRows(name, serviceCodes)
+  return rows.map(row => new Model().fromJson(row))
+}
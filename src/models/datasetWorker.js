@@ -0,0 +1,101 @@
+import { decodeRows } from './dataset'
+import { Attendance } from './attendance'
+import { Comparison } from './comparisons'
+import { Computers } from './computers'
+import { Events } from './events'
+import { Loans } from './loans'
+import { Service } from './service'
+import { Users } from './users'
+import { Visits } from './visits'
+import { WiFi } from './wifi'
+
+// Parses and hydrates the datasets of all services off the main thread. The
+// hydrated objects are kept in IndexedDB with the version of the dataset they
+// came from, so a return visit neither downloads nor parses them again.
+const models = {
+  attendance: Attendance,
+  comparisons: Comparison,
+  computers: Computers,
+  events: Events,
+  loans: Loans,
+  services: Service,
+  users: Users,
+  visits: Visits,
+  wifi: WiFi
+}
+
+const databaseName = 'library-activity-datasets'
+const storeName = 'datasets'
+let database = null
+
+// IndexedDB may not be available, such as in some private windows, in which
+// case datasets are simply not kept
+const getDatabase = () => {
+  if (!database) {
+    database =
+      typeof indexedDB === 'undefined'
+        ? Promise.resolve(null)
+        : new Promise((resolve, reject) => {
+          const request = indexedDB.open(databaseName, 1)
+          request.onupgradeneeded = () =>
+            request.result.createObjectStore(storeName)
+          request.onsuccess = () => resolve(request.result)
+          request.onerror = () => reject(request.error)
+        }).catch(() => null)
+  }
+  return database
+}
+
+// Each dataset is kept once, under its name, so a new version replaces the old
+const readStored = async (name, version) => {
+  const db = await getDatabase()
+  if (!db) return null
+  return new Promise(resolve => {
+    const request = db.transaction(storeName).objectStore(storeName).get(name)
+    request.onsuccess = () =>
+      resolve(
+        request.result?.version === version ? request.result.objects : null
+      )
+    request.onerror = () => resolve(null)
+  })
+}
+
+const writeStored = async (name, version, objects) => {
+  const db = await getDatabase()
+  if (!db) return
+  return new Promise(resolve => {
+    const transaction = db.transaction(storeName, 'readwrite')
+    transaction.objectStore(storeName).put({ version, objects }, name)
+    transaction.oncomplete = () => resolve()
+    transaction.onerror = () => resolve()
+    transaction.onabort = () => resolve()
+  })
+}
+
+const hydrate = async (name, url, version) => {
+  const Model = models[name]
+  if (!Model) throw new Error(`There is no model of the ${name} dataset`)
+
+  if (!version) throw new Error(`There is no version of the ${name} dataset`)
+  const stored = await readStored(name, version)
+  if (stored) return stored
+
+  const response = await fetch(url)
+  if (!response.ok) {
+    throw new Error(`Could not fetch ${url}: ${response.status}`)
+  }
+  const objects = decodeRows(await response.json()).map(row =>
+    new Model().fromJson(row)
+  )
+  await writeStored(name, version, objects)
+  return objects
+}
+
+self.onmessage = async ({ data }) => {
+  const { id, name, url, version } = data
+  try {
+    self.postMessage({ id, objects: await hydrate(name, url, version) })
+  } catch (error) {
+    self.postMessage({ id, error: error.message })
+  }
+}
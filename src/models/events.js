@@ -1,4 +1,4 @@
-import axios from 'axios'
+import { getDatasetObjects } from './dataset'
 
 export class Events {
   constructor (obj) {
@@ -16,11 +16,6 @@ export class Events {
   }
 }
 
-export async function getEvents () {
-  const response = await axios.get('./events.json')
-  if (response && response.data && response.data.length > 0) {
-    return response.data.map(e => new Events().fromJson(e))
-  } else {
-    return []
-  }
+export async function getEvents (serviceCodes = []) {
+  return getDatasetObjects('events', Events, serviceCodes)
 }
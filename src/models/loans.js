@@ -1,4 +1,4 @@
-import axios from 'axios'
+import { getDatasetObjects } from './dataset'
 
 export class Loans {
   constructor (obj) {
@@ -16,11 +16,6 @@ export class Loans {
   }
 }
 
-export async function getLoans () {
-  const response = await axios.get('./loans.json')
-  if (response && response.data && response.data.length > 0) {
-    return response.data.map(l => new Loans().fromJson(l))
-  } else {
-    return []
-  }
+export async function getLoans (serviceCodes = []) {
+  return getDatasetObjects('loans', Loans, serviceCodes)
 }
@@ -0,0 +1,86 @@
+import { getDataset } from './dataset'
+
+// Rollups are totals of each measure precomputed by the data build, so charts
+// can be drawn without downloading and scanning the full datasets.
+// { measure: { dimensions, months, combinations, total, by_month, by_dimension,
+//   by_authority: { code: { total, dimension: { value: total } } },
+//   cube: { code: { 'value|value': [monthly totals] } } } }
+export async function getRollups () {
+  const rollups = await getDataset('rollups')
+  if (rollups && typeof rollups === 'object' && !Array.isArray(rollups)) {
+    return rollups
+  } else {
+    return {}
+  }
+}
+
+// The distinct values of a dimension in the combinations that match a filter
+export const getDimensionValues = (rollup, dimension, matches = () => true) => {
+  const index = rollup.dimensions.indexOf(dimension)
+  return [
+    ...new Set(
+      rollup.combinations.filter(matches).map(values => values[index])
+    )
+  ].sort()
+}
+
+// Sums the monthly totals of the combinations that match a filter, for the
+// given services or for all services when there are none
+export const sumMonths = (rollup, serviceCodes, matches = () => true) => {
+  const totals = rollup.months.map(() => 0)
+  const codes =
+    serviceCodes?.length > 0 ? serviceCodes : Object.keys(rollup.cube)
+  codes.forEach(code => {
+    const combinations = rollup.cube[code]
+    if (!combinations) return
+    Object.entries(combinations).forEach(([combination, months]) => {
+      if (!matches(combination.split('|'))) return
+      months.forEach((count, i) => {
+        totals[i] += count
+      })
+    })
+  })
+  return totals
+}
+
+// The monthly totals as summed by sumMonths, for the given months, which may
+// include months that are not in the rollup
+export const sumMonthsFor = (rollup, months, serviceCodes, matches) => {
+  const totals = sumMonths(rollup, serviceCodes, matches)
+  return months.map(month => totals[rollup.months.indexOf(month)] || 0)
+}
+
+// The months of any of the rollups, in order
+export const getMonths = (...rollups) =>
+  [...new Set(rollups.flatMap(rollup => rollup.months))].sort()
+
+// The total of a measure for a service
+export const getServiceTotal = (rollup, serviceCode) =>
+  rollup.by_authority[serviceCode]?.total || 0
+
+// The total of a measure for a service and a value of one dimension
+export const getAuthorityTotal = (rollup, serviceCode, dimension, value) =>
+  rollup.by_authority[serviceCode]?.[dimension]?.[value] || 0
+
+// The totals of the combinations that match a filter for each of the given
+// services, or for all services when there are none. Services without any
+// matching combination are left out.
+export const getAuthorityTotals = (
+  rollup,
+  serviceCodes,
+  matches = () => true
+) => {
+  const totals = {}
+  const codes =
+    serviceCodes?.length > 0 ? serviceCodes : Object.keys(rollup.cube)
+  codes.forEach(code => {
+    const combinations = rollup.cube[code]
+    if (!combinations) return
+    Object.entries(combinations).forEach(([combination, months]) => {
+      if (!matches(combination.split('|'))) return
+      totals[code] =
+        (totals[code] || 0) + months.reduce((sum, count) => sum + count, 0)
+    })
+  })
+  return totals
+}
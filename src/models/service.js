@@ -1,4 +1,4 @@
-import axios from 'axios'
+import { getDatasetObjects } from './dataset'
 
 export class Service {
   constructor (obj) {
@@ -30,12 +30,7 @@ export class Service {
 }
 
 export async function getServices () {
-  const response = await axios.get('./services.json')
-  if (response && response.data && response.data.length > 0) {
-    return response.data.map(s => new Service().fromJson(s))
-  } else {
-    return []
-  }
+  return getDatasetObjects('services', Service)
 }
 
 export const getActiveServices = (services, filteredServices) => {
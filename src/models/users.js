@@ -1,4 +1,4 @@
-import axios from 'axios'
+import { getDatasetObjects } from './dataset'
 
 export class Users {
   constructor (obj) {
@@ -15,13 +15,8 @@ export class Users {
   }
 }
 
-export async function getUsers () {
-  const response = await axios.get('./users.json')
-  if (response && response.data && response.data.length > 0) {
-    return response.data.map(m => new Users().fromJson(m))
-  } else {
-    return []
-  }
+export async function getUsers (serviceCodes = []) {
+  return getDatasetObjects('users', Users, serviceCodes)
 }
 
 export function getUsersPopulationPercentages (services, users) {
@@ -1,4 +1,4 @@
-import axios from 'axios'
+import { getDatasetObjects } from './dataset'
 
 export class Visits {
   constructor (obj) {
@@ -15,11 +15,6 @@ export class Visits {
   }
 }
 
-export async function getVisits () {
-  const response = await axios.get('./visits.json')
-  if (response && response.data && response.data.length > 0) {
-    return response.data.map(v => new Visits().fromJson(v))
-  } else {
-    return []
-  }
+export async function getVisits (serviceCodes = []) {
+  return getDatasetObjects('visits', Visits, serviceCodes)
 }
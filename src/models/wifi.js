@@ -1,4 +1,4 @@
-import axios from 'axios'
+import { getDatasetObjects } from './dataset'
 
 export class WiFi {
   constructor (obj) {
@@ -14,11 +14,6 @@ export class WiFi {
   }
 }
 
-export async function getWiFi () {
-  const response = await axios.get('./wifi.json')
-  if (response && response.data && response.data.length > 0) {
-    return response.data.map(a => new WiFi().fromJson(a))
-  } else {
-    return []
-  }
+export async function getWiFi (serviceCodes = []) {
+  return getDatasetObjects('wifi', WiFi, serviceCodes)
 }
@@ -13,6 +13,7 @@ const initialApplicationState = {
   users: null,
   visits: null,
   wifiSessions: null,
+  rollups: null,
   mapZoom: 7,
   mapPosition: [-1.155414, 52.691432]
 }
@@ -65,6 +66,11 @@ const applicationReducer = (state, action) => {
         ...state,
         wifi: action.wifi
       }
+    case 'SetRollups':
+      return {
+        ...state,
+        rollups: action.rollups
+      }
     case 'SetMapPosition':
       return {
         ...state,